@@ -0,0 +1,318 @@
+"""
+Offline batch analysis of a local directory or an S3/MinIO prefix
+
+Images are listed in lexicographic key order, fetched and decoded by a
+thread pool a few batches ahead, analyzed in batches with the same
+pipeline as the API (result cache, vector store, object storage,
+background Neo4j writer with UNWIND bulk writes, logs) and written to
+JSON Lines or Parquet.
+
+Progress is checkpointed every --checkpoint-every batches: output written
+so far, queued uploads and Neo4j rows flushed, and the last key
+processed. An interrupted run started again with the same arguments
+resumes after that key; output written after the last checkpoint is
+discarded so no row appears twice.
+
+Usage:
+  python -m app.batch SOURCE --output results.jsonl [--format jsonl|parquet]
+      [--batch-size 16] [--decode-threads 8] [--checkpoint-every 20]
+      [--checkpoint PATH] [--limit N] [--report-every 10]
+
+SOURCE is a directory (walked recursively) or s3://bucket/prefix; the S3
+endpoint and credentials come from S3_ENDPOINT_URL, S3_ACCESS_KEY and
+S3_SECRET_KEY. Parquet output is a directory of part files, one per
+checkpoint.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from app.pipeline.preprocess import prepare_image
+from app.utils.archives import is_image_name
+from app.utils.serialization import dumps
+
+BATCH_MAX_IMAGE_SIZE = int(os.getenv("BATCH_MAX_IMAGE_SIZE", str(50 * 1024 * 1024)))
+
+
+class LocalSource:
+    def __init__(self, root):
+        self.root = root
+
+    def keys(self, after=None):
+        keys = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if is_image_name(name):
+                    keys.append(os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, "/"))
+        keys.sort()
+        return [key for key in keys if after is None or key > after]
+
+    def read(self, key):
+        with open(os.path.join(self.root, key), "rb") as f:
+            return f.read(BATCH_MAX_IMAGE_SIZE + 1)
+
+
+class S3Source:
+    def __init__(self, url, threads):
+        from app.storage.object_store import create_s3_client, parse_s3_url
+
+        self.bucket, self.prefix = parse_s3_url(url)
+        # One pooled client shared by every fetch thread
+        self.client = create_s3_client(max_pool_connections=max(10, threads))
+
+    def keys(self, after=None):
+        options = {"Bucket": self.bucket, "Prefix": self.prefix}
+        if after is not None:
+            options["StartAfter"] = after
+        keys = []
+        # S3 lists keys in lexicographic order, so StartAfter resumes exactly
+        for page in self.client.get_paginator("list_objects_v2").paginate(**options):
+            for item in page.get("Contents", []):
+                if is_image_name(item["Key"]) and item["Size"] <= BATCH_MAX_IMAGE_SIZE:
+                    keys.append(item["Key"])
+        return keys
+
+    def read(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+
+def open_source(source, threads):
+    if source.startswith("s3://"):
+        return S3Source(source, threads)
+    if not os.path.isdir(source):
+        raise SystemExit(f"{source} is neither a directory nor an s3:// URL")
+    return LocalSource(source)
+
+
+class JsonlOutput:
+    """One JSON object per image; truncated back to the checkpointed offset on resume"""
+
+    def __init__(self, path, state=None):
+        self.path = path
+        self._file = open(path, "ab")
+        offset = (state or {}).get("offset", 0)
+        if self._file.tell() < offset:
+            # truncate() would pad with NUL bytes; rows the checkpoint counts as written are missing
+            self._file.close()
+            raise SystemExit(f"{path} is shorter than its checkpoint ({offset} bytes); "
+                             "restore it or delete the checkpoint to start over")
+        if self._file.tell() != offset:
+            self._file.truncate(offset)
+            self._file.seek(offset)
+
+    def write(self, key, result):
+        self._file.write(b'{"key":' + dumps(key) + b"," + result.to_json()[1:] + b"\n")
+
+    def write_error(self, key, error):
+        self._file.write(dumps({"key": key, "error": error}) + b"\n")
+
+    def commit(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return {"offset": self._file.tell()}
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetOutput:
+    """Directory of part-NNNNN.parquet files, one per checkpoint; flat, query-friendly columns"""
+
+    def __init__(self, directory, state=None):
+        self.directory = directory
+        self.parts = (state or {}).get("parts", 0)
+        self._rows = []
+        os.makedirs(directory, exist_ok=True)
+        # Parts written after the last checkpoint are redone
+        for name in os.listdir(directory):
+            if name.startswith("part-") and name.endswith(".parquet") and int(name[5:10]) >= self.parts:
+                os.remove(os.path.join(directory, name))
+
+    def write(self, key, result):
+        face_info = result.face_info
+        self._rows.append({
+            "key": key,
+            "image_id": result.image_id,
+            "caption": result.caption,
+            "age": face_info.age if face_info is not None else None,
+            "gender": face_info.gender_label if face_info is not None else None,
+            "face_count": len(result.faces),
+            "faces": json.dumps([face.to_dict() for face in result.faces], ensure_ascii=False),
+            "error": result.error
+        })
+
+    def write_error(self, key, error):
+        self._rows.append({"key": key, "image_id": None, "caption": None, "age": None, "gender": None,
+                           "face_count": 0, "faces": "[]", "error": error})
+
+    def commit(self):
+        if self._rows:
+            import pandas as pd
+
+            path = os.path.join(self.directory, f"part-{self.parts:05d}.parquet")
+            pd.DataFrame(self._rows).to_parquet(f"{path}.tmp", index=False)
+            os.replace(f"{path}.tmp", path)
+            self.parts += 1
+            self._rows = []
+        return {"parts": self.parts}
+
+    def close(self):
+        pass
+
+
+def load_checkpoint(path, source):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("source") != source:
+        raise SystemExit(f"Checkpoint {path} belongs to {checkpoint.get('source')}, not {source}")
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class Progress:
+    def __init__(self, processed, every):
+        self.start = time.perf_counter()
+        self.start_count = processed
+        self.every = every
+        self._last_time = self.start
+        self._last_count = processed
+
+    def update(self, processed, errors, force=False):
+        now = time.perf_counter()
+        if not force and now - self._last_time < self.every:
+            return
+        recent = (processed - self._last_count) / (now - self._last_time) if now > self._last_time else 0.0
+        overall = (processed - self.start_count) / (now - self.start) if now > self.start else 0.0
+        print(f"{processed} images, {recent:.1f} img/s (run average {overall:.1f} img/s), {errors} errors",
+              flush=True)
+        self._last_time, self._last_count = now, processed
+
+
+def run(args):
+    # The pipeline modules read their configuration at import time; import after argument parsing
+    from app.pipeline import process_image
+    from app.pipeline.worker_pool import worker_pool
+    from app.storage.neo4j_writer import neo4j_writer, object_key_writer
+    from app.storage.object_store import image_store
+    from app.storage.vector_store import vector_store
+    from app.utils.logger import log_writer
+
+    checkpoint_path = args.checkpoint or f"{args.output.rstrip('/')}.checkpoint.json"
+    checkpoint = load_checkpoint(checkpoint_path, args.source) or {
+        "source": args.source, "last_key": None, "processed": 0, "errors": 0, "output": None
+    }
+    output = (ParquetOutput if args.format == "parquet" else JsonlOutput)(args.output, checkpoint["output"])
+    source = open_source(args.source, args.decode_threads)
+
+    keys = source.keys(after=checkpoint["last_key"])
+    if args.limit is not None:
+        keys = keys[:max(0, args.limit - checkpoint["processed"])]
+    if checkpoint["last_key"] is not None:
+        print(f"Resuming after {checkpoint['last_key']} ({checkpoint['processed']} images done)")
+    print(f"{len(keys)} images to process from {args.source}")
+    if not keys:
+        return
+
+    process_image.warm_up()
+
+    def load(key):
+        try:
+            image_bytes = source.read(key)
+        except Exception as e:
+            return key, None, f"Could not read: {e}"
+        if len(image_bytes) > BATCH_MAX_IMAGE_SIZE:
+            return key, None, "File size too large"
+        try:
+            return key, image_bytes, prepare_image(image_bytes)
+        except Exception as e:
+            # Reported by the pipeline as a decode error, like an API upload
+            return key, image_bytes, e
+
+    processed, errors = checkpoint["processed"], checkpoint["errors"]
+    progress = Progress(processed, args.report_every)
+    batches = [keys[i:i + args.batch_size] for i in range(0, len(keys), args.batch_size)]
+    with ThreadPoolExecutor(max_workers=args.decode_threads) as pool:
+        pending = deque()
+        next_batch = 0
+        for batch_number in range(len(batches)):
+            # Keep a few batches fetching and decoding while the current one runs inference
+            while next_batch < len(batches) and len(pending) < args.prefetch_batches + 1:
+                pending.append([pool.submit(load, key) for key in batches[next_batch]])
+                next_batch += 1
+            items = [future.result() for future in pending.popleft()]
+
+            readable = [(key, image_bytes, decoded) for key, image_bytes, decoded in items if image_bytes is not None]
+            results = {}
+            if readable:
+                analyzed = process_image.process_images(
+                    [image_bytes for _, image_bytes, _ in readable],
+                    decoded=[decoded for _, _, decoded in readable]
+                )
+                results = {key: result for (key, _, _), result in zip(readable, analyzed)}
+            for key, image_bytes, decoded in items:
+                if image_bytes is None:
+                    output.write_error(key, decoded)
+                    errors += 1
+                else:
+                    output.write(key, results[key])
+                    errors += not results[key].ok
+            processed += len(items)
+            last_key = items[-1][0]
+
+            if (batch_number + 1) % args.checkpoint_every == 0 or batch_number == len(batches) - 1:
+                image_store.flush()
+                object_key_writer.flush()
+                neo4j_writer.flush()
+                checkpoint.update(last_key=last_key, processed=processed, errors=errors, output=output.commit())
+                save_checkpoint(checkpoint_path, checkpoint)
+            progress.update(processed, errors)
+
+    progress.update(processed, errors, force=True)
+    output.close()
+    worker_pool.stop()
+    image_store.stop()
+    object_key_writer.stop()
+    neo4j_writer.stop()
+    vector_store.close()
+    log_writer.stop()
+    print(f"Done: {processed} images, {errors} errors; checkpoint {checkpoint_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="directory or s3://bucket/prefix")
+    parser.add_argument("--output", required=True, help="JSONL file or Parquet directory")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default=None,
+                        help="default: parquet if --output ends with .parquet or is a directory, else jsonl")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--decode-threads", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--prefetch-batches", type=int, default=2)
+    parser.add_argument("--checkpoint-every", type=int, default=20, help="batches between checkpoints")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: OUTPUT.checkpoint.json)")
+    parser.add_argument("--limit", type=int, help="stop after this many images in total")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    if args.format is None:
+        args.format = "parquet" if args.output.endswith(".parquet") or os.path.isdir(args.output) else "jsonl"
+    args.batch_size = max(1, args.batch_size)
+    args.checkpoint_every = max(1, args.checkpoint_every)
+    run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
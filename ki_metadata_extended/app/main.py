@@ -1,9 +1,35 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
-from app.pipeline.process_image import process_image
-from app.utils.logger import log_upload
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.pipeline.models import MODEL_WARMUP, registry
+from app.pipeline.process_image import process_images, result_cache, text_embedding, warm_up
+from app.pipeline.scheduler import InferenceScheduler, QueueFullError
+from app.pipeline.worker_pool import worker_pool
+from app.storage.analytics import graph_analytics
+from app.storage.neo4j_writer import neo4j_writer, object_key_writer
+from app.storage.object_store import image_store
+from app.storage.vector_store import vector_store
+from app.utils.archives import is_archive, iter_archive_images
+from app.utils.log_query import query_log
+from app.utils.metrics import (
+    IMAGE_STORE_QUEUE_DEPTH, INFERENCE_QUEUE_DEPTH, LOG_BUFFER_DEPTH, MODEL_LOAD_SECONDS, NEO4J_QUEUE_DEPTH,
+    REQUESTS_IN_FLIGHT, WORKER_RSS_BYTES, Timings, process_rss_bytes
+)
+from app.utils.serialization import dumps, embed_json
+from app.utils.logger import ANALYSIS_LOG, UPLOADS_LOG, log_path, log_upload, log_writer
+from tempfile import SpooledTemporaryFile
+from typing import Optional
+import asyncio
+import time
 import traceback
-import json
+import os
+
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "10000"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(1024 * 1024 * 1024)))
+# Raw archive bodies are written to the spool file in chunks of this size, off the event loop
+SPOOL_WRITE_CHUNK = 1024 * 1024
+DISCLAIMER = "AI analysis results may contain errors. Gender and age predictions are estimates based on facial features and may not be accurate in all cases."
 
 app = FastAPI(
     title="KI Metadata Extended API",
@@ -11,6 +37,32 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# With a worker pool, keep one batch in flight per worker process
+scheduler = InferenceScheduler(
+    process_images,
+    max_concurrent_batches=worker_pool.workers if worker_pool.enabled else 1
+)
+
+@app.on_event("startup")
+async def start_scheduler():
+    neo4j_writer.start()
+    await scheduler.start()
+    # The worker pool is forked at the end of the warm-up, so it always needs one
+    if MODEL_WARMUP or worker_pool.enabled:
+        registry.start_warm_up(warm_up)
+    else:
+        registry.mark_ready()
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await scheduler.stop()
+    await asyncio.to_thread(worker_pool.stop)
+    await asyncio.to_thread(image_store.stop)
+    await asyncio.to_thread(object_key_writer.stop)
+    await asyncio.to_thread(neo4j_writer.stop)
+    await asyncio.to_thread(vector_store.close)
+    await asyncio.to_thread(log_writer.stop)
+
 @app.get("/")
 async def root():
     return {"message": "KI Metadata Extended API is running"}
@@ -19,66 +71,315 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    status = registry.status()
+    return JSONResponse(status_code=200 if registry.ready else 503, content=status)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics; process_resident_memory_bytes comes from the default process collector"""
+    INFERENCE_QUEUE_DEPTH.set(scheduler.queue_depth)
+    NEO4J_QUEUE_DEPTH.set(neo4j_writer.queue_depth)
+    IMAGE_STORE_QUEUE_DEPTH.set(image_store.queue_depth)
+    LOG_BUFFER_DEPTH.set(log_writer.stats()["buffered"])
+    for step, seconds in registry.timings.items():
+        MODEL_LOAD_SECONDS.labels(step).set(seconds)
+    WORKER_RSS_BYTES.clear()
+    for pid in worker_pool.pids():
+        WORKER_RSS_BYTES.labels(str(pid)).set(process_rss_bytes(pid))
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.post("/upload/")
-async def upload_image(file: UploadFile = File(...)):
+async def upload_image(file: UploadFile = File(...), timings: bool = Query(False)):
+    """Analyze one image; `?timings=true` adds a per-stage breakdown (body field and X-Timing header)"""
+    stage_timings = Timings()
+    start = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc()
     try:
         # Validate file type
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
         
         # Validate file size (max 10MB)
-        contents = await file.read()
-        if len(contents) > 10 * 1024 * 1024:  # 10MB
+        with stage_timings.stage("read"):
+            contents = await file.read()
+        if len(contents) > MAX_FILE_SIZE:
             raise HTTPException(status_code=400, detail="File size too large (max 10MB)")
         
         log_upload(file.filename)
-        result = process_image(contents)
-        
-        # Ensure result is JSON serializable
         try:
-            # Test JSON serialization
-            json.dumps(result)
-        except (TypeError, ValueError) as e:
-            # If serialization fails, convert to string representation
-            result = {
-                "error": "Data serialization error",
-                "details": str(result),
-                "original_error": str(e)
-            }
+            result = await scheduler.submit(contents, stage_timings)
+        except QueueFullError:
+            raise HTTPException(status_code=503, detail="Server is busy, please retry later")
         
-        return JSONResponse(
-            status_code=200,
-            content={
-                "filename": file.filename,
-                "size": len(contents),
-                "analysis": result,
-                "disclaimer": "AI analysis results may contain errors. Gender and age predictions are estimates based on facial features and may not be accurate in all cases."
-            }
-        )
+        # The result was encoded once when it was produced; wrap those bytes as-is
+        with stage_timings.stage("response"):
+            envelope = {"filename": file.filename, "size": len(contents), "disclaimer": DISCLAIMER}
+            headers = {}
+            if timings:
+                stage_timings.add("total", time.perf_counter() - start)
+                envelope["timings"] = stage_timings.milliseconds()
+                headers["X-Timing"] = stage_timings.header()
+            content = embed_json(envelope, "analysis", result.to_json())
+        if not timings:
+            stage_timings.add("total", time.perf_counter() - start)
+        return Response(content=content, status_code=200, media_type="application/json", headers=headers)
     except HTTPException:
         raise
     except Exception as e:
         print(f"Error processing image: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
 
-@app.get("/logs/uploads")
-async def get_upload_logs():
+async def _iter_batch_images(sources):
+    """Yield (filename, bytes or None, error) for every image in the batch sources"""
+    for filename, content_type, fileobj in sources:
+        if is_archive(filename, content_type):
+            members = iter_archive_images(fileobj, MAX_FILE_SIZE)
+            while True:
+                try:
+                    # Archive members are decompressed in a thread to keep the event loop free
+                    member = await asyncio.to_thread(next, members, None)
+                except Exception as e:
+                    yield filename, None, f"Invalid archive: {e}"
+                    break
+                if member is None:
+                    break
+                yield member
+            continue
+        if not content_type or not content_type.startswith('image/'):
+            yield filename, None, "File must be an image"
+            continue
+        contents = await asyncio.to_thread(fileobj.read, MAX_FILE_SIZE + 1)
+        if len(contents) > MAX_FILE_SIZE:
+            yield filename, None, "File size too large (max 10MB)"
+            continue
+        yield filename, contents, None
+
+async def _stream_batch_results(sources, cleanup, timings=False):
+    """Feed images to the scheduler and yield one NDJSON line per finished image"""
+    max_in_flight = max(1, scheduler.max_batch_size * 2)
+    pending = set()
+
+    async def run(index, filename, contents):
+        stage_timings = Timings()
+        try:
+            analysis = await scheduler.submit_when_ready(contents, stage_timings)
+        except Exception as e:
+            return {"index": index, "filename": filename, "error": str(e)}
+        envelope = {"index": index, "filename": filename, "size": len(contents)}
+        if timings:
+            envelope["timings"] = stage_timings.milliseconds()
+        return embed_json(envelope, "analysis", analysis.to_json())
+
+    def to_line(record):
+        if not isinstance(record, bytes):
+            record = dumps(record)
+        return record + b"\n"
+
+    try:
+        index = 0
+        async for filename, contents, error in _iter_batch_images(sources):
+            if error is not None:
+                yield to_line({"index": index, "filename": filename, "error": error})
+            else:
+                log_upload(filename)
+                pending.add(asyncio.create_task(run(index, filename, contents)))
+            index += 1
+
+            # Apply backpressure so one bulk request cannot flood the queue
+            while len(pending) >= max_in_flight:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield to_line(task.result())
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield to_line(task.result())
+    finally:
+        for task in pending:
+            task.cancel()
+        await cleanup()
+
+def _limit_body(request, max_bytes, error):
+    """The same request, but reading more than `max_bytes` of its body raises `error`"""
+    received = 0
+
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > max_bytes:
+                raise error
+        return message
+
+    return Request(request.scope, receive)
+
+@app.post("/upload/batch")
+async def upload_batch(request: Request, timings: bool = Query(False)):
+    """Analyze many images in one request and stream NDJSON results
+
+    Accepts either a multipart form with any number of image or zip/tar
+    archive parts, or a raw zip/tar archive as the request body. One JSON
+    line is streamed per image as soon as its analysis is finished, so the
+    order of lines follows completion, not upload order (see `index`).
+    With `?timings=true` every line carries a per-stage breakdown in ms.
+    """
+    content_type = request.headers.get("content-type", "")
+    too_large = HTTPException(status_code=413, detail=f"Request body too large (max {BATCH_MAX_BYTES} bytes)")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > BATCH_MAX_BYTES:
+        raise too_large
+
+    # Content-Length may be missing (chunked encoding) or wrong, so the body itself is counted too
+    request = _limit_body(request, BATCH_MAX_BYTES, too_large)
+
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form(max_files=BATCH_MAX_FILES)
+        sources = [
+            (value.filename, value.content_type, value.file)
+            for _, value in form.multi_items()
+            if not isinstance(value, str)
+        ]
+        cleanup = form.close
+    else:
+        # Raw archive body: spool to a temp file so the archive can be read member by member
+        spool = SpooledTemporaryFile(max_size=MAX_FILE_SIZE)
+        pending = []
+        pending_size = 0
+        try:
+            async for chunk in request.stream():
+                pending.append(chunk)
+                pending_size += len(chunk)
+                if pending_size >= SPOOL_WRITE_CHUNK:
+                    await asyncio.to_thread(spool.write, b"".join(pending))
+                    pending, pending_size = [], 0
+            if pending:
+                await asyncio.to_thread(spool.write, b"".join(pending))
+        except BaseException:
+            spool.close()
+            raise
+        # The archive format (zip or tar) is detected from the content itself
+        sources = [("upload", "application/x-tar", spool)]
+
+        async def cleanup():
+            spool.close()
+
+    if not sources:
+        await cleanup()
+        raise HTTPException(status_code=400, detail="No files uploaded")
+
+    return StreamingResponse(
+        _stream_batch_results(sources, cleanup, timings),
+        media_type="application/x-ndjson",
+        headers={"X-Disclaimer": DISCLAIMER}
+    )
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return result_cache.stats()
+
+@app.get("/neo4j/stats")
+async def get_neo4j_stats():
+    return neo4j_writer.stats()
+
+async def _analytics(query, *args):
     try:
-        with open("/logs/uploads.log", "r") as f:
-            logs = f.readlines()
-        return {"uploads": logs[-100:]}  # Return last 100 entries
-    except FileNotFoundError:
-        return {"uploads": []}
+        return await asyncio.to_thread(query, *args)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error reading logs: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Neo4j unavailable: {str(e)}")
 
-@app.get("/logs/analysis")
-async def get_analysis_logs():
+@app.get("/analytics/labels")
+async def label_counts(limit: int = Query(50, ge=1, le=1000)):
+    """Number of images per CLIP label"""
+    return {"labels": await _analytics(graph_analytics.label_counts, limit)}
+
+@app.get("/analytics/ages")
+async def age_distribution(label: Optional[str] = None, bucket: int = Query(10, ge=1, le=100)):
+    """Faces per age bucket, per label (or for one `label`)"""
+    return {"bucket": bucket, "labels": await _analytics(graph_analytics.age_distribution, label, bucket)}
+
+@app.get("/analytics/genders")
+async def gender_counts(label: Optional[str] = None):
+    """Faces per gender, per label (or for one `label`)"""
+    return {"labels": await _analytics(graph_analytics.gender_counts, label)}
+
+@app.get("/storage/stats")
+async def get_storage_stats():
+    return image_store.stats()
+
+@app.get("/images/{image_id}")
+async def get_image(image_id: str):
+    """Stream a stored upload back (by `image_id` from the analysis result)"""
+    if not image_store.enabled:
+        raise HTTPException(status_code=503, detail="Image storage is disabled")
+    if len(image_id) != 64 or any(c not in "0123456789abcdef" for c in image_id):
+        raise HTTPException(status_code=404, detail="Unknown image id")
     try:
-        with open("/logs/analysis.log", "r") as f:
-            logs = f.readlines()
-        return {"analysis": logs[-100:]}  # Return last 100 entries
-    except FileNotFoundError:
-        return {"analysis": []}
+        chunks, content_type, length = await asyncio.to_thread(image_store.open, image_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown image id")
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Object storage unavailable: {str(e)}")
+    # Content-addressed, so a given id always returns the same bytes
+    headers = {"ETag": f'"{image_id}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    if length is not None:
+        headers["Content-Length"] = str(length)
+    # The synchronous chunk iterator is run in the threadpool by StreamingResponse
+    return StreamingResponse(chunks, media_type=content_type, headers=headers)
+
+@app.get("/similar/{image_id}")
+async def similar_images(image_id: str, k: int = Query(10, ge=1, le=1000)):
+    """Images closest to an already analyzed one (by `image_id` from the analysis result)"""
+    vector = await asyncio.to_thread(vector_store.vector, image_id)
+    if vector is None:
+        raise HTTPException(status_code=404, detail="Unknown image id")
+    hits = await asyncio.to_thread(vector_store.search, vector, k, image_id)
+    return {"id": image_id, "results": [{"id": hit_id, "score": score} for hit_id, score in hits]}
+
+@app.get("/search")
+async def search_images(q: str = Query(..., min_length=1), k: int = Query(10, ge=1, le=1000)):
+    """Text-to-image search over every analyzed image"""
+    if not vector_store.enabled:
+        raise HTTPException(status_code=503, detail="Vector store is disabled")
+    try:
+        query = await asyncio.to_thread(text_embedding, q)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"CLIP model unavailable: {str(e)}")
+    hits = await asyncio.to_thread(vector_store.search, query, k)
+    return {"query": q, "results": [{"id": image_id, "score": score} for image_id, score in hits]}
+
+@app.get("/vectors/stats")
+async def get_vector_stats():
+    return await asyncio.to_thread(vector_store.stats)
+
+def _query_log_endpoint(name, key, since, until, limit, cursor):
+    try:
+        page = query_log(log_path(name), since=since, until=until, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid query: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading logs: {str(e)}")
+    return {key: page["entries"], "next_cursor": page["next_cursor"]}
+
+@app.get("/logs/uploads")
+async def get_upload_logs(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[int] = Query(None, ge=0)
+):
+    return await asyncio.to_thread(_query_log_endpoint, UPLOADS_LOG, "uploads", since, until, limit, cursor)
+
+@app.get("/logs/analysis")
+async def get_analysis_logs(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[int] = Query(None, ge=0)
+):
+    return await asyncio.to_thread(_query_log_endpoint, ANALYSIS_LOG, "analysis", since, until, limit, cursor)
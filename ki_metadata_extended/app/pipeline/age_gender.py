@@ -0,0 +1,213 @@
+import importlib.util
+import json
+import os
+
+import cv2
+import numpy as np
+import torch
+
+from app.utils.serialization import to_builtin
+
+# "deepface" (TensorFlow) or "simplecnn" (the checkpoint from training/, PyTorch only)
+AGE_GENDER_BACKEND = os.getenv("AGE_GENDER_BACKEND", "deepface").lower()
+# .pth state_dict, .pt TorchScript or .onnx (see training/export_age_gender.py)
+AGE_GENDER_MODEL_PATH = os.getenv("AGE_GENDER_MODEL_PATH", "training/age_gender_model.pth")
+AGE_GENDER_TORCHSCRIPT = os.getenv("AGE_GENDER_TORCHSCRIPT", "1").lower() in ("1", "true", "yes")
+AGE_GENDER_BATCH_SIZE = int(os.getenv("AGE_GENDER_BATCH_SIZE", "32"))
+
+AGE_GENDER_INPUT_SIZE = 224
+GENDER_LABELS = ("Woman", "Man")
+# Labels of the training CSV mapped onto DeepFace's, so consumers see one vocabulary
+GENDER_ALIASES = {"female": "Woman", "f": "Woman", "woman": "Woman", "male": "Man", "m": "Man", "man": "Man"}
+
+MODEL_DEFINITION = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                "training", "model.py")
+
+
+def age_gender_input(face_bgr, size=AGE_GENDER_INPUT_SIZE):
+    """Letterbox a BGR face crop to size x size float32 in [0, 1], as DeepFace does before its models"""
+    height, width = face_bgr.shape[:2]
+    factor = min(size / height, size / width)
+    resized = cv2.resize(face_bgr, (max(1, int(width * factor)), max(1, int(height * factor))))
+    padded = np.zeros((size, size, 3), dtype=np.float32)
+    top = (size - resized.shape[0]) // 2
+    left = (size - resized.shape[1]) // 2
+    padded[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    return padded / 255.0
+
+
+def _build_attribute_model(deepface, name):
+    try:
+        client = deepface.build_model(model_name=name, task="facial_attribute")
+    except TypeError:
+        # deepface < 0.0.93 has no `task` argument
+        client = deepface.build_model(name)
+    return getattr(client, "model", client)
+
+
+class DeepFaceAgeGender:
+    """DeepFace's age and gender networks, run on a whole batch of face crops at once
+
+    DeepFace.analyze runs both networks once per face. Here the Keras models
+    are called directly with every crop of a batch stacked, so the cost per
+    face drops with the number of faces in flight. If the models cannot be
+    used directly (an incompatible deepface version), every crop falls back
+    to DeepFace.analyze with detection skipped.
+    """
+
+    name = "deepface"
+
+    def __init__(self, deepface):
+        self.deepface = deepface
+        try:
+            self._age = _build_attribute_model(deepface, "Age")
+            self._gender = _build_attribute_model(deepface, "Gender")
+        except Exception as e:
+            print(f"Batched age/gender models unavailable, using DeepFace.analyze per face: {e}")
+            self._age = self._gender = None
+
+    def predict(self, crops):
+        """Return one DeepFace-style dict (age, gender, dominant_gender) per BGR crop"""
+        if not crops:
+            return []
+        if self._age is None:
+            return [self._analyze(crop) for crop in crops]
+        batch = np.stack([age_gender_input(crop) for crop in crops])
+        age_probabilities = np.asarray(self._age.predict_on_batch(batch))
+        gender_probabilities = np.asarray(self._gender.predict_on_batch(batch))
+        ages = age_probabilities @ np.arange(age_probabilities.shape[1], dtype=np.float32)
+        predictions = []
+        for age, genders in zip(ages, gender_probabilities):
+            scores = {label: float(score) * 100 for label, score in zip(GENDER_LABELS, genders)}
+            predictions.append({
+                "age": int(age),
+                "gender": scores,
+                "dominant_gender": GENDER_LABELS[int(np.argmax(genders))]
+            })
+        return predictions
+
+    def _analyze(self, crop):
+        result = self.deepface.analyze(
+            img_path=crop, actions=["age", "gender"], detector_backend="skip", enforce_detection=False
+        )
+        return to_builtin(result[0] if isinstance(result, list) else result)
+
+
+def _load_simple_cnn():
+    """Import SimpleCNN from training/model.py without making training/ a package"""
+    spec = importlib.util.spec_from_file_location("age_gender_training_model", MODEL_DEFINITION)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class SimpleCnnAgeGender:
+    """The project's own SimpleCNN checkpoint; PyTorch (or ONNX Runtime) only, no TensorFlow
+
+    `model_path` may be the training script's state_dict (.pth, optionally
+    traced and frozen with TorchScript), an exported TorchScript module
+    (.pt) or an ONNX model (.onnx). Gender class names come from the JSON
+    sidecar the trainer writes next to the model.
+    """
+
+    name = "simplecnn"
+
+    def __init__(self, model_path=AGE_GENDER_MODEL_PATH, torchscript=AGE_GENDER_TORCHSCRIPT,
+                 batch_size=AGE_GENDER_BATCH_SIZE):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Age/gender model {model_path} not found (AGE_GENDER_MODEL_PATH)")
+        self.model_path = model_path
+        self.batch_size = max(1, batch_size)
+        definition = _load_simple_cnn()
+        self.input_size = definition.INPUT_SIZE
+        self.gender_classes = ["female", "male"]
+        sidecar = f"{os.path.splitext(model_path)[0]}.json"
+        if os.path.exists(sidecar):
+            with open(sidecar, "r", encoding="utf-8") as f:
+                metadata = json.load(f)
+            self.gender_classes = metadata.get("gender_classes") or self.gender_classes
+            self.input_size = metadata.get("input_size") or self.input_size
+        self.gender_labels = [GENDER_ALIASES.get(str(name).lower(), str(name)) for name in self.gender_classes]
+
+        self._model = None
+        self._session = None
+        self._session_pid = None
+        extension = os.path.splitext(model_path)[1].lower()
+        if extension == ".onnx":
+            self.format = "onnx"
+        elif extension in (".pt", ".ts"):
+            self.format = "torchscript"
+            self._model = torch.jit.load(model_path, map_location="cpu").eval()
+        else:
+            self.format = "state_dict"
+            model = definition.SimpleCNN()
+            model.load_state_dict(torch.load(model_path, map_location="cpu", weights_only=True))
+            model.eval()
+            if torchscript:
+                dummy = torch.zeros(1, 3, self.input_size, self.input_size)
+                with torch.inference_mode():
+                    model = torch.jit.freeze(torch.jit.trace(model, dummy))
+                self.format = "torchscript"
+            self._model = model
+
+        # One dummy pass gives the gender head's width whatever the format
+        _, genders = self._run(np.zeros((1, 3, self.input_size, self.input_size), dtype=np.float32))
+        if genders.shape[1] != len(self.gender_labels):
+            raise ValueError(
+                f"Age/gender model {model_path} has {genders.shape[1]} gender outputs but its sidecar "
+                f"{sidecar} lists {self.gender_classes}"
+            )
+
+    def _get_session(self):
+        # ONNX Runtime sessions are not fork-safe; one per process
+        if self._session is None or self._session_pid != os.getpid():
+            import onnxruntime
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = torch.get_num_threads()
+            self._session = onnxruntime.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+            self._session_pid = os.getpid()
+        return self._session
+
+    def _inputs(self, crops):
+        """BGR crops -> float32 NCHW RGB in [0, 1] at the training resolution"""
+        size = self.input_size
+        batch = np.stack([
+            cv2.resize(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB), (size, size), interpolation=cv2.INTER_LINEAR)
+            for crop in crops
+        ])
+        return np.ascontiguousarray(batch.transpose(0, 3, 1, 2), dtype=np.float32) / 255.0
+
+    def _run(self, pixels):
+        if self.format == "onnx":
+            session = self._get_session()
+            ages, genders = session.run(None, {session.get_inputs()[0].name: pixels})
+            return np.asarray(ages).reshape(-1), torch.from_numpy(np.asarray(genders)).softmax(dim=1).numpy()
+        with torch.inference_mode():
+            ages, genders = self._model(torch.from_numpy(pixels))
+            return ages.reshape(-1).numpy(), genders.softmax(dim=1).numpy()
+
+    def predict(self, crops):
+        """Return one DeepFace-style dict (age, gender, dominant_gender) per BGR crop"""
+        predictions = []
+        for start in range(0, len(crops), self.batch_size):
+            ages, genders = self._run(self._inputs(crops[start:start + self.batch_size]))
+            for age, probabilities in zip(ages, genders):
+                scores = {label: float(p) * 100 for label, p in zip(self.gender_labels, probabilities)}
+                predictions.append({
+                    "age": int(round(float(age))),
+                    "gender": scores,
+                    "dominant_gender": self.gender_labels[int(np.argmax(probabilities))]
+                })
+        return predictions
+
+
+AGE_GENDER_BACKENDS = ("deepface", "simplecnn")
+
+
+def create_age_gender_backend(name, deepface_loader):
+    """Build the AGE_GENDER_BACKEND; `deepface_loader` (TensorFlow) is only called for DeepFace"""
+    if name == "deepface":
+        return DeepFaceAgeGender(deepface_loader())
+    if name == "simplecnn":
+        return SimpleCnnAgeGender()
+    raise ValueError(f"Unknown age/gender backend '{name}', expected one of {list(AGE_GENDER_BACKENDS)}")
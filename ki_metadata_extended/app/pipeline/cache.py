@@ -0,0 +1,216 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from app.pipeline.results import AnalysisResult
+from app.utils.serialization import dumps
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "86400"))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR") or None
+RESULT_CACHE_DISK_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_DISK_MAX_ENTRIES", "100000"))
+RESULT_CACHE_PHASH = os.getenv("RESULT_CACHE_PHASH", "0").lower() in ("1", "true", "yes")
+
+
+def content_hash(image_bytes):
+    """SHA-256 of the raw upload, used as the image's content address"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def perceptual_hash(image_bytes):
+    """64-bit difference hash (dHash) of the decoded pixels
+
+    JPEGs are decoded in draft mode at a fraction of their size, so this is
+    much cheaper than a full decode. Re-encoded or resized copies of the same
+    photo usually map to the same hash.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.draft("L", (64, 64))
+        small = image.convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return np.packbits(bits).tobytes().hex()
+
+
+class ResultCache:
+    """Bounded LRU cache of analysis results keyed by image content and model version
+
+    Entries live in memory (LRU, `max_entries`) and, when `disk_dir` is set,
+    also as small JSON files so they survive restarts. Every entry expires
+    after `ttl_seconds`. Keys include `model_version`, so changing models or
+    labels never serves stale results.
+    """
+
+    def __init__(self, model_version, max_entries=RESULT_CACHE_SIZE, ttl_seconds=RESULT_CACHE_TTL,
+                 disk_dir=RESULT_CACHE_DIR, max_disk_entries=RESULT_CACHE_DISK_MAX_ENTRIES,
+                 use_phash=RESULT_CACHE_PHASH):
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.use_phash = use_phash
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.phash_hits = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 or bool(self.disk_dir)
+
+    def keys_for(self, image_bytes, digest=None):
+        """Return the cache keys of an image: exact content hash first, then the optional perceptual hash
+
+        `digest` is the image's content_hash when the caller already has it.
+        """
+        keys = [f"{self.model_version}:sha256:{digest or content_hash(image_bytes)}"]
+        if self.use_phash:
+            try:
+                keys.append(f"{self.model_version}:dhash:{perceptual_hash(image_bytes)}")
+            except Exception:
+                # Undecodable input is left to the pipeline to report
+                pass
+        return keys
+
+    def get(self, keys):
+        """Look up the first key that has a live entry, or return None"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            for position, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    stored_at, result = entry
+                    if now - stored_at <= self.ttl_seconds:
+                        self._entries.move_to_end(key)
+                        self._count_hit(position)
+                        return result
+                    del self._entries[key]
+
+            for position, key in enumerate(keys):
+                entry = self._read_disk(key, now)
+                if entry is not None:
+                    stored_at, result = entry
+                    self._store_memory(key, stored_at, result)
+                    self.disk_hits += 1
+                    self._count_hit(position)
+                    return result
+
+            self.misses += 1
+            return None
+
+    def put(self, keys, result):
+        """Store an AnalysisResult under all of its keys; results are treated as immutable"""
+        if not self.enabled:
+            return
+        stored_at = time.time()
+        with self._lock:
+            for key in keys:
+                self._store_memory(key, stored_at, result)
+                self._write_disk(key, stored_at, result)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model_version": self.model_version,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_dir": self.disk_dir,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "phash_hits": self.phash_hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def _count_hit(self, position):
+        self.hits += 1
+        if position > 0:
+            self.phash_hits += 1
+
+    def _store_memory(self, key, stored_at, result):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (stored_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, key):
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, name[:2], name + ".json")
+
+    def _read_disk(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if entry.get("key") != key or now - entry.get("stored_at", 0) > self.ttl_seconds:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            return None
+        return entry["stored_at"], AnalysisResult.from_dict(entry["result"])
+
+    def _write_disk(self, key, stored_at, result):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                # Reuse the result's cached JSON encoding instead of serializing it again
+                f.write(dumps({"key": key, "stored_at": stored_at})[:-1] + b',"result":' + result.to_json() + b"}")
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Result cache write error: {e}")
+            return
+        self._disk_writes += 1
+        # Pruning walks the whole directory, so only do it now and then
+        if self._disk_writes % 256 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        files.append((os.path.getmtime(path), path))
+                    except OSError:
+                        pass
+        if len(files) <= self.max_disk_entries:
+            return
+        files.sort()
+        for _, path in files[:len(files) - self.max_disk_entries]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
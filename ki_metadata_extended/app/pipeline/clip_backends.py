@@ -0,0 +1,155 @@
+import json
+import os
+
+import numpy as np
+import torch
+
+CLIP_BACKEND = os.getenv("CLIP_BACKEND", "torch")
+# Empty: one export per CLIP model under ~/.cache/ki_metadata (see default_onnx_path)
+CLIP_ONNX_PATH = os.getenv("CLIP_ONNX_PATH", "")
+CLIP_ONNX_THREADS = int(os.getenv("CLIP_ONNX_THREADS", "0"))
+
+
+class TorchClipBackend:
+    """fp32 PyTorch CLIP (the reference implementation)"""
+
+    name = "torch"
+
+    def __init__(self, model, processor):
+        self.model = model
+        self.processor = processor
+        self.logit_scale = float(model.logit_scale.exp())
+
+    def text_features(self, labels):
+        """Return normalized text features for the given prompts"""
+        text_inputs = self.processor(text=labels, return_tensors="pt", padding=True)
+        with torch.no_grad():
+            features = self.model.get_text_features(**text_inputs)
+        return features / features.norm(dim=-1, keepdim=True)
+
+    def image_features(self, pixel_values):
+        """Return normalized image features for a preprocessed (N, 3, 224, 224) batch"""
+        with torch.no_grad():
+            features = self.model.get_image_features(pixel_values=pixel_values)
+        return features / features.norm(dim=-1, keepdim=True)
+
+
+class QuantizedClipBackend(TorchClipBackend):
+    """PyTorch CLIP with every Linear layer dynamically quantized to int8
+
+    The model is quantized in place: a copy would keep the fp32 weights
+    alive next to the int8 ones (the registry still references the model)
+    and raise memory use instead of lowering it.
+    """
+
+    name = "quantized"
+
+    def __init__(self, model, processor):
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        super().__init__(model, processor)
+
+
+def default_onnx_path(model_name):
+    directory = model_name.replace("/", "--")
+    return os.path.join(os.path.expanduser("~"), ".cache", "ki_metadata", directory, "clip_image_encoder.onnx")
+
+
+def exported_model_name(onnx_path):
+    """CLIP model an existing export was made from, or None if unknown or missing"""
+    if not os.path.exists(onnx_path):
+        return None
+    try:
+        with open(f"{onnx_path}.json", "r", encoding="utf-8") as f:
+            return json.load(f).get("model")
+    except (OSError, ValueError):
+        return None
+
+
+class _ImageEncoder(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+class OnnxClipBackend(TorchClipBackend):
+    """CLIP vision tower exported to ONNX and run with ONNX Runtime
+
+    The export happens once and is reused from `onnx_path` as long as its
+    `.json` sidecar names the same CLIP model; by default every model gets
+    its own path, so changing CLIP_MODEL_NAME never reuses a stale export.
+    Text prompts are only encoded when the label set changes, so they stay
+    on the PyTorch model. ONNX Runtime sessions are not fork-safe, so each process creates
+    its own session on first use.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model, processor, onnx_path=CLIP_ONNX_PATH, threads=CLIP_ONNX_THREADS):
+        super().__init__(model, processor)
+        model_name = model.name_or_path
+        self.onnx_path = onnx_path or default_onnx_path(model_name)
+        self.threads = threads
+        self._session = None
+        self._session_pid = None
+        if exported_model_name(self.onnx_path) != model_name:
+            self.export(model, self.onnx_path)
+
+    @staticmethod
+    def export(model, onnx_path):
+        os.makedirs(os.path.dirname(onnx_path) or ".", exist_ok=True)
+        size = model.config.vision_config.image_size
+        dummy = torch.zeros(1, 3, size, size)
+        tmp_path = onnx_path + ".tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                _ImageEncoder(model).eval(), (dummy,), tmp_path,
+                input_names=["pixel_values"],
+                output_names=["image_embeds"],
+                dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+                opset_version=17
+            )
+        os.replace(tmp_path, onnx_path)
+        with open(f"{onnx_path}.json", "w", encoding="utf-8") as f:
+            json.dump({"model": model.name_or_path}, f)
+        print(f"Exported CLIP image encoder to {onnx_path}")
+
+    def _get_session(self):
+        if self._session is None or self._session_pid != os.getpid():
+            try:
+                import onnxruntime
+            except ImportError:
+                raise RuntimeError("CLIP_BACKEND=onnx requires the onnxruntime package")
+            options = onnxruntime.SessionOptions()
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            threads = self.threads or torch.get_num_threads()
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+            self._session = onnxruntime.InferenceSession(
+                self.onnx_path, options, providers=["CPUExecutionProvider"]
+            )
+            self._session_pid = os.getpid()
+        return self._session
+
+    def image_features(self, pixel_values):
+        pixel_values = np.ascontiguousarray(pixel_values.numpy(), dtype=np.float32)
+        (features,) = self._get_session().run(["image_embeds"], {"pixel_values": pixel_values})
+        features = torch.from_numpy(features)
+        return features / features.norm(dim=-1, keepdim=True)
+
+
+CLIP_BACKENDS = {
+    TorchClipBackend.name: TorchClipBackend,
+    QuantizedClipBackend.name: QuantizedClipBackend,
+    OnnxClipBackend.name: OnnxClipBackend,
+}
+
+
+def create_clip_backend(name, model, processor):
+    try:
+        backend_class = CLIP_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown CLIP backend '{name}', expected one of {sorted(CLIP_BACKENDS)}")
+    return backend_class(model, processor)
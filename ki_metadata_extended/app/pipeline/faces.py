@@ -0,0 +1,127 @@
+import os
+import threading
+
+import cv2
+
+
+FACE_DETECTOR = os.getenv("FACE_DETECTOR", "opencv").lower()
+# Longest side the detector sees; boxes are scaled back to the decoded image
+FACE_DETECT_MAX_SIDE = int(os.getenv("FACE_DETECT_MAX_SIDE", "640"))
+FACE_MIN_SIZE = int(os.getenv("FACE_MIN_SIZE", "32"))
+FACE_MIN_CONFIDENCE = float(os.getenv("FACE_MIN_CONFIDENCE", "0.5"))
+FACE_MAX_FACES = int(os.getenv("FACE_MAX_FACES", "10"))
+
+
+class FaceDetection:
+    """One detected face: pixel box in the decoded image and detector confidence (if any)"""
+
+    __slots__ = ("x", "y", "w", "h", "confidence")
+
+    def __init__(self, x, y, w, h, confidence=None):
+        self.x = int(x)
+        self.y = int(y)
+        self.w = int(w)
+        self.h = int(h)
+        self.confidence = confidence
+
+    @property
+    def area(self):
+        return self.w * self.h
+
+    @property
+    def region(self):
+        return {"x": self.x, "y": self.y, "w": self.w, "h": self.h}
+
+    def crop(self, image_bgr):
+        return image_bgr[self.y:self.y + self.h, self.x:self.x + self.w]
+
+
+def _largest(detections, max_faces):
+    detections = sorted(detections, key=lambda d: d.area, reverse=True)
+    return detections[:max_faces] if max_faces > 0 else detections
+
+
+class OpenCvFaceDetector:
+    """Haar cascade from opencv-python; a few milliseconds per image, no TensorFlow"""
+
+    name = "opencv"
+
+    def __init__(self, max_side=FACE_DETECT_MAX_SIDE, min_size=FACE_MIN_SIZE, max_faces=FACE_MAX_FACES):
+        self.max_side = max_side
+        self.min_size = min_size
+        self.max_faces = max_faces
+        self._cascade_path = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+        # CascadeClassifier is not safe to share between threads
+        self._local = threading.local()
+
+    @property
+    def _cascade(self):
+        cascade = getattr(self._local, "cascade", None)
+        if cascade is None:
+            cascade = cv2.CascadeClassifier(self._cascade_path)
+            if cascade.empty():
+                raise RuntimeError(f"Could not load face cascade {self._cascade_path}")
+            self._local.cascade = cascade
+        return cascade
+
+    def detect(self, image_bgr):
+        height, width = image_bgr.shape[:2]
+        scale = min(1.0, self.max_side / max(height, width)) if self.max_side else 1.0
+        gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
+        if scale < 1.0:
+            gray = cv2.resize(gray, (max(1, round(width * scale)), max(1, round(height * scale))),
+                              interpolation=cv2.INTER_AREA)
+        min_side = max(1, round(self.min_size * scale))
+        boxes = self._cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_side, min_side))
+        detections = [
+            FaceDetection(x / scale, y / scale, w / scale, h / scale)
+            for x, y, w, h in (boxes if len(boxes) else [])
+        ]
+        return _largest(detections, self.max_faces)
+
+
+class DeepFaceDetector:
+    """Any DeepFace detector backend (retinaface, mtcnn, ssd, yunet, ...); loads TensorFlow"""
+
+    def __init__(self, backend, deepface, min_confidence=FACE_MIN_CONFIDENCE, min_size=FACE_MIN_SIZE,
+                 max_faces=FACE_MAX_FACES):
+        self.name = backend
+        self.deepface = deepface
+        self.min_confidence = min_confidence
+        self.min_size = min_size
+        self.max_faces = max_faces
+
+    def detect(self, image_bgr):
+        faces = self.deepface.extract_faces(
+            img_path=image_bgr, detector_backend=self.name, enforce_detection=False, align=False
+        )
+        detections = []
+        for face in faces:
+            area = face.get("facial_area") or {}
+            confidence = float(face.get("confidence") or 0.0)
+            # Without enforce_detection DeepFace returns the whole frame with confidence 0
+            if confidence < self.min_confidence or confidence <= 0:
+                continue
+            if min(area.get("w", 0), area.get("h", 0)) < self.min_size:
+                continue
+            detections.append(FaceDetection(area["x"], area["y"], area["w"], area["h"], confidence))
+        return _largest(detections, self.max_faces)
+
+
+class WholeImageDetector:
+    """No detection: the whole frame is treated as one face (the previous behaviour)"""
+
+    name = "skip"
+
+    def detect(self, image_bgr):
+        height, width = image_bgr.shape[:2]
+        return [FaceDetection(0, 0, width, height)]
+
+
+def create_face_detector(name, deepface_loader):
+    """Build the detector for FACE_DETECTOR; `deepface_loader` is only called for DeepFace backends"""
+    if name == "opencv":
+        return OpenCvFaceDetector()
+    if name == "skip":
+        return WholeImageDetector()
+    return DeepFaceDetector(name, deepface_loader())
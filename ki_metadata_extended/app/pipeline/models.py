@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+
+from app.pipeline.clip_backends import CLIP_BACKEND, create_clip_backend
+from app.pipeline.age_gender import AGE_GENDER_BACKEND, create_age_gender_backend
+from app.pipeline.faces import FACE_DETECTOR, create_face_detector
+
+CLIP_MODEL_NAME = os.getenv("CLIP_MODEL_NAME", "openai/clip-vit-base-patch32")
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1").lower() in ("1", "true", "yes")
+
+# Reference point for startup timings: when the API process imported this module
+PROCESS_START = time.monotonic()
+
+
+class ModelRegistry:
+    """Load models on first use (or in a background warm-up) instead of at import time
+
+    Every accessor is thread-safe and loads its model at most once. Load and
+    warm-up durations are recorded in `timings` so they can be reported by
+    the readiness endpoint.
+    """
+
+    def __init__(self, clip_model_name=CLIP_MODEL_NAME, clip_backend_name=CLIP_BACKEND,
+                 face_detector_name=FACE_DETECTOR, age_gender_backend_name=AGE_GENDER_BACKEND):
+        self.clip_model_name = clip_model_name
+        self.clip_backend_name = clip_backend_name
+        self.face_detector_name = face_detector_name
+        self.age_gender_backend_name = age_gender_backend_name
+        self.timings = {}
+        self.state = "idle"
+        self.error = None
+        self._lock = threading.RLock()
+        self._clip = None
+        self._clip_backend = None
+        self._deepface = None
+        self._face_detector = None
+        self._age_gender = None
+        self._warm_up_thread = None
+
+    def _timed_load(self, name, loader):
+        start = time.perf_counter()
+        value = loader()
+        self.timings[f"{name}_load_seconds"] = round(time.perf_counter() - start, 3)
+        print(f"Loaded {name} in {self.timings[f'{name}_load_seconds']:.2f}s")
+        return value
+
+    def clip(self):
+        """Return (model, processor) for CLIP, loading them on first use"""
+        if self._clip is None:
+            with self._lock:
+                if self._clip is None:
+                    def load():
+                        from transformers import CLIPModel, CLIPProcessor
+                        model = CLIPModel.from_pretrained(self.clip_model_name)
+                        model.eval()
+                        return model, CLIPProcessor.from_pretrained(self.clip_model_name)
+                    self._clip = self._timed_load("clip", load)
+        return self._clip
+
+    def clip_backend(self):
+        """Return the configured CLIP inference backend (torch, quantized or onnx)"""
+        if self._clip_backend is None:
+            with self._lock:
+                if self._clip_backend is None:
+                    model, processor = self.clip()
+                    self._clip_backend = self._timed_load(
+                        f"clip_{self.clip_backend_name}_backend",
+                        lambda: create_clip_backend(self.clip_backend_name, model, processor)
+                    )
+        return self._clip_backend
+
+    def deepface(self):
+        """Return the DeepFace module; importing it pulls in TensorFlow, so it is deferred"""
+        if self._deepface is None:
+            with self._lock:
+                if self._deepface is None:
+                    def load():
+                        from deepface import DeepFace
+                        return DeepFace
+                    self._deepface = self._timed_load("deepface", load)
+        return self._deepface
+
+    def face_detector(self):
+        """Return the configured face detector; only DeepFace backends import TensorFlow"""
+        if self._face_detector is None:
+            with self._lock:
+                if self._face_detector is None:
+                    self._face_detector = self._timed_load(
+                        f"face_detector_{self.face_detector_name}",
+                        lambda: create_face_detector(self.face_detector_name, self.deepface)
+                    )
+        return self._face_detector
+
+    def age_gender(self):
+        """Return the configured batched age/gender backend; only `deepface` imports TensorFlow"""
+        if self._age_gender is None:
+            with self._lock:
+                if self._age_gender is None:
+                    self._age_gender = self._timed_load(
+                        f"age_gender_{self.age_gender_backend_name}",
+                        lambda: create_age_gender_backend(self.age_gender_backend_name, self.deepface)
+                    )
+        return self._age_gender
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def start_warm_up(self, warm_up):
+        """Run `warm_up` (load models + dummy inference) in a background thread"""
+        with self._lock:
+            if self._warm_up_thread is not None:
+                return
+            self.state = "warming_up"
+            self._warm_up_thread = threading.Thread(
+                target=self._run_warm_up, args=(warm_up,), name="model-warm-up", daemon=True
+            )
+            self._warm_up_thread.start()
+
+    def _run_warm_up(self, warm_up):
+        start = time.perf_counter()
+        try:
+            warm_up()
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            print(f"Model warm-up failed: {e}")
+            return
+        self.timings["warm_up_seconds"] = round(time.perf_counter() - start, 3)
+        self.timings["time_to_ready_seconds"] = round(time.monotonic() - PROCESS_START, 3)
+        self.state = "ready"
+        print(f"Models ready after {self.timings['time_to_ready_seconds']:.2f}s")
+
+    def mark_ready(self):
+        """Mark the registry ready without a warm-up (models load on first request)"""
+        self.timings["time_to_ready_seconds"] = round(time.monotonic() - PROCESS_START, 3)
+        self.state = "ready"
+
+    def status(self):
+        return {
+            "state": self.state,
+            "error": self.error,
+            "clip_loaded": self._clip is not None,
+            "clip_backend": self.clip_backend_name,
+            "deepface_loaded": self._deepface is not None,
+            "face_detector": self.face_detector_name,
+            "age_gender_backend": self.age_gender_backend_name,
+            "age_gender_loaded": self._age_gender is not None,
+            "timings": dict(self.timings)
+        }
+
+
+registry = ModelRegistry()
@@ -0,0 +1,82 @@
+import io
+import os
+
+import numpy as np
+import torch
+from PIL import Image
+
+CLIP_IMAGE_SIZE = 224
+CLIP_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32).reshape(3, 1, 1)
+CLIP_STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32).reshape(3, 1, 1)
+
+# Longest side of the image handed to the face detector. Faces stay well
+# resolved at this size while full-resolution camera images are never decoded.
+FACE_MAX_SIDE = int(os.getenv("FACE_MAX_SIDE", "1280"))
+
+
+class PreparedImage:
+    """One decoded upload with the inputs every model stage needs"""
+
+    __slots__ = ("bgr", "clip_pixels", "original_size")
+
+    def __init__(self, bgr, clip_pixels, original_size):
+        self.bgr = bgr
+        self.clip_pixels = clip_pixels
+        self.original_size = original_size
+
+
+def decode_image(image_bytes, max_side=FACE_MAX_SIDE):
+    """Decode to an RGB PIL image no larger than `max_side` on its longest edge
+
+    JPEGs are decoded in draft mode, which lets libjpeg scale by 1/2, 1/4 or
+    1/8 while decoding, so large photos never exist in memory at full size.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    original_size = image.size
+    if max_side:
+        # draft() only ever returns a size >= the requested one
+        image.draft("RGB", (max_side, max_side))
+    image = image.convert("RGB")
+    if max_side and max(image.size) > max_side:
+        scale = max_side / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+    return image, original_size
+
+
+def clip_input(image, size=CLIP_IMAGE_SIZE):
+    """Resize (shortest edge), center-crop and normalize an RGB PIL image for CLIP
+
+    Produces the same (3, size, size) float32 layout as CLIPProcessor, but
+    with a single resize and vectorized normalization.
+    """
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(np.ascontiguousarray(image))
+    width, height = image.size
+    scale = size / min(width, height)
+    resized = (max(size, round(width * scale)), max(size, round(height * scale)))
+    image = image.resize(resized, Image.BICUBIC, reducing_gap=3.0)
+    left = (resized[0] - size) // 2
+    top = (resized[1] - size) // 2
+    image = image.crop((left, top, left + size, top + size))
+    pixels = np.asarray(image, dtype=np.float32).transpose(2, 0, 1)
+    pixels *= 1 / 255
+    pixels -= CLIP_MEAN
+    pixels /= CLIP_STD
+    return pixels
+
+
+def face_input(image):
+    """Return the contiguous BGR uint8 array DeepFace/OpenCV expect"""
+    return np.ascontiguousarray(np.asarray(image)[:, :, ::-1])
+
+
+def prepare_image(image_bytes, max_side=FACE_MAX_SIDE):
+    """Decode once and derive both the CLIP tensor and the face-detector input"""
+    image, original_size = decode_image(image_bytes, max_side)
+    return PreparedImage(face_input(image), clip_input(image), original_size)
+
+
+def stack_clip_inputs(pixel_arrays):
+    """Stack per-image CLIP inputs into one (N, 3, H, W) batch tensor"""
+    return torch.from_numpy(np.stack(pixel_arrays))
@@ -1,121 +1,344 @@
-import torch
-from transformers import CLIPProcessor, CLIPModel
-from deepface import DeepFace
-from PIL import Image
-import io
-import tempfile
-import os
 import numpy as np
-from neo4j import GraphDatabase
-from app.utils.logger import log_metadata
-
-clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-
-NEO4J_URI = "bolt://neo4j:7687"
-NEO4J_USER = "neo4j"
-NEO4J_PASS = "password"
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASS))
-
-def convert_to_json_serializable(obj):
-    """Convert objects to JSON serializable format"""
-    if isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, dict):
-        return {key: convert_to_json_serializable(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_to_json_serializable(item) for item in obj]
-    elif isinstance(obj, torch.Tensor):
-        return obj.tolist()
-    else:
-        return obj
-
-def validate_gender_prediction(gender_data, confidence_threshold=0.7):
-    """Validate and potentially correct gender predictions"""
-    if not isinstance(gender_data, dict):
-        return gender_data
-    
-    # Check if we have confidence values
-    if 'Woman' in gender_data and 'Man' in gender_data:
-        woman_conf = float(gender_data['Woman'])
-        man_conf = float(gender_data['Man'])
-        
-        # If confidence difference is small, mark as uncertain
-        if abs(woman_conf - man_conf) < 20:  # Less than 20% difference
-            return {
-                "Woman": woman_conf,
-                "Man": man_conf,
-                "dominant_gender": "Uncertain",
-                "confidence_difference": abs(woman_conf - man_conf)
-            }
-        
-        # If confidence is too low, mark as uncertain
-        max_conf = max(woman_conf, man_conf)
-        if max_conf < confidence_threshold * 100:
-            return {
-                "Woman": woman_conf,
-                "Man": man_conf,
-                "dominant_gender": "Low_Confidence",
-                "max_confidence": max_conf
-            }
-    
-    return gender_data
-
-def store_metadata_to_neo4j(caption, age, gender):
+import hashlib
+import os
+import time
+import importlib.metadata
+from dataclasses import replace
+from app.pipeline.age_gender import AGE_GENDER_MODEL_PATH
+from app.pipeline.cache import ResultCache, content_hash
+from app.pipeline.models import registry
+from app.pipeline.results import AnalysisResult, FaceInfo
+from app.pipeline.preprocess import clip_input, decode_image as decode_rgb_image, face_input, prepare_image, stack_clip_inputs
+from app.pipeline.worker_pool import worker_pool
+from app.storage.neo4j_writer import metadata_row, neo4j_writer, object_key_writer
+from app.storage.object_store import image_store
+from app.storage.vector_store import vector_store
+from app.utils.logger import log_analysis, log_error
+from app.utils.metrics import IMAGES_PROCESSED, Timings
+
+CLIP_LABELS = ["a photo", "a person", "a performance"]
+
+# (labels, normalized text features) - swapped as one tuple so readers never
+# see labels and features from different label sets. Features are None until
+# the CLIP model is loaded.
+_label_cache = (list(CLIP_LABELS), None)
+
+def _encode_labels(labels):
+    return registry.clip_backend().text_features(labels)
+
+def set_clip_labels(labels):
+    """Switch the CLIP label set; prompts are encoded once, when first needed"""
+    global _label_cache
+    if worker_pool.active:
+        # Forked workers keep their own copy of the label set and would cache
+        # captions for the old labels under the new model version
+        raise RuntimeError("CLIP labels cannot be changed while inference workers are running")
+    labels = list(labels)
+    _label_cache = (labels, None)
+    # Cached results were computed against the old label set
+    result_cache.model_version = model_version()
+
+def get_clip_labels():
+    """Return the currently active CLIP label set"""
+    return list(_label_cache[0])
+
+def _label_features():
+    """Return (labels, normalized text features), encoding the prompts if needed"""
+    global _label_cache
+    labels, text_features = _label_cache
+    if text_features is None:
+        text_features = _encode_labels(labels)
+        # Only publish if the label set didn't change while encoding
+        if _label_cache[0] is labels:
+            _label_cache = (labels, text_features)
+    return labels, text_features
+
+def _deepface_version():
     try:
-        with driver.session() as session:
-            session.run(
-                "MERGE (d:Description {text: $caption}) "
-                "MERGE (p:Person {age: $age, gender: $gender}) "
-                "MERGE (d)-[:DESCRIBES]->(p)",
-                caption=caption, age=age, gender=gender
-            )
+        return importlib.metadata.version("deepface")
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+# Installed packages don't change while the process runs
+DEEPFACE_VERSION = _deepface_version()
+
+def model_version():
+    """Identify the models and label set that produce a result
+
+    Cheap enough (one stat of the age/gender checkpoint) to be recomputed
+    for every batch.
+    """
+    labels_digest = hashlib.sha256("\n".join(_label_cache[0]).encode("utf-8")).hexdigest()[:12]
+    age_gender = registry.age_gender_backend_name
+    if age_gender == "simplecnn" and os.path.exists(AGE_GENDER_MODEL_PATH):
+        # A retrained checkpoint must not be served from results of the previous one
+        age_gender += f"-{int(os.path.getmtime(AGE_GENDER_MODEL_PATH))}"
+    return (
+        f"{registry.clip_model_name}|clip-{registry.clip_backend_name}"
+        f"|deepface-{DEEPFACE_VERSION}|faces-{registry.face_detector_name}"
+        f"|age-gender-{age_gender}|labels-{labels_digest}"
+    )
+
+def embed_and_classify(pixel_values):
+    """Run the CLIP vision tower once; return (labels, normalized float16 embeddings) for the batch"""
+    backend = registry.clip_backend()
+    labels, text_features = _label_features()
+    image_features = backend.image_features(pixel_values)
+    logits = backend.logit_scale * image_features @ text_features.T
+    best = logits.softmax(dim=1).argmax(dim=1).tolist()
+    return [labels[i] for i in best], image_features.numpy().astype(np.float16)
+
+def classify_pixels(pixel_values):
+    """Run only the CLIP vision tower on a preprocessed batch and score it against the cached labels"""
+    return embed_and_classify(pixel_values)[0]
+
+def text_embedding(text):
+    """Normalized CLIP text embedding of a free-text query, for text-to-image search"""
+    return registry.clip_backend().text_features([text])[0].numpy()
+
+def classify_images(images):
+    """Classify a batch of RGB PIL images or arrays against the cached labels"""
+    return classify_pixels(stack_clip_inputs([clip_input(image) for image in images]))
+
+def classify_image(image):
+    """Classify a single image against the cached CLIP labels"""
+    return classify_images([image])[0]
+
+result_cache = ResultCache(model_version=model_version())
+
+def store_metadata_to_neo4j(result):
+    """Queue the image, its label and its faces for the background Neo4j writer"""
+    neo4j_writer.enqueue(metadata_row(result))
+
+def _record_object_key(image_id, object_key):
+    # Called by the image store once the upload exists in the bucket
+    object_key_writer.enqueue({"image_id": image_id, "object_key": object_key})
+
+def store_image(image_id, image_bytes):
+    """Queue an analyzed upload for object storage; its key reaches Neo4j once the upload succeeded"""
+    image_store.put(image_id, image_bytes, on_stored=_record_object_key)
+
+def decode_image(image_bytes):
+    """Decode raw image bytes (resized on decode) into a contiguous BGR uint8 array"""
+    image, _ = decode_rgb_image(image_bytes)
+    return face_input(image)
+
+def detect_faces(image_bgr):
+    """Run the configured face detector (FACE_DETECTOR) on a decoded BGR array"""
+    return registry.face_detector().detect(image_bgr)
+
+def estimate_faces(images_bgr, detections):
+    """Age/gender for every detected face of every image in one batched pass
+
+    `detections` holds, per image, a list of FaceDetection or the exception
+    the detector raised. Returns (primary FaceInfo, tuple of all faces) per
+    image; images without a face never reach the age/gender networks.
+    """
+    crops = [
+        detection.crop(image_bgr)
+        for image_bgr, found in zip(images_bgr, detections) if not isinstance(found, Exception)
+        for detection in found
+    ]
+    try:
+        predictions = iter(registry.age_gender().predict(crops) if crops else ())
+        error = None
     except Exception as e:
-        print(f"Neo4j error: {e}")
+        predictions, error = iter(()), str(e)
 
-def process_image(image_bytes):
+    results = []
+    for found in detections:
+        if isinstance(found, Exception):
+            results.append((FaceInfo(error=str(found)), ()))
+        elif not found:
+            results.append((FaceInfo(error="No face detected"), ()))
+        elif error is not None:
+            results.append((FaceInfo(error=error), ()))
+        else:
+            faces = tuple(
+                FaceInfo.from_deepface({**next(predictions), "region": d.region, "face_confidence": d.confidence})
+                for d in found
+            )
+            results.append((faces[0], faces))
+    return results
+
+def analyze_face(image_bgr):
+    """Detect faces and estimate age/gender of the primary one on a decoded BGR array"""
     try:
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+        found = detect_faces(image_bgr)
+    except Exception as e:
+        found = e
+    return estimate_faces([image_bgr], [found])[0][0]
 
-        # CLIP analysis
-        inputs = clip_processor(text=["a photo", "a person", "a performance"], images=image, return_tensors="pt", padding=True)
-        outputs = clip_model(**inputs)
-        probs = outputs.logits_per_image.softmax(dim=1).tolist()[0]
-        labels = ["a photo", "a person", "a performance"]
-        caption = labels[probs.index(max(probs))]
+def analyze_images(images_bytes, decoded=None):
+    """Run the models on a batch of raw images without any side effects
 
-        # DeepFace analysis - save image to temp file first
-        face_info = {"error": "No face detected"}
+    Returns (results, stage timings): one AnalysisResult and one dict of
+    stage -> seconds per input, in order. Images that fail to decode get an
+    error result instead of failing the whole batch. Timings are plain dicts
+    so they can travel back from a worker process. `decoded` may hold, per
+    image, a PreparedImage (or the exception decoding raised) produced
+    ahead of time, e.g. by a decode thread pool.
+    """
+    results = [None] * len(images_bytes)
+    timings = [Timings(observe=False) for _ in images_bytes]
+    prepared = []
+    for index, image_bytes in enumerate(images_bytes):
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-                image.save(tmp_file.name, 'JPEG')
-                face_result = DeepFace.analyze(img_path=tmp_file.name, actions=['age', 'gender'], enforce_detection=False)
-                face_info = face_result[0] if isinstance(face_result, list) else face_result
-                os.unlink(tmp_file.name)  # Clean up temp file
-                
-                # Validate and improve gender prediction
-                if 'gender' in face_info:
-                    face_info['gender'] = validate_gender_prediction(face_info['gender'])
-                    
+            if decoded is not None:
+                if isinstance(decoded[index], Exception):
+                    raise decoded[index]
+                prepared.append((index, decoded[index]))
+                continue
+            with timings[index].stage("decode"):
+                prepared.append((index, prepare_image(image_bytes)))
         except Exception as e:
-            face_info = {"error": str(e)}
+            results[index] = AnalysisResult.failed(e)
+
+    if prepared:
+        start = time.perf_counter()
+        try:
+            # One batched CLIP forward pass for every decodable image
+            captions, embeddings = embed_and_classify(stack_clip_inputs([image.clip_pixels for _, image in prepared]))
+        except Exception as e:
+            for index, _ in prepared:
+                results[index] = AnalysisResult.failed(e)
+            return results, [t.stages for t in timings]
+        # Every image in the batch waited for the whole batched pass
+        elapsed = time.perf_counter() - start
+        for index, _ in prepared:
+            timings[index].add("clip", elapsed)
+
+        detections = []
+        for index, image in prepared:
+            with timings[index].stage("face_detect"):
+                try:
+                    detections.append(detect_faces(image.bgr))
+                except Exception as e:
+                    detections.append(e)
+
+        # One batched age/gender pass over the faces of every image
+        start = time.perf_counter()
+        faces = estimate_faces([image.bgr for _, image in prepared], detections)
+        elapsed = time.perf_counter() - start
+        for (index, image), caption, embedding, found, (face_info, all_faces) in zip(
+                prepared, captions, embeddings, detections, faces):
+            if found and not isinstance(found, Exception):
+                timings[index].add("face", elapsed)
+            results[index] = AnalysisResult(caption=caption, face_info=face_info, faces=all_faces, embedding=embedding)
+
+    return results, [t.stages for t in timings]
+
+def analyze(images_bytes, decoded=None):
+    """Run `analyze_images` in a worker process when the pool is enabled, else in-process"""
+    if worker_pool.enabled:
+        # Raw bytes are far smaller to send than decoded pixels; workers decode in parallel anyway
+        return worker_pool.run(analyze_images, images_bytes)
+    return analyze_images(images_bytes, decoded)
 
-        # Convert face_info to JSON serializable format
-        face_info = convert_to_json_serializable(face_info)
+def record_result(result):
+    """Persist and log a single analysis result"""
+    IMAGES_PROCESSED.labels("ok" if result.ok else "error").inc()
+    if result.ok:
+        store_metadata_to_neo4j(result)
+    # A failed result is logged as {"image_id", "error"}, so the dashboard counts it as a failed analysis
+    log_analysis(result)
 
-        # Store in Neo4j
-        store_metadata_to_neo4j(caption, face_info.get("age"), face_info.get("gender"))
-        log_metadata(caption, face_info)
+def store_embeddings(results):
+    """Append the CLIP embeddings of freshly analyzed results to the vector store"""
+    if not results or not vector_store.enabled:
+        return
+    try:
+        vector_store.add_many([r.image_id for r in results], np.stack([r.embedding for r in results]))
+    except Exception as e:
+        # Similarity search is best effort; the analysis itself succeeded
+        log_error("Error storing embeddings", {"error": str(e)})
+
+def process_images(images_bytes, timings=None, decoded=None):
+    """Analyze a batch of images, then store and log every result
+
+    Images already in the result cache (and duplicates within the batch)
+    skip inference and the Neo4j write completely. Every result carries
+    the upload's SHA-256 as `image_id`; embeddings of new images are added
+    to the vector store under that id, and every successfully analyzed
+    upload is queued for content-addressed object storage. `timings` is an optional
+    list with one app.utils.metrics.Timings (or None) per image that
+    receives the per-stage durations; `decoded` optionally holds images
+    decoded ahead of time (see `analyze_images`).
+    """
+    if timings is None:
+        timings = [None] * len(images_bytes)
+    timings = [t if t is not None else Timings() for t in timings]
+    # A retrained checkpoint or a new label set must never be served from older cache keys
+    result_cache.model_version = model_version()
+
+    results = [None] * len(images_bytes)
+    misses = {}  # primary cache key -> (image id, all keys, indices of that image in the batch)
+    for index, image_bytes in enumerate(images_bytes):
+        with timings[index].stage("cache_lookup"):
+            image_id = content_hash(image_bytes)
+            keys = result_cache.keys_for(image_bytes, digest=image_id)
+            cached = result_cache.get(keys)
+        if cached is not None:
+            if cached.image_id != image_id:
+                # A perceptual-hash hit belongs to a different upload of the same picture
+                cached = replace(cached, image_id=image_id, _json=None)
+            # Only cached after a successful analysis; exact repeats are deduplicated by the store
+            store_image(image_id, image_bytes)
+            results[index] = cached
+            with timings[index].stage("record"):
+                log_analysis(cached)
+            continue
+        misses.setdefault(keys[0], (image_id, keys, []))[2].append(index)
+
+    if misses:
+        pending = list(misses.values())
+        analyzed, stages = analyze(
+            [images_bytes[indices[0]] for _, _, indices in pending],
+            [decoded[indices[0]] for _, _, indices in pending] if decoded is not None else None
+        )
+        embedded = []
+        for (image_id, keys, indices), result, image_stages in zip(pending, analyzed, stages):
+            # Set before the result is encoded, cached or shared
+            result.image_id = image_id
+            for index in indices:
+                timings[index].merge(image_stages)
+            with timings[indices[0]].stage("record"):
+                record_result(result)
+            if result.ok:
+                store_image(image_id, images_bytes[indices[0]])
+                result_cache.put(keys, result)
+                if result.embedding is not None:
+                    embedded.append(result)
+            # Results are never mutated after this point, so duplicates can share one
+            for index in indices:
+                results[index] = result
+        store_embeddings(embedded)
+
+    return results
 
-        return {
-            "caption": caption,
-            "face_info": face_info
-        }
+def _warm_up_face():
+    # A flat image has no face, so the age/gender models are warmed up directly
+    image = np.full((224, 224, 3), 127, dtype=np.uint8)
+    detect_faces(image)
+    registry.age_gender().predict([image])
+
+def warm_up():
+    """Load every model and run a dummy batch so the first request pays no load/allocation cost
+
+    With a worker pool, only the PyTorch models are loaded here before the
+    workers are forked; DeepFace (TensorFlow) is warmed up inside each worker.
+    """
+    registry.clip_backend()
+    _label_features()
+    classify_images([np.full((224, 224, 3), 127, dtype=np.uint8)])
+    if worker_pool.enabled:
+        worker_pool.start(warm_up=_warm_up_face)
+    else:
+        _warm_up_face()
+
+def process_image(image_bytes):
+    try:
+        return process_images([image_bytes])[0]
     except Exception as e:
-        error_info = {"error": str(e)}
-        log_metadata("Error processing image", error_info)
-        return error_info
+        log_error("Error processing image", {"error": str(e)})
+        return AnalysisResult.failed(e)
@@ -0,0 +1,141 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.utils.serialization import dumps, to_builtin
+
+
+def validate_gender_prediction(gender_data, confidence_threshold=0.7):
+    """Validate and potentially correct gender predictions"""
+    if not isinstance(gender_data, dict):
+        return gender_data
+    
+    # Check if we have confidence values
+    if 'Woman' in gender_data and 'Man' in gender_data:
+        woman_conf = float(gender_data['Woman'])
+        man_conf = float(gender_data['Man'])
+        
+        # If confidence difference is small, mark as uncertain
+        if abs(woman_conf - man_conf) < 20:  # Less than 20% difference
+            return {
+                "Woman": woman_conf,
+                "Man": man_conf,
+                "dominant_gender": "Uncertain",
+                "confidence_difference": abs(woman_conf - man_conf)
+            }
+        
+        # If confidence is too low, mark as uncertain
+        max_conf = max(woman_conf, man_conf)
+        if max_conf < confidence_threshold * 100:
+            return {
+                "Woman": woman_conf,
+                "Man": man_conf,
+                "dominant_gender": "Low_Confidence",
+                "max_confidence": max_conf
+            }
+    
+    return gender_data
+
+
+def _without_none(values):
+    return {key: value for key, value in values.items() if value is not None}
+
+
+@dataclass(slots=True)
+class FaceInfo:
+    """Age/gender estimate for one face, holding only plain Python types"""
+
+    age: Optional[float] = None
+    gender: Optional[dict] = None
+    dominant_gender: Optional[str] = None
+    face_confidence: Optional[float] = None
+    region: Optional[dict] = None
+    error: Optional[str] = None
+
+    @classmethod
+    def from_deepface(cls, raw):
+        """Build from one DeepFace.analyze entry, converting NumPy values once, here"""
+        raw = to_builtin(raw)
+        return cls(
+            age=raw.get("age"),
+            gender=validate_gender_prediction(raw.get("gender")),
+            dominant_gender=raw.get("dominant_gender"),
+            face_confidence=raw.get("face_confidence"),
+            region=raw.get("region")
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data.get(name) for name in cls.__dataclass_fields__})
+
+    @property
+    def gender_label(self):
+        """Single gender label; validate_gender_prediction may override DeepFace's own verdict"""
+        if isinstance(self.gender, dict):
+            return self.gender.get("dominant_gender") or self.dominant_gender
+        return self.gender if self.gender is not None else self.dominant_gender
+
+    def to_dict(self):
+        return _without_none({
+            "age": self.age,
+            "gender": self.gender,
+            "dominant_gender": self.dominant_gender,
+            "face_confidence": self.face_confidence,
+            "region": self.region,
+            "error": self.error
+        })
+
+
+@dataclass(slots=True)
+class AnalysisResult:
+    """Outcome of analyzing one image
+
+    `image_id` is the SHA-256 of the upload. `faces` holds one FaceInfo per
+    detected face, largest first; `face_info` is the primary (largest)
+    face, or an error entry when no face was found. `embedding` is the
+    normalized CLIP image embedding (float16); it is kept for the vector
+    store and never serialized. The JSON encoding is produced once
+    (`to_json`) and reused for the HTTP response, the NDJSON stream and
+    the log line.
+    """
+
+    caption: Optional[str] = None
+    face_info: Optional[FaceInfo] = None
+    faces: tuple = ()
+    error: Optional[str] = None
+    image_id: Optional[str] = None
+    embedding: Optional[object] = field(default=None, repr=False, compare=False)
+    _json: Optional[bytes] = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def failed(cls, error):
+        return cls(error=str(error))
+
+    @classmethod
+    def from_dict(cls, data):
+        face_info = data.get("face_info")
+        return cls(
+            caption=data.get("caption"),
+            face_info=FaceInfo.from_dict(face_info) if isinstance(face_info, dict) else None,
+            faces=tuple(FaceInfo.from_dict(face) for face in data.get("faces") or () if isinstance(face, dict)),
+            error=data.get("error"),
+            image_id=data.get("image_id")
+        )
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def to_dict(self):
+        if self.error is not None:
+            return _without_none({"image_id": self.image_id, "error": self.error})
+        return {
+            "image_id": self.image_id,
+            "caption": self.caption,
+            "face_info": self.face_info.to_dict() if self.face_info is not None else None,
+            "faces": [face.to_dict() for face in self.faces]
+        }
+
+    def to_json(self):
+        if self._json is None:
+            self._json = dumps(self.to_dict())
+        return self._json
@@ -0,0 +1,155 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "8"))
+MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "20"))
+MAX_QUEUE_SIZE = int(os.getenv("INFERENCE_MAX_QUEUE_SIZE", "64"))
+MAX_CONCURRENT_BATCHES = int(os.getenv("INFERENCE_MAX_CONCURRENT_BATCHES", "1"))
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue cannot accept more requests"""
+
+
+class InferenceScheduler:
+    """Collect single-image requests into micro-batches for the models
+
+    Requests are queued, a worker gathers them until either `max_batch_size`
+    items are waiting or `max_wait_ms` has passed since the first one, runs
+    `process_batch` once for the whole batch in a worker thread and resolves
+    every request's future with its own result.
+
+    Up to `max_concurrent_batches` batches run at the same time. Keep it at 1
+    when the models run in this process; raise it to the number of inference
+    worker processes when batches are dispatched to a worker pool.
+    """
+
+    def __init__(self, process_batch, max_batch_size=MAX_BATCH_SIZE,
+                 max_wait_ms=MAX_WAIT_MS, max_queue_size=MAX_QUEUE_SIZE,
+                 max_concurrent_batches=MAX_CONCURRENT_BATCHES):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_queue_size = max_queue_size
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        self._queue = None
+        self._worker = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrent_batches, thread_name_prefix="inference"
+        )
+
+    async def start(self):
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        # Fail whatever is still waiting instead of leaving callers hanging
+        while not self._queue.empty():
+            _, future, _, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Inference scheduler stopped"))
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, image_bytes, timings=None):
+        """Queue an image and return a future for its result
+
+        `timings` (an app.utils.metrics.Timings) receives the time spent
+        waiting in the queue and is passed on to `process_batch`.
+        """
+        if self._queue is None:
+            raise RuntimeError("Inference scheduler is not running")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        try:
+            self._queue.put_nowait((image_bytes, future, timings, loop.time()))
+        except asyncio.QueueFull:
+            raise QueueFullError("Inference queue is full")
+        return future
+
+    async def submit_when_ready(self, image_bytes, timings=None, retry_interval=0.05):
+        """Queue an image, waiting for free queue space instead of failing, and await its result"""
+        while True:
+            try:
+                future = self.submit(image_bytes, timings)
+                break
+            except QueueFullError:
+                await asyncio.sleep(retry_interval)
+        return await future
+
+    async def _collect_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        slots = asyncio.Semaphore(self.max_concurrent_batches)
+        running = set()
+
+        def finished(task):
+            running.discard(task)
+            slots.release()
+
+        try:
+            while True:
+                # Only start collecting once a slot is free, so batches fill up while all are busy
+                await slots.acquire()
+                try:
+                    batch = await self._collect_batch()
+                except BaseException:
+                    slots.release()
+                    raise
+                # Drop requests whose clients already went away
+                batch = [item for item in batch if not item[1].cancelled()]
+                if not batch:
+                    slots.release()
+                    continue
+                task = asyncio.create_task(self._process(batch))
+                running.add(task)
+                task.add_done_callback(finished)
+        finally:
+            for task in list(running):
+                task.cancel()
+
+    async def _process(self, batch):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        timings = []
+        for _, _, item_timings, enqueued_at in batch:
+            if item_timings is not None:
+                item_timings.add("queue_wait", started - enqueued_at)
+            timings.append(item_timings)
+        try:
+            results = await loop.run_in_executor(
+                self._executor, self.process_batch, [item[0] for item in batch], timings
+            )
+        except Exception as e:
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
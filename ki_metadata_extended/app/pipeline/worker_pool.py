@@ -0,0 +1,134 @@
+import gc
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from threading import BrokenBarrierError
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))
+INFERENCE_THREADS_PER_WORKER = int(os.getenv("INFERENCE_THREADS_PER_WORKER", "0"))
+INFERENCE_WORKER_START_TIMEOUT = float(os.getenv("INFERENCE_WORKER_START_TIMEOUT", "600"))
+
+
+def default_threads_per_worker(workers):
+    """Split the available cores evenly so workers don't oversubscribe the CPU"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    return max(1, cpus // max(1, workers))
+
+
+def _init_worker(threads, warm_up, ready):
+    # Let the parent handle Ctrl+C and shut the pool down in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # TensorFlow (DeepFace) is imported after the fork and reads these on import
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"):
+        os.environ[name] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Already fixed by the parent before the fork
+        pass
+
+    # In the initializer, so every worker warms up exactly once before taking work
+    if warm_up is not None:
+        try:
+            warm_up()
+        except BaseException:
+            # Fail the start-up right away instead of letting the parent time out
+            ready.abort()
+            raise
+    ready.wait(INFERENCE_WORKER_START_TIMEOUT)
+
+
+def _ping():
+    return os.getpid()
+
+
+class InferenceWorkerPool:
+    """Pool of forked inference processes that share the parent's model weights
+
+    The parent loads the PyTorch models first and then forks, so every worker
+    maps the same weight pages copy-on-write instead of holding its own copy.
+    `gc.freeze()` moves the already-loaded objects out of the garbage
+    collector's reach, so collections in the workers don't touch (and copy)
+    those pages. TensorFlow is not fork-safe, so DeepFace must only be
+    imported inside the workers.
+    """
+
+    def __init__(self, workers=INFERENCE_WORKERS, threads_per_worker=INFERENCE_THREADS_PER_WORKER):
+        self.workers = max(0, workers)
+        self.threads_per_worker = threads_per_worker or default_threads_per_worker(self.workers)
+        self._executor = None
+        self._started = threading.Event()
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    @property
+    def active(self):
+        return self._executor is not None
+
+    def start(self, warm_up=None):
+        """Fork the workers; call this only after the shared models are loaded
+
+        `warm_up` runs once in every worker before it accepts work (models
+        that must not be loaded before the fork, like DeepFace); this
+        returns only when all workers have finished it.
+        """
+        if not self.enabled or self._executor is not None:
+            return
+        gc.collect()
+        gc.freeze()
+        context = multiprocessing.get_context("fork")
+        # Every worker plus this process; passed once all workers are warmed up
+        ready = context.Barrier(self.workers + 1)
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker, warm_up, ready)
+        )
+        # With fork, the first submit starts all workers at once, not on first use
+        pings = [executor.submit(_ping) for _ in range(self.workers)]
+        try:
+            ready.wait(INFERENCE_WORKER_START_TIMEOUT)
+        except BrokenBarrierError:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise RuntimeError("Inference workers did not finish warming up")
+        wait(pings)
+        self._executor = executor
+        self._started.set()
+        print(f"Started {self.workers} inference workers with {self.threads_per_worker} threads each")
+
+    def run(self, fn, *args):
+        """Run `fn(*args)` in a worker process and return its result
+
+        Requests that arrive while the workers are still being started wait
+        for them; running them in the parent would import TensorFlow before
+        the fork.
+        """
+        if not self._started.wait(INFERENCE_WORKER_START_TIMEOUT) or self._executor is None:
+            raise RuntimeError("Inference workers are not running")
+        return self._executor.submit(fn, *args).result()
+
+    def pids(self):
+        """Process ids of the running workers"""
+        if self._executor is None:
+            return []
+        # ProcessPoolExecutor has no public accessor for its processes
+        return list(getattr(self._executor, "_processes", None) or {})
+
+    def stop(self):
+        if self._executor is not None:
+            self._started.clear()
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+worker_pool = InferenceWorkerPool()
@@ -0,0 +1,82 @@
+# Read-only aggregates over the metadata graph (see SCHEMA_STATEMENTS in
+# neo4j_writer). Label lookups go through the label_name constraint's
+# index; per-label image counts come from the relationship degree, not
+# from scanning images.
+LABEL_COUNTS_QUERY = (
+    "MATCH (l:Label) "
+    "WITH l, COUNT { (l)<-[:HAS_LABEL]-(:Image) } AS images "
+    "WHERE images > 0 "
+    "RETURN l.name AS label, images "
+    "ORDER BY images DESC, label "
+    "LIMIT $limit"
+)
+
+# Filtering on a label is a separate pattern (not "$label IS NULL OR ...")
+# so the planner can use the unique index
+ONE_LABEL = "MATCH (l:Label {name: $label}) "
+ALL_LABELS = "MATCH (l:Label) "
+
+AGE_DISTRIBUTION_QUERY = (
+    "MATCH (l)<-[:HAS_LABEL]-(:Image)-[:HAS_FACE]->(f:Face) "
+    "WHERE f.age IS NOT NULL "
+    "WITH l.name AS label, toInteger(f.age / $bucket) * $bucket AS age "
+    "RETURN label, age, count(*) AS faces "
+    "ORDER BY label, age"
+)
+
+GENDER_COUNTS_QUERY = (
+    "MATCH (l)<-[:HAS_LABEL]-(:Image)-[:HAS_FACE]->(f:Face) "
+    "WHERE f.gender IS NOT NULL "
+    "RETURN l.name AS label, f.gender AS gender, count(*) AS faces "
+    "ORDER BY label, faces DESC"
+)
+
+
+class GraphAnalytics:
+    """Parameterized aggregate queries for the /analytics endpoints
+
+    `driver` may be any object with a neo4j-style `session()` context
+    manager whose `run(query, **parameters)` returns an object with
+    `data()`, so tests can use a fake driver. By default the Neo4j
+    writer's driver (and its connection pool) is shared.
+    """
+
+    def __init__(self, driver=None):
+        self._driver = driver
+
+    @property
+    def driver(self):
+        if self._driver is None:
+            from app.storage.neo4j_writer import neo4j_writer
+
+            self._driver = neo4j_writer.driver
+        return self._driver
+
+    def _query(self, query, **parameters):
+        with self.driver.session() as session:
+            return session.run(query, **parameters).data()
+
+    def label_counts(self, limit=50):
+        """Images per CLIP label, most frequent first"""
+        return self._query(LABEL_COUNTS_QUERY, limit=limit)
+
+    def age_distribution(self, label=None, bucket=10):
+        """Faces per age bucket (lower bound, `bucket` years wide) per label, or for one label"""
+        match = ONE_LABEL if label is not None else ALL_LABELS
+        rows = self._query(match + AGE_DISTRIBUTION_QUERY, label=label, bucket=bucket)
+        distribution = {}
+        for row in rows:
+            distribution.setdefault(row["label"], []).append({"age": row["age"], "faces": row["faces"]})
+        return distribution
+
+    def gender_counts(self, label=None):
+        """Faces per gender label per CLIP label, or for one label"""
+        match = ONE_LABEL if label is not None else ALL_LABELS
+        rows = self._query(match + GENDER_COUNTS_QUERY, label=label)
+        counts = {}
+        for row in rows:
+            counts.setdefault(row["label"], {})[row["gender"]] = row["faces"]
+        return counts
+
+
+graph_analytics = GraphAnalytics()
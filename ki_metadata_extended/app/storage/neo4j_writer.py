@@ -0,0 +1,374 @@
+import json
+import os
+import queue
+import threading
+import time
+
+from neo4j import GraphDatabase
+from neo4j.exceptions import ClientError
+
+from app.utils.metrics import NEO4J_FLUSH_SECONDS
+
+NEO4J_URI = os.getenv("NEO4J_URI", "bolt://neo4j:7687")
+NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
+NEO4J_PASS = os.getenv("NEO4J_PASS", "password")
+
+NEO4J_BATCH_SIZE = int(os.getenv("NEO4J_BATCH_SIZE", "500"))
+NEO4J_FLUSH_INTERVAL = float(os.getenv("NEO4J_FLUSH_INTERVAL", "1.0"))
+NEO4J_MAX_QUEUE_SIZE = int(os.getenv("NEO4J_MAX_QUEUE_SIZE", "10000"))
+NEO4J_MAX_RETRIES = int(os.getenv("NEO4J_MAX_RETRIES", "5"))
+NEO4J_SPILL_PATH = os.getenv("NEO4J_SPILL_PATH", "/logs/neo4j_spill.jsonl")
+
+# Graph model, one row per analyzed image:
+#   (:Image {id, object_key, caption, face_count, analyzed_at})
+#   (:Image)-[:HAS_LABEL]->(:Label {name})
+#   (:Image)-[:HAS_FACE]->(:Face {id, index, age, gender, gender_woman, gender_man, confidence, x, y, w, h})
+# Image ids are the SHA-256 of the upload; a face id is "<image id>:<index>".
+# Every property is a scalar so it can be indexed and filtered on.
+SCHEMA_STATEMENTS = (
+    "CREATE CONSTRAINT image_id IF NOT EXISTS FOR (i:Image) REQUIRE i.id IS UNIQUE",
+    "CREATE CONSTRAINT face_id IF NOT EXISTS FOR (f:Face) REQUIRE f.id IS UNIQUE",
+    "CREATE CONSTRAINT label_name IF NOT EXISTS FOR (l:Label) REQUIRE l.name IS UNIQUE",
+    "CREATE INDEX face_age IF NOT EXISTS FOR (f:Face) ON (f.age)",
+    "CREATE INDEX face_gender IF NOT EXISTS FOR (f:Face) ON (f.gender)",
+    "CREATE INDEX image_analyzed_at IF NOT EXISTS FOR (i:Image) ON (i.analyzed_at)",
+)
+
+METADATA_QUERY = (
+    "UNWIND $rows AS row "
+    "MERGE (i:Image {id: row.image_id}) "
+    "SET i.caption = row.caption, i.face_count = size(row.faces), i.analyzed_at = datetime() "
+    # A re-analysis (e.g. with another label set) replaces the label and faces
+    "WITH i, row "
+    "CALL { WITH i OPTIONAL MATCH (i)-[old:HAS_LABEL]->(:Label) DELETE old } "
+    "CALL { WITH i OPTIONAL MATCH (i)-[:HAS_FACE]->(old:Face) DETACH DELETE old } "
+    "FOREACH (name IN CASE WHEN row.caption IS NULL THEN [] ELSE [row.caption] END | "
+    "  MERGE (l:Label {name: name}) MERGE (i)-[:HAS_LABEL]->(l)) "
+    "FOREACH (face IN row.faces | "
+    "  MERGE (f:Face {id: row.image_id + ':' + toString(face.index)}) "
+    "  SET f += face "
+    "  MERGE (i)-[:HAS_FACE]->(f))"
+)
+
+# Written once the upload is in object storage; either query may create the Image node
+OBJECT_KEY_QUERY = (
+    "UNWIND $rows AS row "
+    "MERGE (i:Image {id: row.image_id}) "
+    "SET i.object_key = row.object_key"
+)
+
+
+def metadata_row(result):
+    """Flatten an AnalysisResult into one METADATA_QUERY row of plain, indexable values"""
+    faces = []
+    for index, face in enumerate(result.faces):
+        scores = face.gender if isinstance(face.gender, dict) else {}
+        region = face.region or {}
+        faces.append({key: value for key, value in {
+            "index": index,
+            "age": face.age,
+            "gender": face.gender_label,
+            "gender_woman": scores.get("Woman"),
+            "gender_man": scores.get("Man"),
+            "confidence": face.face_confidence,
+            "x": region.get("x"),
+            "y": region.get("y"),
+            "w": region.get("w"),
+            "h": region.get("h")
+        }.items() if value is not None})
+    return {"image_id": result.image_id, "caption": result.caption, "faces": faces}
+
+
+def create_driver():
+    return GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASS))
+
+
+class Neo4jWriter:
+    """Background writer that batches metadata rows into UNWIND queries
+
+    Rows are queued by `enqueue` and written by a daemon thread whenever
+    `batch_size` rows are waiting or `flush_interval` seconds have passed.
+    Failed writes are retried with exponential backoff; rows that still
+    cannot be written (or that arrive while the queue is full) are appended
+    to a JSON Lines spill file and replayed once Neo4j accepts writes again.
+
+    The constraints and indexes in `schema` are created (idempotently)
+    when the writer thread starts and, until that succeeds, before each
+    write, so MERGEs are index lookups from the first row on.
+
+    `driver` may be any object with a neo4j-style `session()` context
+    manager, which is how tests can run against a fake driver.
+    """
+
+    def __init__(self, driver=None, query=METADATA_QUERY, schema=SCHEMA_STATEMENTS, batch_size=NEO4J_BATCH_SIZE,
+                 flush_interval=NEO4J_FLUSH_INTERVAL, max_queue_size=NEO4J_MAX_QUEUE_SIZE,
+                 max_retries=NEO4J_MAX_RETRIES, backoff_base=0.5, backoff_max=30.0,
+                 spill_path=NEO4J_SPILL_PATH):
+        self._driver = driver
+        self.query = query
+        self.schema = tuple(schema)
+        self._schema_ready = not self.schema
+        self._schema_lock = threading.Lock()
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_retries = max(1, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.spill_path = spill_path
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        # While Neo4j is known to be down, batches get one attempt before spilling
+        self._healthy = True
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.rows_spilled = 0
+        self.rows_replayed = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.last_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    @property
+    def driver(self):
+        if self._driver is None:
+            self._driver = create_driver()
+        return self._driver
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="neo4j-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Stop the writer thread after flushing everything that is queued"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def enqueue(self, row):
+        """Queue one row for the next bulk write without blocking the caller"""
+        self.start()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # Keep the request path non-blocking; the row is replayed later
+            self._spill([row])
+
+    def flush(self):
+        """Write everything queued right now and wait for the batch the writer thread holds
+
+        On return every row enqueued before the call has been written to
+        Neo4j or spilled to disk, so callers can use it as a barrier (the
+        batch runner does before each checkpoint).
+        """
+        while True:
+            rows = self._drain(self.batch_size)
+            if not rows:
+                break
+            self._write_batch(rows)
+        # Rows the writer thread took off the queue count as unfinished until written
+        self._queue.join()
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "rows_spilled": self.rows_spilled,
+            "rows_replayed": self.rows_replayed,
+            "spill_pending": self._spill_exists(),
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "last_flush_seconds": self.last_flush_seconds,
+            "avg_flush_seconds": self.total_flush_seconds / self.flushes if self.flushes else 0.0,
+            "healthy": self._healthy
+        }
+
+    def _drain(self, limit):
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def ensure_schema(self):
+        """Create the constraints and indexes; returns False if Neo4j is unreachable"""
+        try:
+            self._apply_schema()
+        except Exception as e:
+            print(f"Neo4j schema error: {e}")
+            return False
+        return True
+
+    def _apply_schema(self):
+        if self._schema_ready:
+            return
+        # The writer thread and flush() may both get here first
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            try:
+                with self.driver.session() as session:
+                    for statement in self.schema:
+                        result = session.run(statement)
+                        if hasattr(result, "consume"):
+                            result.consume()
+            except ClientError as e:
+                # Usually existing data that violates a constraint; writes still work without it
+                print(f"Neo4j schema error: {e}")
+            self._schema_ready = True
+
+    def _run(self):
+        self.ensure_schema()
+        while not self._stop.is_set():
+            try:
+                rows = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                self._replay_spill()
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    rows.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if self._write_batch(rows):
+                self._replay_spill()
+        self.flush()
+
+    def _write_batch(self, rows):
+        """Write rows taken off the queue, then mark them done for `flush`"""
+        try:
+            return self._write(rows)
+        finally:
+            for _ in rows:
+                self._queue.task_done()
+
+    def _run_query(self, rows):
+        self._apply_schema()
+        with self.driver.session() as session:
+            result = session.run(self.query, rows=rows)
+            if hasattr(result, "consume"):
+                result.consume()
+
+    def _write(self, rows, spill_on_failure=True):
+        """Write one batch with retries; returns True when it reached Neo4j"""
+        attempts = self.max_retries if self._healthy else 1
+        for attempt in range(attempts):
+            start = time.perf_counter()
+            try:
+                self._run_query(rows)
+            except ClientError as e:
+                # The query or data is invalid - retrying or replaying cannot help
+                self.flush_errors += 1
+                self.rows_failed += len(rows)
+                print(f"Neo4j error: {e}")
+                return False
+            except Exception as e:
+                self.flush_errors += 1
+                print(f"Neo4j error (attempt {attempt + 1}/{attempts}): {e}")
+                if attempt + 1 < attempts and not self._stop.wait(self._backoff(attempt)):
+                    continue
+                break
+            else:
+                elapsed = time.perf_counter() - start
+                self.flushes += 1
+                self.last_flush_seconds = elapsed
+                self.total_flush_seconds += elapsed
+                NEO4J_FLUSH_SECONDS.observe(elapsed)
+                self.rows_written += len(rows)
+                self._healthy = True
+                return True
+
+        self._healthy = False
+        if spill_on_failure:
+            self._spill(rows)
+        return False
+
+    def _backoff(self, attempt):
+        return min(self.backoff_max, self.backoff_base * (2 ** attempt))
+
+    def _spill(self, rows):
+        if not self.spill_path:
+            self.rows_failed += len(rows)
+            return
+        with self._spill_lock:
+            try:
+                os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    for row in rows:
+                        f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                self.rows_spilled += len(rows)
+            except (OSError, TypeError, ValueError) as e:
+                self.rows_failed += len(rows)
+                print(f"Neo4j spill error: {e}")
+
+    def _spill_exists(self):
+        return bool(self.spill_path) and (
+            os.path.exists(self.spill_path) or os.path.exists(self.spill_path + ".replay")
+        )
+
+    def _replay_spill(self):
+        """Write spilled rows back to Neo4j once it accepts writes again"""
+        if not self._spill_exists():
+            return
+        replay_path = self.spill_path + ".replay"
+        with self._spill_lock:
+            # Move the spill file aside so new spills don't interleave with the replay
+            if not os.path.exists(replay_path):
+                try:
+                    os.replace(self.spill_path, replay_path)
+                except FileNotFoundError:
+                    return
+
+        try:
+            with open(replay_path, "r", encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError) as e:
+            print(f"Neo4j spill replay error: {e}")
+            return
+
+        for start in range(0, len(rows), self.batch_size):
+            if self._stop.is_set() or not self._write(rows[start:start + self.batch_size], spill_on_failure=False):
+                # Keep whatever was not written for the next attempt
+                self._rewrite_replay(replay_path, rows[start:])
+                return
+            self.rows_replayed += len(rows[start:start + self.batch_size])
+
+        try:
+            os.unlink(replay_path)
+        except OSError:
+            pass
+
+    def _rewrite_replay(self, replay_path, rows):
+        tmp_path = replay_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, replay_path)
+        except OSError as e:
+            print(f"Neo4j spill replay error: {e}")
+
+
+neo4j_writer = Neo4jWriter()
+object_key_writer = Neo4jWriter(
+    query=OBJECT_KEY_QUERY, schema=(),
+    spill_path=f"{os.path.splitext(NEO4J_SPILL_PATH)[0]}_object_keys.jsonl" if NEO4J_SPILL_PATH else ""
+)
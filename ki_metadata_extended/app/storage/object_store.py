@@ -0,0 +1,303 @@
+import io
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "http://minio:9000")
+S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY", "minioadmin")
+S3_SECRET_KEY = os.getenv("S3_SECRET_KEY", "minioadmin")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32"))
+
+
+def create_s3_client(max_pool_connections=S3_MAX_POOL_CONNECTIONS):
+    """boto3 S3 client for MinIO (or any S3-compatible store)
+
+    boto3 clients are thread-safe; one client with a connection pool sized
+    for the number of threads using it is shared instead of one per call.
+    """
+    import boto3
+    from botocore.config import Config
+
+    return boto3.client(
+        "s3",
+        endpoint_url=S3_ENDPOINT_URL or None,
+        aws_access_key_id=S3_ACCESS_KEY,
+        aws_secret_access_key=S3_SECRET_KEY,
+        region_name=S3_REGION,
+        config=Config(max_pool_connections=max_pool_connections, retries={"max_attempts": 5, "mode": "adaptive"})
+    )
+
+
+def parse_s3_url(url):
+    """'s3://bucket/some/prefix' -> ('bucket', 'some/prefix')"""
+    bucket, _, prefix = url[len("s3://"):].partition("/")
+    if not bucket:
+        raise ValueError(f"Missing bucket in {url}")
+    return bucket, prefix
+
+
+IMAGE_STORE_BUCKET = os.getenv("IMAGE_STORE_BUCKET", "images")
+IMAGE_STORE_UPLOAD_THREADS = int(os.getenv("IMAGE_STORE_UPLOAD_THREADS", "4"))
+IMAGE_STORE_MAX_PENDING_BYTES = int(os.getenv("IMAGE_STORE_MAX_PENDING_BYTES", str(256 * 1024 * 1024)))
+IMAGE_STORE_MULTIPART_THRESHOLD = int(os.getenv("IMAGE_STORE_MULTIPART_THRESHOLD", str(8 * 1024 * 1024)))
+IMAGE_STORE_MULTIPART_CHUNKSIZE = int(os.getenv("IMAGE_STORE_MULTIPART_CHUNKSIZE", str(8 * 1024 * 1024)))
+IMAGE_STORE_STREAM_CHUNK = int(os.getenv("IMAGE_STORE_STREAM_CHUNK", str(64 * 1024)))
+
+# Keys of recently stored objects; repeats skip the HEAD request entirely
+_KNOWN_KEYS_MAX = 100000
+
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+)
+
+
+def image_content_type(data):
+    """MIME type from the leading magic bytes; uploads' own content types are not trusted"""
+    for signature, content_type in _SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def _error_code(error):
+    """S3 error code of a botocore ClientError (or a fake raising something shaped like one)"""
+    return str(getattr(error, "response", {}).get("Error", {}).get("Code", ""))
+
+
+def _is_missing(error):
+    return _error_code(error) in ("404", "NoSuchKey", "NotFound", "NoSuchBucket")
+
+
+class ImageStore:
+    """Content-addressed storage of uploaded images in MinIO/S3
+
+    Objects are keyed by the SHA-256 of their bytes (`sha256/ab/abcd...`),
+    so the same image is stored once however often it is uploaded. `put`
+    only queues the bytes; daemon threads upload them through one pooled
+    client, skipping objects that already exist (HEAD) and switching to a
+    multipart upload above `multipart_threshold`. Until an upload finishes,
+    `open` serves the queued bytes, so an image is readable right away.
+    Queued bytes are capped at `max_pending_bytes`; beyond that, images are
+    not stored rather than blocking the caller. `on_stored(image_id, key)`
+    runs on an upload thread once the object exists in the bucket, which
+    is when its key may be recorded elsewhere.
+
+    `client` may be any object with the boto3 S3 client methods used here
+    (head_bucket, create_bucket, head_object, upload_fileobj, get_object),
+    which is how tests can run against moto or an in-memory fake.
+    """
+
+    def __init__(self, client=None, bucket=IMAGE_STORE_BUCKET, upload_threads=IMAGE_STORE_UPLOAD_THREADS,
+                 max_pending_bytes=IMAGE_STORE_MAX_PENDING_BYTES, multipart_threshold=IMAGE_STORE_MULTIPART_THRESHOLD,
+                 multipart_chunksize=IMAGE_STORE_MULTIPART_CHUNKSIZE):
+        self._client = client
+        self.bucket = bucket
+        self.upload_threads = max(1, upload_threads)
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.max_pending_bytes = max_pending_bytes
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._client_lock = threading.Lock()
+        self._bucket_ready = False
+        # key -> bytes for uploads that are queued or running
+        self._pending = {}
+        self._pending_bytes = 0
+        self._known = OrderedDict()
+        self.uploads = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.errors = 0
+        self.bytes_uploaded = 0
+
+    @property
+    def enabled(self):
+        return bool(self.bucket)
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    # Every upload thread, plus the parts of multipart uploads, shares this pool
+                    self._client = create_s3_client(
+                        max_pool_connections=max(S3_MAX_POOL_CONNECTIONS, self.upload_threads * 4)
+                    )
+        return self._client
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    @staticmethod
+    def key_for(image_id):
+        return f"sha256/{image_id[:2]}/{image_id}"
+
+    def start(self):
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.upload_threads:
+                thread = threading.Thread(target=self._run, name=f"image-store-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=30.0):
+        """Finish the queued uploads, then stop the upload threads"""
+        if not self._threads:
+            return
+        self.flush(timeout)
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def flush(self, timeout=30.0):
+        """Wait until every queued upload has finished (or failed)"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def put(self, image_id, data, on_stored=None):
+        """Queue an image for upload without blocking; returns False if it is not going to be stored
+
+        `on_stored` is not called for images stored (or queued) before.
+        """
+        if not self.enabled:
+            return False
+        key = self.key_for(image_id)
+        with self._lock:
+            if key in self._known or key in self._pending:
+                self.deduplicated += key in self._known
+                return True
+            if self._pending_bytes + len(data) > self.max_pending_bytes:
+                # Keep the request path non-blocking; the image is simply not kept
+                self.dropped += 1
+                return False
+            self._pending[key] = data
+            self._pending_bytes += len(data)
+        self.start()
+        self._queue.put((image_id, key, on_stored))
+        return True
+
+    def open(self, image_id, chunk_size=IMAGE_STORE_STREAM_CHUNK):
+        """(chunk iterator, content type, length) of a stored image; KeyError if it does not exist
+
+        The object body is streamed from the store chunk by chunk, never
+        read into memory as a whole.
+        """
+        key = self.key_for(image_id)
+        with self._lock:
+            data = self._pending.get(key)
+        if data is not None:
+            return iter((data,)), image_content_type(data), len(data)
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+        except Exception as e:
+            if _is_missing(e):
+                raise KeyError(image_id) from e
+            raise
+        body = response["Body"]
+
+        def chunks():
+            try:
+                yield from body.iter_chunks(chunk_size)
+            finally:
+                body.close()
+
+        return chunks(), response.get("ContentType") or "application/octet-stream", response.get("ContentLength")
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "bucket": self.bucket,
+            "queue_depth": self.queue_depth,
+            "pending_bytes": self._pending_bytes,
+            "uploads": self.uploads,
+            "deduplicated": self.deduplicated,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "bytes_uploaded": self.bytes_uploaded
+        }
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._upload(*item)
+            finally:
+                self._queue.task_done()
+
+    def _ensure_bucket(self):
+        if self._bucket_ready:
+            return
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except Exception as e:
+            if not _is_missing(e):
+                raise
+            try:
+                self.client.create_bucket(Bucket=self.bucket)
+            except Exception as e:
+                # Another thread or process created it first
+                if _error_code(e) not in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+                    raise
+        self._bucket_ready = True
+
+    def _upload(self, image_id, key, on_stored):
+        with self._lock:
+            data = self._pending.get(key)
+        try:
+            self._ensure_bucket()
+            try:
+                self.client.head_object(Bucket=self.bucket, Key=key)
+                self.deduplicated += 1
+            except Exception as e:
+                if not _is_missing(e):
+                    raise
+                from boto3.s3.transfer import TransferConfig
+
+                config = TransferConfig(
+                    multipart_threshold=self.multipart_threshold,
+                    multipart_chunksize=self.multipart_chunksize,
+                    max_concurrency=4
+                )
+                self.client.upload_fileobj(
+                    io.BytesIO(data), self.bucket, key,
+                    ExtraArgs={"ContentType": image_content_type(data)}, Config=config
+                )
+                self.uploads += 1
+                self.bytes_uploaded += len(data)
+            with self._lock:
+                self._known[key] = True
+                if len(self._known) > _KNOWN_KEYS_MAX:
+                    self._known.popitem(last=False)
+        except Exception as e:
+            self.errors += 1
+            print(f"Image store error ({key}): {e}")
+            return
+        finally:
+            with self._lock:
+                self._pending_bytes -= len(self._pending.pop(key, b""))
+        if on_stored is not None:
+            try:
+                on_stored(image_id, key)
+            except Exception as e:
+                print(f"Image store callback error ({key}): {e}")
+
+
+image_store = ImageStore()
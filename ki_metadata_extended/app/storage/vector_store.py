@@ -0,0 +1,244 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "/vectors")
+# "exact" scans the memory-mapped matrix; "hnsw" keeps an hnswlib graph next to it
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "exact").lower()
+VECTOR_INITIAL_CAPACITY = int(os.getenv("VECTOR_INITIAL_CAPACITY", "65536"))
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", "16"))
+VECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "200"))
+VECTOR_HNSW_EF = int(os.getenv("VECTOR_HNSW_EF", "64"))
+
+# Rows scored per step of an exact search; bounds the float32 working set
+SCAN_CHUNK_ROWS = 65536
+
+
+def _scan(matrix, count, query, k):
+    """Exact top-k by inner product over the first `count` rows, one chunk at a time"""
+    best_rows = np.empty(0, dtype=np.int64)
+    best_scores = np.empty(0, dtype=np.float32)
+    for start in range(0, count, SCAN_CHUNK_ROWS):
+        stop = min(start + SCAN_CHUNK_ROWS, count)
+        scores = np.asarray(matrix[start:stop], dtype=np.float32) @ query
+        top = np.argpartition(scores, -k)[-k:] if len(scores) > k else np.arange(len(scores))
+        best_rows = np.concatenate([best_rows, top + start])
+        best_scores = np.concatenate([best_scores, scores[top]])
+    order = np.argsort(-best_scores)[:k]
+    return [(int(best_rows[i]), float(best_scores[i])) for i in order]
+
+
+class VectorStore:
+    """Append-only store of normalized CLIP image embeddings
+
+    Layout of `directory`:
+      vectors.f16  float16 matrix of `capacity` x `dim`, memory-mapped
+      ids.txt      one image id (SHA-256 of the upload) per line; line n is row n
+      meta.json    dim and capacity
+      hnsw.bin     optional hnswlib index over the same rows (VECTOR_INDEX=hnsw)
+
+    A row is written to the matrix before its id is appended, so after a
+    crash ids.txt never points at a missing vector. Only one process may
+    write to a directory; with an inference worker pool that is the API
+    process, which records every result.
+    """
+
+    def __init__(self, directory=VECTOR_STORE_DIR, index=VECTOR_INDEX, initial_capacity=VECTOR_INITIAL_CAPACITY,
+                 hnsw_m=VECTOR_HNSW_M, hnsw_ef_construction=VECTOR_HNSW_EF_CONSTRUCTION, hnsw_ef=VECTOR_HNSW_EF):
+        self.directory = directory
+        self.index_kind = index
+        self.initial_capacity = max(1, initial_capacity)
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef = hnsw_ef
+        self._lock = threading.RLock()
+        self._opened = False
+        self._matrix = None
+        self._ids = []
+        self._rows = {}
+        self._ids_file = None
+        self._hnsw = None
+        self._hnsw_dirty = False
+        self.dim = None
+        self.capacity = 0
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    @property
+    def count(self):
+        return len(self._ids)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _open(self, dim=None):
+        """Load ids and map the matrix; a new store is created once `dim` is known"""
+        if self._opened:
+            return True
+        meta_path = self._path("meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim, self.capacity = meta["dim"], meta["capacity"]
+        elif dim is None:
+            return False
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+            self.dim, self.capacity = dim, self.initial_capacity
+            self._write_meta()
+
+        self._map_matrix()
+        ids_path = self._path("ids.txt")
+        if os.path.exists(ids_path):
+            with open(ids_path, "r", encoding="utf-8") as f:
+                self._ids = [line.rstrip("\n") for line in f if line.strip()]
+        self._rows = {image_id: row for row, image_id in enumerate(self._ids)}
+        self._ids_file = open(ids_path, "a", encoding="utf-8")
+        if self.index_kind == "hnsw":
+            self._open_hnsw()
+        self._opened = True
+        return True
+
+    def _write_meta(self):
+        temp_path = self._path("meta.json.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "capacity": self.capacity}, f)
+        os.replace(temp_path, self._path("meta.json"))
+
+    def _map_matrix(self):
+        path = self._path("vectors.f16")
+        size = self.capacity * self.dim * 2
+        with open(path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self._matrix = np.memmap(path, dtype=np.float16, mode="r+", shape=(self.capacity, self.dim))
+
+    def _grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        self._matrix.flush()
+        self._matrix = None
+        self.capacity = capacity
+        self._map_matrix()
+        self._write_meta()
+
+    def _open_hnsw(self):
+        import hnswlib
+
+        self._hnsw = hnswlib.Index(space="ip", dim=self.dim)
+        path = self._path("hnsw.bin")
+        if os.path.exists(path):
+            self._hnsw.load_index(path, max_elements=self.capacity)
+        else:
+            self._hnsw.init_index(max_elements=self.capacity, ef_construction=self.hnsw_ef_construction,
+                                  M=self.hnsw_m)
+        self._hnsw.set_ef(self.hnsw_ef)
+        # Rows appended after the index was last saved
+        indexed = self._hnsw.get_current_count()
+        if indexed < self.count:
+            rows = np.arange(indexed, self.count)
+            self._hnsw.add_items(np.asarray(self._matrix[indexed:self.count], dtype=np.float32), rows)
+            self._hnsw_dirty = True
+
+    def add_many(self, image_ids, vectors):
+        """Append embeddings; ids that are already stored are skipped
+
+        Returns the number of new rows. Vectors must already be L2-normalized.
+        """
+        if not self.enabled or not image_ids:
+            return 0
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(image_ids), -1)
+        with self._lock:
+            self._open(dim=vectors.shape[1])
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding has {vectors.shape[1]} dimensions, the store has {self.dim}")
+            new = []
+            seen = set()
+            for image_id, vector in zip(image_ids, vectors):
+                if image_id not in self._rows and image_id not in seen:
+                    seen.add(image_id)
+                    new.append((image_id, vector))
+            if not new:
+                return 0
+
+            start = self.count
+            if start + len(new) > self.capacity:
+                self._grow(start + len(new))
+                if self._hnsw is not None:
+                    self._hnsw.resize_index(self.capacity)
+            block = np.stack([vector for _, vector in new])
+            self._matrix[start:start + len(new)] = block
+            self._ids_file.write("".join(f"{image_id}\n" for image_id, _ in new))
+            self._ids_file.flush()
+            for offset, (image_id, _) in enumerate(new):
+                self._rows[image_id] = start + offset
+                self._ids.append(image_id)
+            if self._hnsw is not None:
+                self._hnsw.add_items(block, np.arange(start, start + len(new)))
+                self._hnsw_dirty = True
+            return len(new)
+
+    def vector(self, image_id):
+        """Return the stored embedding of an image as float32, or None"""
+        with self._lock:
+            if not self.enabled or not self._open():
+                return None
+            row = self._rows.get(image_id)
+            return None if row is None else np.asarray(self._matrix[row], dtype=np.float32)
+
+    def search(self, query, k=10, exclude=None):
+        """Return [(image_id, cosine similarity)] of the `k` nearest stored images"""
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        query = query / (np.linalg.norm(query) or 1.0)
+        wanted = k + (1 if exclude is not None else 0)
+        with self._lock:
+            if not self.enabled or not self._open() or not self.count:
+                return []
+            # Rows are only ever appended, so this snapshot stays valid without the lock
+            matrix, count, ids = self._matrix, self.count, self._ids
+            hits = None
+            if self._hnsw is not None:
+                labels, distances = self._hnsw.knn_query(query, k=min(wanted, count))
+                # Inner-product "distance" is 1 - similarity
+                hits = [(int(row), 1.0 - float(distance)) for row, distance in zip(labels[0], distances[0])]
+        if hits is None:
+            hits = _scan(matrix, count, query, wanted)
+        results = [(ids[row], round(score, 6)) for row, score in hits if ids[row] != exclude]
+        return results[:k]
+
+    def stats(self):
+        with self._lock:
+            if self.enabled:
+                self._open()
+            return {
+                "enabled": self.enabled,
+                "directory": self.directory,
+                "index": self.index_kind,
+                "count": self.count,
+                "dim": self.dim,
+                "capacity": self.capacity
+            }
+
+    def close(self):
+        """Flush the matrix and persist the ANN index"""
+        with self._lock:
+            if not self._opened:
+                return
+            self._matrix.flush()
+            if self._hnsw is not None and self._hnsw_dirty:
+                temp_path = self._path("hnsw.bin.tmp")
+                self._hnsw.save_index(temp_path)
+                os.replace(temp_path, self._path("hnsw.bin"))
+                self._hnsw_dirty = False
+            self._ids_file.close()
+            self._matrix = None
+            self._hnsw = None
+            self._opened = False
+
+
+vector_store = VectorStore()
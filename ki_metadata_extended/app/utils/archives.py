@@ -0,0 +1,63 @@
+import os
+import tarfile
+import zipfile
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff", ".webp"}
+
+ARCHIVE_CONTENT_TYPES = {
+    "application/zip",
+    "application/x-zip-compressed",
+    "application/x-tar",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-compressed-tar",
+}
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+def is_image_name(name):
+    """Check whether an archive member looks like an image file"""
+    base = os.path.basename(name)
+    if not base or base.startswith("."):
+        return False
+    return os.path.splitext(base)[1].lower() in IMAGE_EXTENSIONS
+
+
+def is_archive(filename, content_type):
+    """Check whether an upload is a zip or tar archive"""
+    if content_type and content_type.split(";")[0].strip() in ARCHIVE_CONTENT_TYPES:
+        return True
+    return bool(filename) and filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def iter_archive_images(fileobj, max_member_size=None):
+    """Yield (name, bytes or None, error) for every image inside a zip or tar archive
+
+    Members are read one at a time so only a single image is held in memory.
+    Members larger than `max_member_size` are reported with an error instead
+    of being read.
+    """
+    fileobj.seek(0)
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not is_image_name(info.filename):
+                    continue
+                if max_member_size and info.file_size > max_member_size:
+                    yield info.filename, None, "File size too large"
+                    continue
+                yield info.filename, archive.read(info), None
+        return
+
+    fileobj.seek(0)
+    with tarfile.open(fileobj=fileobj, mode="r:*") as archive:
+        for member in archive:
+            if not member.isfile() or not is_image_name(member.name):
+                continue
+            if max_member_size and member.size > max_member_size:
+                yield member.name, None, "File size too large"
+                continue
+            extracted = archive.extractfile(member)
+            yield member.name, extracted.read(), None
@@ -0,0 +1,178 @@
+from datetime import datetime
+import json
+import os
+
+from app.utils.logger import INDEX_ENTRY, index_path
+
+READ_CHUNK = 64 * 1024
+
+
+def parse_time(value):
+    """Parse an ISO timestamp or unix seconds into unix seconds (None passes through)"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(value).timestamp()
+
+
+def parse_line(line):
+    """Parse one log line into a record; legacy '<ts> - <payload>' lines become {'ts', 'raw'}"""
+    text = line.decode("utf-8", errors="replace").rstrip("\n")
+    if text.startswith("{"):
+        try:
+            return json.loads(text)
+        except ValueError:
+            pass
+    timestamp, _, rest = text.partition(" - ")
+    return {"ts": timestamp, "raw": rest or text}
+
+
+def record_time(record):
+    try:
+        return datetime.fromisoformat(record["ts"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class LogIndex:
+    """Binary search over the fixed-width `<log>.idx` sidecar written by the logger"""
+
+    def __init__(self, path):
+        self.path = index_path(path)
+
+    def _entry(self, f, position):
+        f.seek(position * INDEX_ENTRY.size)
+        return INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+
+    def _search(self, timestamp):
+        """Return (entries, index of the first entry with ts >= timestamp) or None without an index"""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            count = os.fstat(f.fileno()).st_size // INDEX_ENTRY.size
+            low, high = 0, count
+            while low < high:
+                middle = (low + high) // 2
+                if self._entry(f, middle)[0] < timestamp:
+                    low = middle + 1
+                else:
+                    high = middle
+            entries = {}
+            for position in (low - 1, low):
+                if 0 <= position < count:
+                    entries[position] = self._entry(f, position)
+            return entries, low
+
+    def offset_before(self, timestamp):
+        """Byte offset from which a forward scan is guaranteed to see every line with ts >= timestamp"""
+        found = self._search(timestamp)
+        if found is None:
+            return 0
+        entries, low = found
+        return entries[low - 1][1] if low > 0 else 0
+
+    def offset_after(self, timestamp):
+        """Byte offset up to which a backward scan is guaranteed to see every line with ts <= timestamp"""
+        # The first indexed entry that is strictly newer bounds everything we need
+        found = self._search(timestamp + 1e-6)
+        if found is None:
+            return None
+        entries, low = found
+        return entries[low][1] if low in entries else None
+
+
+def iter_lines_forward(f, start):
+    f.seek(start)
+    offset = start
+    for line in f:
+        if not line.endswith(b"\n"):
+            # Partially written last line
+            return
+        yield offset, line
+        offset += len(line)
+
+
+def iter_lines_backward(f, end):
+    """Yield (offset, line) from `end` towards the start of the file, newest first"""
+    buffer = b""
+    buffer_start = end
+    stop = 0
+    while True:
+        newline = buffer.rfind(b"\n", 0, stop - 1) if stop > 1 else -1
+        if newline >= 0:
+            yield buffer_start + newline + 1, buffer[newline + 1:stop]
+            stop = newline + 1
+            continue
+        if buffer_start == 0:
+            if stop:
+                yield 0, buffer[:stop]
+            return
+        read = min(READ_CHUNK, buffer_start)
+        buffer_start -= read
+        f.seek(buffer_start)
+        buffer = f.read(read) + buffer[:stop]
+        stop = len(buffer)
+
+
+def query_log(path, since=None, until=None, limit=100, cursor=None):
+    """Read a page of records from a JSON Lines log without reading the whole file
+
+    Without `since`, the newest `limit` records (up to `until`) are returned
+    by reading backwards from the end; `next_cursor` then points at older
+    records. With `since`, the index is used to seek to the first record at
+    or after `since` and the page is read forwards; `next_cursor` then points
+    at newer records. Records are always returned oldest first. Only the
+    live file is searched, not rotated segments.
+    """
+    since = parse_time(since)
+    until = parse_time(until)
+    index = LogIndex(path)
+    entries = []
+    next_cursor = None
+
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return {"entries": [], "next_cursor": None}
+
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if since is not None:
+            start = cursor if cursor is not None else index.offset_before(since)
+            for offset, line in iter_lines_forward(f, min(start, size)):
+                record = parse_line(line)
+                timestamp = record_time(record)
+                if timestamp is not None and timestamp < since:
+                    continue
+                if until is not None and timestamp is not None and timestamp > until:
+                    break
+                entries.append(record)
+                if len(entries) >= limit:
+                    next_cursor = offset + len(line)
+                    break
+        else:
+            if cursor is not None:
+                end = min(cursor, size)
+            elif until is not None:
+                end = index.offset_after(until) or size
+            else:
+                end = size
+            for offset, line in iter_lines_backward(f, end):
+                if not line.endswith(b"\n"):
+                    continue
+                record = parse_line(line)
+                if until is not None:
+                    timestamp = record_time(record)
+                    if timestamp is not None and timestamp > until:
+                        continue
+                entries.append(record)
+                if len(entries) >= limit:
+                    next_cursor = offset if offset > 0 else None
+                    break
+            entries.reverse()
+
+    return {"entries": entries, "next_cursor": next_cursor}
@@ -1,64 +1,365 @@
 from datetime import datetime
+import atexit
+import glob
+import gzip
 import json
 import os
+import queue
+import shutil
+import struct
+import threading
+import time
 import numpy as np
 
+from app.utils.serialization import to_builtin
+
+LOG_DIR = os.getenv("LOG_DIR", "/logs")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_ROTATE_SECONDS = float(os.getenv("LOG_ROTATE_SECONDS", "86400"))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "10"))
+LOG_COMPRESS = os.getenv("LOG_COMPRESS", "1").lower() in ("1", "true", "yes")
+LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", "10000"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+LOG_FLUSH_BATCH = int(os.getenv("LOG_FLUSH_BATCH", "500"))
+LOG_INDEX_EVERY = int(os.getenv("LOG_INDEX_EVERY", "64"))
+
+# Sidecar index entry: (unix timestamp, byte offset of the line), fixed width so
+# the index can be binary-searched with seeks instead of being read whole
+INDEX_ENTRY = struct.Struct("<dQ")
+
+UPLOADS_LOG = "uploads.log"
+ANALYSIS_LOG = "analysis.log"
+ERRORS_LOG = "errors.log"
+
+
+def log_path(name):
+    return os.path.join(LOG_DIR, name)
+
+
+def index_path(path):
+    return path + ".idx"
+
+
 def ensure_log_directory():
     """Ensure the logs directory exists"""
-    os.makedirs("/logs", exist_ok=True)
-
-def convert_to_json_serializable(obj):
-    """Convert objects to JSON serializable format"""
-    if isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
+    os.makedirs(LOG_DIR, exist_ok=True)
+
+
+class RotatingJsonlFile:
+    """Append-only JSON Lines file rotated by size and age
+
+    Rotated segments are renamed to `<name>.<timestamp>` and optionally
+    gzip-compressed; only the newest `backup_count` segments are kept, so
+    the disk usage per log is bounded by roughly
+    `(backup_count + 1) * max_bytes`.
+
+    Every `index_every`-th line gets an entry in the `<name>.idx` sidecar
+    (see INDEX_ENTRY), which app.utils.log_query uses for time-range seeks.
+    """
+
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, rotate_seconds=LOG_ROTATE_SECONDS,
+                 backup_count=LOG_BACKUP_COUNT, compress=LOG_COMPRESS, index_every=LOG_INDEX_EVERY):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.compress = compress
+        self.index_every = max(1, index_every)
+        self._file = None
+        self._index = None
+        self._size = 0
+        self._lines = 0
+        self._opened_at = 0.0
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "ab")
+        self._index = open(index_path(self.path), "ab")
+        self._size = self._file.tell()
+        # Restart the index cadence; existing entries keep pointing at valid offsets
+        self._lines = 0
+        # Age counts from the segment's first record, not from this process start
+        self._opened_at = (self._first_timestamp() if self._size else None) or time.time()
+
+    def _first_timestamp(self):
+        """Timestamp of the live file's first record: the first index entry, else the first line
+
+        (st_ctime is no substitute: on Linux it changes with every write.)
+        """
+        try:
+            with open(index_path(self.path), "rb") as f:
+                entry = f.read(INDEX_ENTRY.size)
+            if len(entry) == INDEX_ENTRY.size:
+                timestamp, offset = INDEX_ENTRY.unpack(entry)
+                if offset == 0:
+                    return timestamp
+        except OSError:
+            pass
+        try:
+            with open(self.path, "rb") as f:
+                return record_timestamp(json.loads(f.readline()))
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+
+    def _should_rotate(self, incoming):
+        if self.max_bytes and self._size + incoming > self.max_bytes:
+            return True
+        return bool(self.rotate_seconds) and time.time() - self._opened_at >= self.rotate_seconds
+
+    def write(self, lines):
+        """Append (unix timestamp, encoded line) pairs, rotating whenever the next line would exceed the limits"""
+        if self._file is None:
+            self._open()
+        chunk = []
+        chunk_size = 0
+        for timestamp, line in lines:
+            # Never rotate an empty file, even if a single line exceeds max_bytes
+            if self._size + chunk_size > 0 and self._should_rotate(chunk_size + len(line)):
+                self._write_chunk(chunk)
+                chunk, chunk_size = [], 0
+                self.rotate()
+            chunk.append((timestamp, line))
+            chunk_size += len(line)
+        self._write_chunk(chunk)
+
+    def _write_chunk(self, lines):
+        if not lines:
+            return
+        index_entries = []
+        offset = self._size
+        for timestamp, line in lines:
+            if self._lines % self.index_every == 0:
+                index_entries.append(INDEX_ENTRY.pack(timestamp, offset))
+            self._lines += 1
+            offset += len(line)
+
+        data = b"".join(line for _, line in lines)
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+        if index_entries:
+            self._index.write(b"".join(index_entries))
+            self._index.flush()
+
+    def rotate(self):
+        self.close()
+        # The index only describes the live file
+        try:
+            os.unlink(index_path(self.path))
+        except FileNotFoundError:
+            pass
+        segment = f"{self.path}.{datetime.now().strftime('%Y%m%dT%H%M%S%f')}"
+        try:
+            os.replace(self.path, segment)
+        except FileNotFoundError:
+            segment = None
+        if segment and self.compress:
+            try:
+                with open(segment, "rb") as src, gzip.open(segment + ".gz", "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.unlink(segment)
+            except OSError as e:
+                print(f"Error compressing log segment {segment}: {e}")
+        self._prune()
+        self._open()
+
+    def rotated_segments(self):
+        """Rotated segments of this log, oldest first"""
+        return sorted(
+            path for path in glob.glob(glob.escape(self.path) + ".*")
+            if not path.endswith((".idx", ".tmp"))
+        )
+
+    def _prune(self):
+        segments = self.rotated_segments()
+        for path in segments[:max(0, len(segments) - self.backup_count)]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+
+class LogWriter:
+    """Background thread that writes log records in batches
+
+    `write` only puts the record into a bounded in-memory buffer, so no file
+    I/O or JSON encoding happens on the request path. When the buffer is full
+    new records are dropped (and counted) instead of blocking requests.
+    """
+
+    def __init__(self, buffer_size=LOG_BUFFER_SIZE, flush_interval=LOG_FLUSH_INTERVAL,
+                 flush_batch=LOG_FLUSH_BATCH):
+        self.flush_interval = flush_interval
+        self.flush_batch = max(1, flush_batch)
+        self._queue = queue.Queue(maxsize=buffer_size)
+        self._files = {}
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.dropped = 0
+        self.written = 0
+
+    def _ensure_started(self):
+        # A forked child does not inherit the parent's thread, so check the pid too
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def write(self, name, record):
+        """Queue one record for the log file `name`"""
+        self._enqueue((name, record, None))
+
+    def write_encoded(self, name, timestamp, line):
+        """Queue an already-encoded JSON line (with trailing newline) for the log file `name`"""
+        self._enqueue((name, None, (timestamp, line)))
+
+    def _enqueue(self, item):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _file(self, name):
+        if name not in self._files:
+            self._files[name] = RotatingJsonlFile(log_path(name))
+        return self._files[name]
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.flush_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+        self._drain()
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        lines = {}
+        for name, record, encoded in batch:
+            if encoded is None:
+                encoded = (record_timestamp(record), encode_record(record))
+            lines.setdefault(name, []).append(encoded)
+        for name, encoded in lines.items():
+            try:
+                self._file(name).write(encoded)
+                self.written += len(encoded)
+            except Exception as e:
+                print(f"Error writing {name}: {e}")
+
+    def flush(self, timeout=5.0):
+        """Wait until everything queued so far is written (best effort)"""
+        deadline = time.monotonic() + timeout
+        while not self._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self._thread = None
+        for file in self._files.values():
+            file.close()
+
+    def stats(self):
+        return {
+            "buffered": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped
+        }
+
+
+def record_timestamp(record):
+    try:
+        return datetime.fromisoformat(record["ts"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+def encode_record(record):
+    """Encode one record as a strict JSON line"""
+    try:
+        line = json.dumps(record, ensure_ascii=False, allow_nan=False)
+    except (TypeError, ValueError):
+        # Never lose the record: fall back to a lossy but valid representation
+        line = json.dumps(_strict_json(to_builtin(record)), ensure_ascii=False, default=str)
+    return (line + "\n").encode("utf-8")
+
+
+def _strict_json(obj):
+    """Replace NaN/Infinity (not valid JSON) with null"""
+    if isinstance(obj, float) and not np.isfinite(obj):
+        return None
     elif isinstance(obj, dict):
-        return {key: convert_to_json_serializable(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_to_json_serializable(item) for item in obj]
-    else:
-        return obj
+        return {key: _strict_json(value) for key, value in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [_strict_json(item) for item in obj]
+    return obj
+
+
+log_writer = LogWriter()
+atexit.register(log_writer.stop)
+
+
+def _timestamp():
+    return datetime.now().isoformat()
+
 
 def log_upload(filename):
-    ensure_log_directory()
-    try:
-        with open("/logs/uploads.log", "a", encoding="utf-8") as f:
-            f.write(f"{datetime.now().isoformat()} - UPLOADED: {filename}\n")
-    except Exception as e:
-        print(f"Error logging upload: {e}")
+    log_writer.write(UPLOADS_LOG, {"ts": _timestamp(), "event": "upload", "filename": filename})
+
 
 def log_metadata(caption, face_info):
-    ensure_log_directory()
-    try:
-        # Convert data to JSON serializable format
-        log_data = {
-            "caption": caption,
-            "face_info": convert_to_json_serializable(face_info)
-        }
-        
-        with open("/logs/analysis.log", "a", encoding="utf-8") as f:
-            f.write(f"{datetime.now().isoformat()} - METADATA: {json.dumps(log_data, ensure_ascii=False)}\n")
-    except Exception as e:
-        print(f"Error logging metadata: {e}")
-        # Fallback to string representation
-        try:
-            with open("/logs/analysis.log", "a", encoding="utf-8") as f:
-                f.write(f"{datetime.now().isoformat()} - METADATA: {str(caption)}, {str(face_info)}\n")
-        except Exception as e2:
-            print(f"Fallback logging also failed: {e2}")
+    log_writer.write(ANALYSIS_LOG, {
+        "ts": _timestamp(),
+        "event": "metadata",
+        "caption": caption,
+        "face_info": face_info
+    })
+
+
+def log_analysis(result):
+    """Log an AnalysisResult, reusing the JSON bytes already produced for the response"""
+    now = datetime.now()
+    prefix = f'{{"ts":"{now.isoformat()}","event":"metadata",'.encode("utf-8")
+    # to_json() is a JSON object; splice the log fields in front of its keys
+    log_writer.write_encoded(ANALYSIS_LOG, now.timestamp(), prefix + result.to_json()[1:] + b"\n")
+
 
 def log_error(error_message, details=None):
-    ensure_log_directory()
-    try:
-        error_data = {
-            "error": error_message,
-            "details": convert_to_json_serializable(details) if details else None
-        }
-        
-        with open("/logs/errors.log", "a", encoding="utf-8") as f:
-            f.write(f"{datetime.now().isoformat()} - ERROR: {json.dumps(error_data, ensure_ascii=False)}\n")
-    except Exception as e:
-        print(f"Error logging error: {e}")
+    log_writer.write(ERRORS_LOG, {
+        "ts": _timestamp(),
+        "event": "error",
+        "error": error_message,
+        "details": details
+    })
@@ -0,0 +1,72 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+STAGE_SECONDS = Histogram(
+    "ki_stage_seconds", "Time spent per pipeline stage for one image", ["stage"], buckets=STAGE_BUCKETS
+)
+NEO4J_FLUSH_SECONDS = Histogram(
+    "ki_neo4j_flush_seconds", "Duration of one batched Neo4j write", buckets=STAGE_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge("ki_requests_in_flight", "Upload requests currently being processed")
+IMAGES_PROCESSED = Counter("ki_images_processed_total", "Images analyzed", ["outcome"])
+INFERENCE_QUEUE_DEPTH = Gauge("ki_inference_queue_depth", "Images waiting in the inference scheduler")
+NEO4J_QUEUE_DEPTH = Gauge("ki_neo4j_queue_depth", "Rows waiting for the Neo4j writer")
+IMAGE_STORE_QUEUE_DEPTH = Gauge("ki_image_store_queue_depth", "Images waiting to be uploaded to object storage")
+LOG_BUFFER_DEPTH = Gauge("ki_log_buffer_depth", "Log records waiting to be written")
+MODEL_LOAD_SECONDS = Gauge("ki_model_load_seconds", "Model load and warm-up durations", ["step"])
+WORKER_RSS_BYTES = Gauge("ki_inference_worker_rss_bytes", "Resident memory of each inference worker", ["pid"])
+
+
+class Timings:
+    """Per-image stage durations
+
+    With `observe=True` every stage is also recorded in the `ki_stage_seconds`
+    histogram. Inference worker processes use `observe=False` and send their
+    durations back with the result, so the API process (which serves
+    /metrics) records them via `merge`.
+    """
+
+    __slots__ = ("stages", "observe")
+
+    def __init__(self, observe=True):
+        self.stages = {}
+        self.observe = observe
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        if self.observe:
+            STAGE_SECONDS.labels(stage).observe(seconds)
+
+    def merge(self, stages):
+        for stage, seconds in stages.items():
+            self.add(stage, seconds)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def milliseconds(self):
+        return {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()}
+
+    def header(self):
+        """Value for the X-Timing response header, e.g. 'decode=3.10ms, clip=41.22ms'"""
+        return ", ".join(f"{stage}={seconds * 1000:.2f}ms" for stage, seconds in self.stages.items())
+
+
+def process_rss_bytes(pid):
+    """Resident set size of a process from /proc (Linux only, 0 elsewhere)"""
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return 0
+    import resource
+    return resident_pages * resource.getpagesize()
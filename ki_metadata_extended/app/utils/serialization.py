@@ -0,0 +1,41 @@
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+def to_builtin(obj):
+    """Convert NumPy/torch values (recursively) into plain Python types"""
+    if isinstance(obj, dict):
+        return {key: to_builtin(value) for key, value in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [to_builtin(item) for item in obj]
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    elif hasattr(obj, "tolist"):
+        # np.ndarray and torch.Tensor
+        return obj.tolist()
+    else:
+        return obj
+
+
+def dumps(obj):
+    """Serialize to compact UTF-8 JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+
+def embed_json(obj, key, raw_json):
+    """Serialize the dict `obj` with the already-encoded JSON `raw_json` added under `key`
+
+    Lets an encoded result be wrapped in an envelope without decoding and
+    re-encoding it.
+    """
+    head = dumps(obj)[:-1]
+    separator = b"," if len(head) > 1 else b""
+    return head + separator + dumps(key) + b":" + raw_json + b"}"
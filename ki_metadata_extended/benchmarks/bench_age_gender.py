@@ -0,0 +1,149 @@
+"""
+Benchmark: age/gender backends (DeepFace vs. the project's SimpleCNN)
+
+Every backend runs in its own subprocess so startup time, resident memory
+and whether TensorFlow got imported are measured cleanly. Face crops are
+cut from the training/dataset images (plus synthetic crops to fill the
+batch); no face detector runs, so only the age/gender stage is timed.
+
+Backends are given as name[:model path]; SimpleCNN variants can point at
+the .pth checkpoint, its TorchScript export (.pt) or ONNX export (.onnx).
+Without a trained checkpoint, --random-weights benchmarks an untrained
+SimpleCNN (speed and memory are the same; the predictions are not).
+
+Usage:
+  python benchmarks/bench_age_gender.py
+      [--backends deepface,simplecnn:training/age_gender_model.pth,simplecnn:training/age_gender_model.onnx]
+      [--repeat 10] [--batch-size 16] [--random-weights] [--json results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.suite import dataset_images, peak_rss_mb, percentiles
+
+
+def face_crops(count):
+    import numpy as np
+    from app.pipeline.preprocess import decode_image, face_input
+
+    crops = []
+    for _, image_bytes in dataset_images():
+        try:
+            image = face_input(decode_image(image_bytes, max_side=640)[0])
+        except Exception:
+            continue
+        height, width = image.shape[:2]
+        side = min(height, width) // 2
+        top, left = (height - side) // 2, (width - side) // 2
+        crops.append(np.ascontiguousarray(image[top:top + side, left:left + side]))
+    rng = np.random.default_rng(0)
+    while len(crops) < count:
+        crops.append(rng.integers(0, 256, (160, 160, 3), dtype=np.uint8))
+    return crops[:count]
+
+
+def run_backend(spec, repeat, batch_size):
+    name, _, model_path = spec.partition(":")
+    os.environ["AGE_GENDER_BACKEND"] = name
+    if model_path:
+        os.environ["AGE_GENDER_MODEL_PATH"] = model_path
+    from app.pipeline.models import registry
+
+    crops = face_crops(batch_size)
+    start = time.perf_counter()
+    backend = registry.age_gender()
+    backend.predict(crops[:1])
+    load_seconds = time.perf_counter() - start
+
+    single = []
+    for _ in range(repeat):
+        for crop in crops:
+            t0 = time.perf_counter()
+            backend.predict([crop])
+            single.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        backend.predict(crops)
+    batched_per_sec = repeat * len(crops) / (time.perf_counter() - t0)
+
+    result = {
+        "backend": spec,
+        "load_seconds": round(load_seconds, 3),
+        "tensorflow_imported": "tensorflow" in sys.modules,
+        "batched_faces_per_sec": round(batched_per_sec, 2),
+        "single_latency_ms_mean": round(statistics.mean(single), 2),
+        "peak_rss_mb": peak_rss_mb()
+    }
+    result.update(percentiles(single, "single_latency"))
+    return result
+
+
+def random_checkpoint(directory):
+    import torch
+    from app.pipeline.age_gender import _load_simple_cnn
+
+    path = os.path.join(directory, "random_age_gender.pth")
+    torch.save(_load_simple_cnn().SimpleCNN().state_dict(), path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="deepface,simplecnn")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--random-weights", action="store_true",
+                        help="use an untrained SimpleCNN for 'simplecnn' entries without a model path")
+    parser.add_argument("--json", dest="json_path")
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_backend(args.single, args.repeat, args.batch_size)))
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        specs = []
+        for spec in (item.strip() for item in args.backends.split(",")):
+            if spec == "simplecnn" and args.random_weights:
+                spec = f"simplecnn:{random_checkpoint(workdir)}"
+            if spec:
+                specs.append(spec)
+
+        results = []
+        for spec in specs:
+            command = [sys.executable, os.path.abspath(__file__), "--single", spec,
+                       "--repeat", str(args.repeat), "--batch-size", str(args.batch_size)]
+            completed = subprocess.run(command, capture_output=True, text=True, cwd=ROOT)
+            if completed.returncode != 0:
+                print(f"{spec}: failed\n{completed.stderr[-2000:]}")
+                continue
+            results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(f"{'backend':40s} {'load s':>8s} {'p50 ms':>8s} {'faces/s':>9s} {'RSS MB':>8s} {'TF':>4s}")
+    for result in results:
+        label = result["backend"] if len(result["backend"]) <= 40 else "..." + result["backend"][-37:]
+        print(f"{label:40s} {result['load_seconds']:8.2f} {result['single_latency_p50_ms']:8.2f} "
+              f"{result['batched_faces_per_sec']:9.1f} {result['peak_rss_mb']:8.1f} "
+              f"{'yes' if result['tensorflow_imported'] else 'no':>4s}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if len(results) < len(specs):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark and parity check for the CLIP backends (torch, quantized, onnx)
+
+Every backend runs in its own subprocess so peak RSS is measured cleanly.
+For each backend the script reports single-image latency, batched
+throughput and peak RSS, and checks that its captions agree with the fp32
+torch backend on the bundled training/dataset images.
+
+Usage:
+  python benchmarks/bench_clip_backends.py [--backends torch,quantized,onnx]
+      [--repeat 10] [--batch-size 8] [--min-agreement 1.0] [--json results.json]
+
+Exits with status 1 if a backend's caption agreement with torch is below
+--min-agreement.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.suite import dataset_images, peak_rss_mb
+
+
+def run_backend(backend, repeat, batch_size):
+    """Measure one backend in this process and return its results"""
+    os.environ["CLIP_BACKEND"] = backend
+    from app.pipeline import process_image
+
+    start = time.perf_counter()
+    process_image.registry.clip_backend()
+    process_image._label_features()
+    load_seconds = time.perf_counter() - start
+
+    decoded = []
+    for name, image_bytes in dataset_images():
+        try:
+            decoded.append((name, process_image.decode_image(image_bytes)[:, :, ::-1]))
+        except Exception:
+            continue
+    if not decoded:
+        raise SystemExit("no decodable images in training/dataset")
+
+    captions = {name: caption for (name, _), caption in
+                zip(decoded, process_image.classify_images([image for _, image in decoded]))}
+
+    latencies = []
+    for _ in range(repeat):
+        for _, image in decoded:
+            t0 = time.perf_counter()
+            process_image.classify_images([image])
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    batch = [decoded[i % len(decoded)][1] for i in range(batch_size)]
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        process_image.classify_images(batch)
+    throughput = repeat * batch_size / (time.perf_counter() - t0)
+
+    return {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 3),
+        "latency_ms_p50": round(statistics.median(latencies), 2),
+        "latency_ms_mean": round(statistics.mean(latencies), 2),
+        "throughput_images_per_sec": round(throughput, 2),
+        "peak_rss_mb": peak_rss_mb(),
+        "captions": captions
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="torch,quantized,onnx")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--min-agreement", type=float, default=1.0)
+    parser.add_argument("--json", dest="json_path")
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_backend(args.single, args.repeat, args.batch_size)))
+        return
+
+    backends = [name.strip() for name in args.backends.split(",") if name.strip()]
+    if "torch" not in backends:
+        backends.insert(0, "torch")
+
+    results = {}
+    for backend in backends:
+        command = [sys.executable, os.path.abspath(__file__), "--single", backend,
+                   "--repeat", str(args.repeat), "--batch-size", str(args.batch_size)]
+        completed = subprocess.run(command, capture_output=True, text=True, cwd=ROOT)
+        if completed.returncode != 0:
+            print(f"{backend}: failed\n{completed.stderr[-2000:]}")
+            continue
+        results[backend] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    reference = results.get("torch", {}).get("captions", {})
+    failed = False
+    print(f"{'backend':10s} {'load s':>8s} {'p50 ms':>8s} {'img/s':>8s} {'RSS MB':>8s} {'agreement':>10s}")
+    for backend, result in results.items():
+        captions = result["captions"]
+        shared = [name for name in reference if name in captions]
+        agreement = sum(captions[name] == reference[name] for name in shared) / len(shared) if shared else 0.0
+        result["caption_agreement"] = round(agreement, 4)
+        failed = failed or agreement < args.min_agreement
+        print(f"{backend:10s} {result['load_seconds']:8.2f} {result['latency_ms_p50']:8.2f} "
+              f"{result['throughput_images_per_sec']:8.2f} {result['peak_rss_mb']:8.1f} {agreement:10.2%}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if failed or len(results) < len(backends):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark: temp-file JPEG round-trip vs. in-memory decode for the face stage
+
+Measures only the input handling that happens before DeepFace runs its
+models, so no model weights are needed:
+
+  - tempfile: decode with PIL, re-encode to JPEG in a temp file, read it
+    back with OpenCV (what DeepFace.analyze(img_path=<path>) did before)
+  - in-memory: decode once (resized on decode) into a BGR NumPy array
+    (app.pipeline.preprocess)
+
+Usage:
+  python benchmarks/bench_face_input.py [--repeat 20] [image ...]
+
+Without image arguments the bundled training/dataset images are used.
+"""
+import argparse
+import glob
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import cv2
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Imported from preprocess rather than process_image so no model is loaded
+from app.pipeline.preprocess import decode_image, face_input  # noqa: E402
+
+
+def via_tempfile(image_bytes):
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
+        image.save(tmp_file.name, 'JPEG')
+        bgr = cv2.imread(tmp_file.name)
+        os.unlink(tmp_file.name)
+    return bgr
+
+
+def in_memory(image_bytes):
+    image, _ = decode_image(image_bytes)
+    return face_input(image)
+
+
+def measure(func, image_bytes, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(image_bytes)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="*")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    paths = args.images or sorted(glob.glob(os.path.join(ROOT, "training", "dataset", "*", "images", "*.jpg")))
+    if not paths:
+        parser.error("no images found")
+
+    print(f"{'image':40s} {'pixels':>12s} {'tempfile ms':>12s} {'in-memory ms':>13s} {'saved ms':>9s}")
+    saved = []
+    for path in paths:
+        with open(path, "rb") as f:
+            image_bytes = f.read()
+        try:
+            width, height = Image.open(io.BytesIO(image_bytes)).size
+        except Exception:
+            continue
+        old = measure(via_tempfile, image_bytes, args.repeat)
+        new = measure(in_memory, image_bytes, args.repeat)
+        saved.append(old - new)
+        name = os.path.basename(path)[:40]
+        print(f"{name:40s} {width}x{height:<7d} {old:12.2f} {new:13.2f} {old - new:9.2f}")
+
+    if saved:
+        print(f"\nMedian latency saved per request: {statistics.median(saved):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
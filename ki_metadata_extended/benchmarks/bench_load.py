@@ -0,0 +1,205 @@
+"""
+Load generator: concurrent POST /upload/ requests against a running API
+
+Sends the training/dataset images plus synthetic JPEGs at several
+resolutions round-robin from `--concurrency` client threads until
+`--requests` uploads have finished. Reports p50/p95/p99 request latency,
+images/sec, the number of 503 (queue full) and other failed responses, and
+the API's peak RSS, sampled from /metrics while the load runs (API process
+plus inference workers).
+
+With --spawn the script starts its own uvicorn server on --port (result
+cache off, Neo4j pointed at an unreachable address so rows spill to a
+temporary file) and waits for /ready; otherwise it targets --url as is.
+Every upload gets unique trailing bytes after the JPEG end marker, so the
+exact-hash result cache of an external server never short-circuits the
+pipeline (disable RESULT_CACHE_PHASH there).
+
+Usage:
+  python benchmarks/bench_load.py [--url http://localhost:8000]
+      [--concurrency 1,4,16] [--requests 200] [--spawn] [--json results.json]
+      [--baseline benchmarks/baseline_load.json] [--tolerance 0.1]
+"""
+import argparse
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.suite import add_report_arguments, benchmark_images, percentiles, report
+
+
+def multipart_body(filename, image_bytes):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: image/jpeg\r\n\r\n"
+    ).encode("utf-8") + image_bytes + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def unique_variant(image_bytes, counter):
+    # Bytes after the JPEG end marker are ignored by decoders but change the content hash
+    return image_bytes + b"bench" + counter.to_bytes(8, "little")
+
+
+def upload(url, filename, image_bytes, timeout):
+    body, content_type = multipart_body(filename, image_bytes)
+    request = urllib.request.Request(f"{url}/upload/", data=body, method="POST",
+                                     headers={"Content-Type": content_type})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = None
+    return status, (time.perf_counter() - start) * 1000
+
+
+def server_rss_bytes(url):
+    """API process RSS plus the RSS of every inference worker, read from /metrics"""
+    with urllib.request.urlopen(f"{url}/metrics", timeout=5) as response:
+        text = response.read().decode("utf-8")
+    total = 0.0
+    for line in text.splitlines():
+        if line.startswith("process_resident_memory_bytes ") or line.startswith("ki_inference_worker_rss_bytes{"):
+            total += float(line.rsplit(" ", 1)[1])
+    return total
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, url, interval=0.5):
+        super().__init__(daemon=True)
+        self.url = url
+        self.interval = interval
+        self.peak = 0.0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            try:
+                self.peak = max(self.peak, server_rss_bytes(self.url))
+            except Exception:
+                pass
+            self._done.wait(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return round(self.peak / (1024 * 1024), 1)
+
+
+def run_load(url, images, concurrency, total_requests, timeout):
+    counter = itertools.count()
+    counter_lock = threading.Lock()
+
+    def next_request():
+        with counter_lock:
+            number = next(counter)
+        name, image_bytes = images[number % len(images)]
+        return upload(url, os.path.basename(name), unique_variant(image_bytes, number), timeout)
+
+    sampler = RssSampler(url)
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(lambda _: next_request(), range(total_requests)))
+    elapsed = time.perf_counter() - start
+    peak_rss = sampler.stop()
+
+    latencies = [ms for status, ms in outcomes if status == 200]
+    prefix = f"c{concurrency}"
+    metrics = percentiles(latencies, f"{prefix}_latency")
+    metrics[f"{prefix}_images_per_sec"] = round(len(latencies) / elapsed, 2)
+    metrics[f"{prefix}_rejected"] = sum(status == 503 for status, _ in outcomes)
+    metrics[f"{prefix}_failed"] = sum(status not in (200, 503) for status, _ in outcomes)
+    metrics[f"{prefix}_peak_rss_mb"] = peak_rss
+    return metrics
+
+
+def wait_until_ready(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/ready", timeout=5) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.HTTPError, OSError):
+            pass
+        time.sleep(1)
+    raise SystemExit(f"{url} was not ready after {timeout:.0f}s")
+
+
+def spawn_server(port, workdir):
+    env = dict(os.environ)
+    env.update({
+        "RESULT_CACHE_SIZE": "0",
+        "RESULT_CACHE_DIR": "",
+        "LOG_DIR": os.path.join(workdir, "logs"),
+        "NEO4J_URI": "bolt://127.0.0.1:1",
+        "NEO4J_SPILL_PATH": os.path.join(workdir, "neo4j_spill.jsonl"),
+        "IMAGE_STORE_BUCKET": "",
+        "VECTOR_STORE_DIR": os.path.join(workdir, "vectors"),
+        "MODEL_WARMUP": "1"
+    })
+    os.makedirs(env["LOG_DIR"], exist_ok=True)
+    command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)]
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated client concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="uploads per concurrency level")
+    parser.add_argument("--sizes", default="640,1920,4000", help="synthetic image widths in pixels")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout in seconds")
+    parser.add_argument("--spawn", action="store_true", help="start a local uvicorn server for the run")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ready-timeout", type=float, default=600.0)
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    sides = [int(side) for side in args.sizes.split(",") if side.strip()]
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    images = benchmark_images(sides)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server = None
+        url = args.url.rstrip("/")
+        if args.spawn:
+            url = f"http://127.0.0.1:{args.port}"
+            server = spawn_server(args.port, workdir)
+        try:
+            wait_until_ready(url, args.ready_timeout)
+            # One unmeasured pass so lazy allocations don't land in the first level
+            run_load(url, images, 1, min(len(images), 4), args.timeout)
+            metrics = {}
+            for level in levels:
+                metrics.update(run_load(url, images, level, args.requests, args.timeout))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+
+    context = {"url": url, "spawned": args.spawn, "concurrency": levels, "requests": args.requests,
+               "images": len(images), "sizes": sides}
+    sys.exit(report("load", metrics, context, args.json_path, args.baseline, args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
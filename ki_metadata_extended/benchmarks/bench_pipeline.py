@@ -0,0 +1,137 @@
+"""
+Benchmark: the analysis pipeline in-process, stage by stage
+
+Loads and warms up the models, then runs every image from
+training/dataset/*/images plus synthetic JPEGs at several resolutions
+through `process_images`. The result cache is disabled, logs go to a
+temporary directory and Neo4j is replaced by a driver that discards every
+write, so only the pipeline itself is measured.
+
+Reports p50/p95/p99 per stage (decode, clip, face_detect, face,
+cache_lookup, record) and end to end, sequential and batched images/sec
+and peak RSS.
+
+Usage:
+  python benchmarks/bench_pipeline.py [--repeat 5] [--batch-size 8]
+      [--sizes 640,1920,4000] [--json results.json]
+      [--baseline benchmarks/baseline_pipeline.json] [--tolerance 0.1]
+
+Exits with status 1 if a metric is worse than the baseline by more than
+--tolerance.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.suite import add_report_arguments, benchmark_images, peak_rss_mb, percentiles, report
+
+
+class NullDriver:
+    """neo4j-style driver whose sessions accept and discard every query"""
+
+    def session(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query, **parameters):
+        return None
+
+    def close(self):
+        pass
+
+
+def configure_environment(workdir):
+    # Must happen before the app modules read their configuration at import time
+    os.environ["RESULT_CACHE_SIZE"] = "0"
+    os.environ["RESULT_CACHE_DIR"] = ""
+    os.environ["INFERENCE_WORKERS"] = "0"
+    os.environ["LOG_DIR"] = os.path.join(workdir, "logs")
+    os.environ["NEO4J_SPILL_PATH"] = os.path.join(workdir, "neo4j_spill.jsonl")
+    # Benchmark images must not be uploaded to the configured MinIO
+    os.environ["IMAGE_STORE_BUCKET"] = ""
+    # Keep synthetic images out of the production vector store (/similar, /search)
+    os.environ["VECTOR_STORE_DIR"] = os.path.join(workdir, "vectors")
+    os.makedirs(os.environ["LOG_DIR"], exist_ok=True)
+
+
+def run(images, repeat, batch_size):
+    from app.pipeline import process_image
+    from app.storage.neo4j_writer import Neo4jWriter
+    from app.utils.logger import log_writer
+    from app.utils.metrics import Timings
+
+    process_image.neo4j_writer = Neo4jWriter(driver=NullDriver(), spill_path=os.environ["NEO4J_SPILL_PATH"])
+
+    start = time.perf_counter()
+    process_image.warm_up()
+    warm_up_seconds = time.perf_counter() - start
+
+    stages = {}
+    totals = []
+    errors = 0
+    sequential_start = time.perf_counter()
+    for _ in range(repeat):
+        for _, image_bytes in images:
+            timings = Timings(observe=False)
+            t0 = time.perf_counter()
+            result = process_image.process_images([image_bytes], [timings])[0]
+            totals.append((time.perf_counter() - t0) * 1000)
+            errors += not result.ok
+            for stage, seconds in timings.stages.items():
+                stages.setdefault(stage, []).append(seconds * 1000)
+    sequential_seconds = time.perf_counter() - sequential_start
+
+    batch = [images[i % len(images)][1] for i in range(batch_size)]
+    batch_start = time.perf_counter()
+    for _ in range(repeat):
+        process_image.process_images(batch)
+    batch_seconds = time.perf_counter() - batch_start
+
+    process_image.neo4j_writer.stop()
+    log_writer.stop()
+
+    metrics = {}
+    metrics.update(percentiles(totals, "total"))
+    for stage in sorted(stages):
+        metrics.update(percentiles(stages[stage], stage))
+    metrics["sequential_images_per_sec"] = round(len(totals) / sequential_seconds, 2)
+    metrics["batched_images_per_sec"] = round(repeat * batch_size / batch_seconds, 2)
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    metrics["warm_up_seconds"] = round(warm_up_seconds, 2)
+    return metrics, {"errors": errors, "model_version": process_image.model_version()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--sizes", default="640,1920,4000", help="synthetic image widths in pixels")
+    parser.add_argument("--no-dataset", action="store_true", help="use only the synthetic images")
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    sides = [int(side) for side in args.sizes.split(",") if side.strip()]
+    images = benchmark_images(sides, include_dataset=not args.no_dataset)
+    if not images:
+        raise SystemExit("no benchmark images")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(workdir)
+        metrics, details = run(images, args.repeat, args.batch_size)
+
+    context = {"images": len(images), "repeat": args.repeat, "batch_size": args.batch_size, "sizes": sides, **details}
+    sys.exit(report("pipeline", metrics, context, args.json_path, args.baseline, args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark: full-resolution decode + CLIPProcessor vs. the shared preprocessing stage
+
+  - baseline: Image.open(...).convert("RGB") at full resolution, then
+    CLIPProcessor for the CLIP tensor and a full-size BGR copy for DeepFace
+  - prepare_image: draft-mode decode near FACE_MAX_SIDE, one resize to the
+    CLIP input, vectorized normalization (app.pipeline.preprocess)
+
+Synthetic JPEGs at several resolutions are generated in memory. Each mode
+runs in its own subprocess so peak RSS can be compared.
+
+Usage:
+  python benchmarks/bench_preprocess.py [--sizes 1024,3000,6000] [--repeat 5]
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.suite import peak_rss_mb, synthetic_jpeg
+
+
+def run_mode(mode, side, repeat):
+    image_bytes = synthetic_jpeg(side)
+    if mode == "baseline":
+        from transformers import CLIPProcessor
+        processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+
+        def run():
+            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+            processor(images=image, return_tensors="pt")
+            np.ascontiguousarray(np.asarray(image)[:, :, ::-1])
+    else:
+        from app.pipeline.preprocess import prepare_image
+
+        def run():
+            prepare_image(image_bytes)
+
+    run()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "mode": mode,
+        "side": side,
+        "ms_p50": round(statistics.median(timings), 2),
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_growth_mb": round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1024,3000,6000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--single", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_mode(args.single[0], int(args.single[1]), args.repeat)))
+        return
+
+    print(f"{'mode':14s} {'width':>6s} {'p50 ms':>9s} {'peak RSS MB':>12s}")
+    for side in [int(size) for size in args.sizes.split(",")]:
+        for mode in ("baseline", "prepare_image"):
+            command = [sys.executable, os.path.abspath(__file__), "--single", mode, str(side),
+                       "--repeat", str(args.repeat)]
+            completed = subprocess.run(command, capture_output=True, text=True, cwd=ROOT)
+            if completed.returncode != 0:
+                print(f"{mode:14s} {side:6d} failed: {completed.stderr.strip().splitlines()[-1:]}")
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            print(f"{mode:14s} {side:6d} {result['ms_p50']:9.2f} {result['peak_rss_mb']:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
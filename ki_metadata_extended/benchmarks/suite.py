@@ -0,0 +1,139 @@
+"""
+Shared helpers for the benchmarks (test images, percentiles, RSS, reports)
+
+Results are flat JSON documents: a "metrics" mapping of name -> number plus
+free-form "context" (arguments, host, model names). Metric names encode
+their direction so a baseline comparison knows what "worse" means:
+names ending in "_per_sec" are higher-is-better, everything else
+(latencies, RSS) is lower-is-better.
+"""
+import glob
+import io
+import json
+import os
+import platform
+import resource
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.utils.archives import is_image_name
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SYNTHETIC_SIDES = (640, 1920, 4000)
+
+
+def dataset_images():
+    """(name, bytes) of every image under training/dataset/*/images"""
+    # images/ also holds labels.csv and other non-image files
+    paths = sorted(
+        path for path in glob.glob(os.path.join(ROOT, "training", "dataset", "*", "images", "*"))
+        if is_image_name(path)
+    )
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append((os.path.relpath(path, ROOT), f.read()))
+    return images
+
+
+def synthetic_jpeg(side):
+    """Deterministic JPEG `side` pixels wide (4:3) that compresses like a photo"""
+    rng = np.random.default_rng(side)
+    # Smooth gradients plus noise compress like a photo rather than pure noise
+    y, x = np.mgrid[0:side * 3 // 4, 0:side]
+    base = np.stack([x % 256, y % 256, (x + y) % 256], axis=-1).astype(np.uint8)
+    noise = rng.integers(0, 32, base.shape, dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(base + noise).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def benchmark_images(sides=SYNTHETIC_SIDES, include_dataset=True):
+    """The bundled dataset images plus one synthetic image per resolution"""
+    images = dataset_images() if include_dataset else []
+    images.extend((f"synthetic-{side}px", synthetic_jpeg(side)) for side in sides)
+    return images
+
+
+def percentiles(values_ms, prefix):
+    """p50/p95/p99 (nearest rank) of a list of millisecond values"""
+    if not values_ms:
+        return {}
+    ordered = sorted(values_ms)
+    result = {}
+    for p in (50, 95, 99):
+        rank = max(0, min(len(ordered) - 1, int(np.ceil(p / 100 * len(ordered))) - 1))
+        result[f"{prefix}_p{p}_ms"] = round(ordered[rank], 2)
+    return result
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def higher_is_better(metric):
+    return metric.endswith("_per_sec")
+
+
+def compare_to_baseline(metrics, baseline_metrics, tolerance):
+    """Return [(metric, baseline, current, relative change)] for metrics worse than `tolerance`"""
+    regressions = []
+    for metric, current in metrics.items():
+        reference = baseline_metrics.get(metric)
+        if not isinstance(reference, (int, float)) or not reference:
+            continue
+        change = (current - reference) / reference
+        worse = -change if higher_is_better(metric) else change
+        if worse > tolerance:
+            regressions.append((metric, reference, current, change))
+    return regressions
+
+
+def write_results(path, benchmark, metrics, context):
+    document = {
+        "benchmark": benchmark,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "context": context,
+        "metrics": metrics
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2, ensure_ascii=False)
+    return document
+
+
+def report(benchmark, metrics, context, json_path=None, baseline_path=None, tolerance=0.1):
+    """Print metrics, write them to JSON and compare them to a baseline; returns the exit status"""
+    width = max(len(metric) for metric in metrics) if metrics else 0
+    for metric, value in metrics.items():
+        print(f"{metric:{width}s} {value:12.2f}")
+
+    if json_path:
+        write_results(json_path, benchmark, metrics, context)
+
+    if not baseline_path:
+        return 0
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("benchmark") != benchmark:
+        print(f"Baseline {baseline_path} is for '{baseline.get('benchmark')}', not '{benchmark}'")
+        return 1
+    regressions = compare_to_baseline(metrics, baseline.get("metrics", {}), tolerance)
+    if not regressions:
+        print(f"No regressions beyond {tolerance:.0%} against {baseline_path}")
+        return 0
+    print(f"Regressions beyond {tolerance:.0%} against {baseline_path}:")
+    for metric, reference, current, change in regressions:
+        print(f"  {metric}: {reference:.2f} -> {current:.2f} ({change:+.1%})")
+    return 1
+
+
+def add_report_arguments(parser):
+    parser.add_argument("--json", dest="json_path", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative change that counts as a regression (default 0.1 = 10%%)")
@@ -0,0 +1,240 @@
+"""
+Incremental ingestion of analysis.log into a local SQLite store for the dashboard
+
+Only lines appended since the last run are parsed: the byte offset and inode
+of the log, and the newest rotated segment already seen, are stored next to
+the data. Segments rotated since the last run (plain or gzipped) are read
+oldest first - the first one continues the previous live file from the
+stored offset - before the live file. The first run also ingests every
+existing segment.
+"""
+from datetime import datetime
+from contextlib import closing
+import ast
+import glob
+import gzip
+import json
+import os
+import sqlite3
+import threading
+
+LOG_DIR = os.getenv("LOG_DIR", "/logs")
+ANALYSIS_LOG_PATH = os.path.join(LOG_DIR, "analysis.log")
+DASHBOARD_DB = os.getenv("DASHBOARD_DB", os.path.join(LOG_DIR, "dashboard.sqlite"))
+INGEST_BATCH = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    caption TEXT,
+    age REAL,
+    gender TEXT,
+    has_error INTEGER NOT NULL DEFAULT 0,
+    face_info TEXT
+);
+CREATE INDEX IF NOT EXISTS analyses_ts ON analyses (ts);
+CREATE INDEX IF NOT EXISTS analyses_caption_ts ON analyses (caption, ts);
+CREATE TABLE IF NOT EXISTS ingest_state (
+    log_path TEXT PRIMARY KEY,
+    inode INTEGER,
+    offset INTEGER NOT NULL,
+    last_segment TEXT
+);
+"""
+
+
+def parse_legacy_line(line):
+    """Parse '<timestamp> - METADATA: <payload>' lines written by older versions"""
+    if " - METADATA: " not in line:
+        return None
+    time_str, metadata_str = line.split(" - METADATA: ", 1)
+    metadata_str = metadata_str.strip()
+    try:
+        metadata = json.loads(metadata_str)
+    except json.JSONDecodeError:
+        try:
+            metadata = ast.literal_eval(metadata_str)
+        except (ValueError, SyntaxError):
+            metadata = {"raw": metadata_str}
+    if not isinstance(metadata, dict):
+        metadata = {"raw": metadata_str}
+    metadata["ts"] = time_str
+    metadata["event"] = "metadata"
+    return metadata
+
+
+# Captions older versions logged as metadata for things that were not analyses
+NON_ANALYSIS_CAPTIONS = {"Error storing embeddings"}
+
+
+def is_analysis(record):
+    """True for analysis payloads: face info, or image id plus error for a failed analysis"""
+    if record.get("caption") in NON_ANALYSIS_CAPTIONS:
+        return False
+    return isinstance(record.get("face_info"), dict) or ("image_id" in record and "error" in record)
+
+
+def parse_line(line):
+    """Parse one log line into an analysis record, or None for other events"""
+    if line.startswith("{"):
+        record = json.loads(line)
+    else:
+        record = parse_legacy_line(line)
+    if not record or record.get("event") != "metadata" or not is_analysis(record):
+        return None
+    return record
+
+
+def to_row(record):
+    """Flatten a metadata record into an `analyses` row"""
+    face_info = record.get("face_info")
+    age = gender = None
+    has_error = True
+    if isinstance(face_info, dict):
+        has_error = "error" in face_info
+        age = face_info.get("age")
+        gender = face_info.get("gender")
+        if isinstance(gender, dict):
+            gender = gender.get("dominant_gender") or face_info.get("dominant_gender")
+    try:
+        age = float(age) if age is not None else None
+    except (TypeError, ValueError):
+        age = None
+    return (
+        datetime.fromisoformat(record["ts"]).timestamp(),
+        record.get("caption"),
+        age,
+        str(gender) if gender is not None else None,
+        int(has_error),
+        json.dumps(face_info, ensure_ascii=False, default=str)
+    )
+
+
+class LogIngester:
+    """Append new analysis.log lines to SQLite, remembering where it stopped"""
+
+    def __init__(self, log_path=ANALYSIS_LOG_PATH, db_path=DASHBOARD_DB):
+        self.log_path = log_path
+        self.db_path = db_path
+        self.parse_errors = 0
+        self._lock = threading.Lock()
+        with closing(self.connect()) as connection:
+            connection.executescript(SCHEMA)
+            try:
+                # Databases created before last_segment existed
+                connection.execute("ALTER TABLE ingest_state ADD COLUMN last_segment TEXT")
+            except sqlite3.OperationalError:
+                pass
+
+    def connect(self):
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def query(self, sql, params=()):
+        """Run a read query and return (column names, rows)"""
+        with closing(self.connect()) as connection:
+            cursor = connection.execute(sql, params)
+            columns = [column[0] for column in cursor.description]
+            return columns, cursor.fetchall()
+
+    def _state(self, connection):
+        row = connection.execute(
+            "SELECT inode, offset, last_segment FROM ingest_state WHERE log_path = ?", (self.log_path,)
+        ).fetchone()
+        return row if row else (None, 0, None)
+
+    def _save_state(self, connection, inode, offset, last_segment):
+        connection.execute(
+            "INSERT INTO ingest_state (log_path, inode, offset, last_segment) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(log_path) DO UPDATE SET inode = excluded.inode, offset = excluded.offset, "
+            "last_segment = excluded.last_segment",
+            (self.log_path, inode, offset, last_segment)
+        )
+
+    def _segments(self):
+        """Rotated segments as (name without .gz, path), oldest first"""
+        segments = []
+        for path in glob.glob(glob.escape(self.log_path) + ".*"):
+            if path.endswith((".idx", ".tmp")):
+                continue
+            segments.append((path[:-3] if path.endswith(".gz") else path, path))
+        return sorted(segments)
+
+    def _ingest_segment(self, connection, path, offset):
+        opener = gzip.open if path.endswith(".gz") else open
+        try:
+            with opener(path, "rb") as f:
+                return self._ingest_file(connection, f, offset)[1]
+        except (OSError, EOFError):
+            self.parse_errors += 1
+            return 0
+
+    def _insert(self, connection, rows):
+        connection.executemany(
+            "INSERT INTO analyses (ts, caption, age, gender, has_error, face_info) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        return len(rows)
+
+    def _ingest_file(self, connection, f, offset):
+        """Insert complete lines after `offset`; returns (offset after the last complete line, rows inserted)"""
+        f.seek(offset)
+        rows = []
+        inserted = 0
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                # Partially written line, picked up on the next run
+                break
+            offset += len(raw)
+            try:
+                record = parse_line(raw.decode("utf-8", errors="replace").strip())
+                if record is not None:
+                    rows.append(to_row(record))
+            except Exception:
+                self.parse_errors += 1
+            if len(rows) >= INGEST_BATCH:
+                inserted += self._insert(connection, rows)
+                rows = []
+        if rows:
+            inserted += self._insert(connection, rows)
+        return offset, inserted
+
+    def ingest(self):
+        """Ingest everything appended since the last call; returns the number of new rows"""
+        with self._lock, closing(self.connect()) as connection:
+            inserted = 0
+            inode, offset, last_segment = self._state(connection)
+            # Listed before the live file is opened, so a rotation in between is seen next run
+            segments = self._segments()
+            try:
+                f = open(self.log_path, "rb")
+            except FileNotFoundError:
+                return 0
+            with f:
+                stat = os.fstat(f.fileno())
+                rotated = inode is not None and (stat.st_ino != inode or stat.st_size < offset)
+                if inode is not None and last_segment is None:
+                    # State from before segments were tracked: only the newest can be unread
+                    new_segments = segments[-1:] if rotated else []
+                else:
+                    new_segments = [
+                        segment for segment in segments if last_segment is None or segment[0] > last_segment
+                    ]
+
+                for position, (_, path) in enumerate(new_segments):
+                    # The oldest new segment is the live file of the last run
+                    start = offset if rotated and position == 0 else 0
+                    inserted += self._ingest_segment(connection, path, start)
+                if rotated or inode is None:
+                    offset = 0
+
+                offset, count = self._ingest_file(connection, f, offset)
+            inserted += count
+            if segments:
+                last_segment = segments[-1][0]
+            self._save_state(connection, stat.st_ino, offset, last_segment)
+            connection.commit()
+            return inserted
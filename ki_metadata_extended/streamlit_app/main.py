@@ -1,10 +1,10 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
-import ast
+
+from ingest import LogIngester
 
 st.set_page_config(
     page_title="KI-Metadaten Timeline",
@@ -15,142 +15,128 @@ st.set_page_config(
 st.title("📊 KI-Metadaten Timeline")
 st.markdown("---")
 
+TIME_RANGES = {
+    "Letzte Stunde": timedelta(hours=1),
+    "Letzte 24 Stunden": timedelta(days=1),
+    "Letzte 7 Tage": timedelta(days=7),
+    "Letzte 30 Tage": timedelta(days=30),
+    "Alle": None,
+}
+
+@st.cache_resource
+def get_ingester():
+    """One ingester per server process; it remembers the last read log offset"""
+    return LogIngester()
+
+# Only lines appended since the last run are parsed, so this stays cheap as the log grows
+try:
+    ingester = get_ingester()
+    ingester.ingest()
+except Exception as e:
+    st.error(f"Fehler beim Laden der Daten: {e}")
+    st.stop()
+
 # Sidebar for controls
 st.sidebar.header("Einstellungen")
 show_errors = st.sidebar.checkbox("Fehler anzeigen", value=False)
 max_entries = st.sidebar.slider("Maximale Einträge", 10, 1000, 100)
+time_range = st.sidebar.selectbox("Zeitraum", list(TIME_RANGES), index=len(TIME_RANGES) - 1)
+_, caption_rows = ingester.query("SELECT DISTINCT caption FROM analyses WHERE caption IS NOT NULL ORDER BY caption")
+selected_captions = st.sidebar.multiselect("Captions", [row[0] for row in caption_rows])
 
-@st.cache_data(ttl=60)  # Cache for 1 minute
-def load_log_data():
-    """Load and parse log data with error handling"""
-    try:
-        with open("/logs/analysis.log", "r") as f:
-            logs = f.readlines()
-        
-        entries = []
-        times = []
-        
-        for line in logs:
-            if "METADATA" in line:
-                try:
-                    # Parse timestamp
-                    time_str = line.split(" - METADATA: ")[0]
-                    time_obj = datetime.fromisoformat(time_str)
-                    times.append(time_obj)
-                    
-                    # Parse metadata
-                    metadata_str = line.split(" - METADATA: ")[1].strip()
-                    
-                    # Try to parse as JSON first, then as Python literal
-                    try:
-                        metadata = json.loads(metadata_str)
-                    except json.JSONDecodeError:
-                        try:
-                            metadata = ast.literal_eval(metadata_str)
-                        except:
-                            metadata = {"raw": metadata_str}
-                    
-                    entries.append(metadata)
-                    
-                except Exception as e:
-                    if show_errors:
-                        st.warning(f"Fehler beim Parsen der Zeile: {line[:100]}... - {e}")
-                    continue
-        
-        return times, entries
-    
-    except FileNotFoundError:
-        st.warning("Keine Log-Datei gefunden. Bitte laden Sie zuerst Bilder hoch.")
-        return [], []
-    except Exception as e:
-        st.error(f"Fehler beim Laden der Daten: {e}")
-        return [], []
+if show_errors and ingester.parse_errors:
+    st.warning(f"{ingester.parse_errors} Log-Zeilen konnten nicht gelesen werden")
 
-# Load data
-times, entries = load_log_data()
+# Filters are pushed down into SQL, so only aggregates and one page of rows are loaded
+conditions = []
+params = []
+if TIME_RANGES[time_range] is not None:
+    conditions.append("ts >= ?")
+    params.append((datetime.now() - TIME_RANGES[time_range]).timestamp())
+if selected_captions:
+    conditions.append(f"caption IN ({', '.join('?' for _ in selected_captions)})")
+    params.extend(selected_captions)
+where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
 
-if times and entries:
-    # Create DataFrame
-    df = pd.DataFrame(entries)
-    df['timestamp'] = times
-    df['date'] = df['timestamp'].dt.date
-    df['time'] = df['timestamp'].dt.time
-    
-    # Limit entries
-    df = df.tail(max_entries)
-    
+def query_df(sql, extra_params=()):
+    columns, rows = ingester.query(sql, tuple(params) + tuple(extra_params))
+    return pd.DataFrame(rows, columns=columns)
+
+summary = query_df(
+    f"SELECT COUNT(*) AS total, COUNT(DISTINCT caption) AS captions, "
+    f"COALESCE(SUM(has_error = 0), 0) AS successful, MAX(ts) AS last_ts FROM analyses {where}"
+).iloc[0]
+
+if summary["total"]:
     # Display statistics
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Gesamt Einträge", len(df))
+        st.metric("Gesamt Einträge", int(summary["total"]))
     with col2:
-        st.metric("Eindeutige Captions", df['caption'].nunique() if 'caption' in df.columns else 0)
+        st.metric("Eindeutige Captions", int(summary["captions"]))
     with col3:
-        st.metric("Erfolgreiche Analysen", len(df[df.get('face_info', {}).apply(lambda x: 'error' not in str(x))]))
+        st.metric("Erfolgreiche Analysen", int(summary["successful"]))
     with col4:
-        st.metric("Letzter Eintrag", df['timestamp'].max().strftime("%H:%M:%S") if len(df) > 0 else "N/A")
+        st.metric("Letzter Eintrag", datetime.fromtimestamp(summary["last_ts"]).strftime("%H:%M:%S"))
     
     st.markdown("---")
     
+    # Latest entries, used for the timeline and the raw data table
+    df = query_df(
+        f"SELECT ts, caption, age, gender, has_error, face_info FROM analyses {where} ORDER BY ts DESC LIMIT ?",
+        (max_entries,)
+    )
+    # Epoch seconds -> naive local time, like "Letzter Eintrag" and the log's own timestamps
+    df['timestamp'] = pd.to_datetime(df['ts'].map(datetime.fromtimestamp))
+    df['face_info'] = df['face_info'].apply(lambda value: json.loads(value) if value else None)
+    
     # Timeline visualization
     st.subheader("📈 Timeline der Analysen")
-    
-    if 'caption' in df.columns:
-        # Create timeline
-        fig = px.timeline(
-            df, 
-            x_start='timestamp', 
-            x_end='timestamp', 
-            y='caption', 
-            color='caption',
-            title="Analyse Timeline"
-        )
-        fig.update_layout(
-            xaxis_title="Zeit",
-            yaxis_title="Caption",
-            height=400
-        )
-        st.plotly_chart(fig, use_container_width=True)
+    fig = px.scatter(
+        df,
+        x='timestamp',
+        y='caption',
+        color='caption',
+        title="Analyse Timeline"
+    )
+    fig.update_layout(
+        xaxis_title="Zeit",
+        yaxis_title="Caption",
+        height=400
+    )
+    st.plotly_chart(fig, use_container_width=True)
     
     # Face analysis statistics
     st.subheader("👤 Gesichtsanalyse Statistiken")
     
-    if 'face_info' in df.columns:
-        # Extract age and gender data
-        ages = []
-        genders = []
-        
-        for face_info in df['face_info']:
-            if isinstance(face_info, dict):
-                if 'age' in face_info and face_info['age'] is not None:
-                    ages.append(face_info['age'])
-                if 'gender' in face_info and face_info['gender'] is not None:
-                    genders.append(face_info['gender'])
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if ages:
-                st.subheader("Altersverteilung")
-                age_df = pd.DataFrame({'age': ages})
-                fig_age = px.histogram(age_df, x='age', nbins=10, title="Altersverteilung")
-                st.plotly_chart(fig_age, use_container_width=True)
-            else:
-                st.info("Keine Altersdaten verfügbar")
-        
-        with col2:
-            if genders:
-                st.subheader("Geschlechterverteilung")
-                gender_df = pd.DataFrame({'gender': genders})
-                gender_counts = gender_df['gender'].value_counts()
-                fig_gender = px.pie(values=gender_counts.values, names=gender_counts.index, title="Geschlechterverteilung")
-                st.plotly_chart(fig_gender, use_container_width=True)
-            else:
-                st.info("Keine Geschlechterdaten verfügbar")
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        age_where = f"{where} AND age IS NOT NULL" if where else "WHERE age IS NOT NULL"
+        age_df = query_df(
+            f"SELECT CAST(age / 5 AS INTEGER) * 5 AS age, COUNT(*) AS count FROM analyses {age_where} "
+            f"GROUP BY 1 ORDER BY 1"
+        )
+        if len(age_df):
+            st.subheader("Altersverteilung")
+            fig_age = px.bar(age_df, x='age', y='count', title="Altersverteilung")
+            st.plotly_chart(fig_age, use_container_width=True)
+        else:
+            st.info("Keine Altersdaten verfügbar")
+    
+    with col2:
+        gender_where = f"{where} AND gender IS NOT NULL" if where else "WHERE gender IS NOT NULL"
+        gender_df = query_df(f"SELECT gender, COUNT(*) AS count FROM analyses {gender_where} GROUP BY gender")
+        if len(gender_df):
+            st.subheader("Geschlechterverteilung")
+            fig_gender = px.pie(gender_df, values='count', names='gender', title="Geschlechterverteilung")
+            st.plotly_chart(fig_gender, use_container_width=True)
+        else:
+            st.info("Keine Geschlechterdaten verfügbar")
     
     # Raw data table
     st.subheader("📋 Rohdaten")
-    st.dataframe(df, use_container_width=True)
+    st.dataframe(df.drop(columns=['ts']), use_container_width=True)
     
 else:
     st.info("Keine Daten verfügbar. Bitte laden Sie zuerst Bilder über die API hoch.")
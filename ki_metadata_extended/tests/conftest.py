@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def consume(self):
+        pass
+
+    def data(self):
+        return list(self._rows)
+
+
+class FakeSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def run(self, query, **parameters):
+        driver = self.driver
+        driver.started.set()
+        if driver.gate is not None:
+            driver.gate.wait(5)
+        with driver.lock:
+            driver.attempts += 1
+            if driver.down or driver.failures > 0:
+                driver.failures = max(0, driver.failures - 1)
+                raise ConnectionError("Neo4j unavailable")
+            driver.calls.append((query, parameters))
+        return FakeResult(driver.rows)
+
+
+class FakeDriver:
+    """Stand-in for a neo4j driver: records every query, can fail or block on demand
+
+    `failures` makes the next n queries raise, `down` makes every query
+    raise, `gate` (a threading.Event) holds queries until it is set and
+    `rows` is what `data()` returns.
+    """
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.calls = []
+        self.attempts = 0
+        self.failures = 0
+        self.down = False
+        self.gate = None
+        self.started = threading.Event()
+        self.lock = threading.Lock()
+
+    def session(self):
+        return FakeSession(self)
+
+    def queries(self, query):
+        """Parameters of every successful run of `query`"""
+        return [parameters for text, parameters in self.calls if text == query]
+
+
+@pytest.fixture
+def fake_driver():
+    return FakeDriver()
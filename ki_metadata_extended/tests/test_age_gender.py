@@ -0,0 +1,35 @@
+import json
+
+import numpy as np
+import pytest
+import torch
+
+from app.pipeline.age_gender import SimpleCnnAgeGender, _load_simple_cnn
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    path = tmp_path / "age_gender_model.pth"
+    torch.save(_load_simple_cnn().SimpleCNN().state_dict(), path)
+    return path
+
+
+def write_sidecar(checkpoint, gender_classes):
+    with open(checkpoint.with_suffix(".json"), "w", encoding="utf-8") as f:
+        json.dump({"gender_classes": gender_classes}, f)
+
+
+def test_predicts_with_the_sidecar_gender_classes(checkpoint):
+    write_sidecar(checkpoint, ["female", "male"])
+    backend = SimpleCnnAgeGender(str(checkpoint), torchscript=False)
+
+    (prediction,) = backend.predict([np.full((64, 48, 3), 127, dtype=np.uint8)])
+    assert set(prediction["gender"]) == {"Woman", "Man"}
+    assert prediction["dominant_gender"] in ("Woman", "Man")
+
+
+def test_fewer_gender_classes_than_model_outputs_fail_at_load(checkpoint):
+    # A dataset with a single gender yields a one-class sidecar for a two-output head
+    write_sidecar(checkpoint, ["female"])
+    with pytest.raises(ValueError, match="2 gender outputs"):
+        SimpleCnnAgeGender(str(checkpoint), torchscript=False)
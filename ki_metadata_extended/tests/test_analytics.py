@@ -0,0 +1,102 @@
+import threading
+
+from app.pipeline.results import AnalysisResult, FaceInfo
+from app.storage.analytics import (
+    AGE_DISTRIBUTION_QUERY, ALL_LABELS, GENDER_COUNTS_QUERY, LABEL_COUNTS_QUERY, ONE_LABEL, GraphAnalytics
+)
+from app.storage.neo4j_writer import METADATA_QUERY, SCHEMA_STATEMENTS, Neo4jWriter, metadata_row
+
+
+def test_metadata_row_flattens_faces_into_scalar_properties():
+    result = AnalysisResult(
+        caption="a person",
+        image_id="ab" * 32,
+        faces=(
+            FaceInfo(age=31, gender={"Woman": 90.0, "Man": 10.0}, dominant_gender="Woman", face_confidence=0.97,
+                     region={"x": 4, "y": 8, "w": 40, "h": 48}),
+            FaceInfo(age=12)
+        )
+    )
+
+    assert metadata_row(result) == {
+        "image_id": "ab" * 32,
+        "caption": "a person",
+        "faces": [
+            {"index": 0, "age": 31, "gender": "Woman", "gender_woman": 90.0, "gender_man": 10.0,
+             "confidence": 0.97, "x": 4, "y": 8, "w": 40, "h": 48},
+            {"index": 1, "age": 12}
+        ]
+    }
+
+
+def test_metadata_row_without_faces():
+    assert metadata_row(AnalysisResult(caption="a photo", image_id="cd" * 32)) == {
+        "image_id": "cd" * 32, "caption": "a photo", "faces": []
+    }
+
+
+def test_schema_is_applied_once_before_the_first_write(fake_driver, tmp_path):
+    writer = Neo4jWriter(driver=fake_driver, spill_path=str(tmp_path / "spill.jsonl"))
+    threads = [threading.Thread(target=writer._write, args=([{"image_id": str(i)}],)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer._write([{"image_id": "4"}])
+
+    queries = [query for query, _ in fake_driver.calls]
+    assert queries[:len(SCHEMA_STATEMENTS)] == list(SCHEMA_STATEMENTS)
+    assert queries[len(SCHEMA_STATEMENTS):] == [METADATA_QUERY] * 5
+
+
+def test_schema_is_retried_while_neo4j_is_unreachable(fake_driver, tmp_path):
+    writer = Neo4jWriter(driver=fake_driver, spill_path=str(tmp_path / "spill.jsonl"))
+    fake_driver.down = True
+    assert not writer.ensure_schema()
+
+    fake_driver.down = False
+    assert writer.ensure_schema()
+    assert writer.ensure_schema()
+    assert [query for query, _ in fake_driver.calls] == list(SCHEMA_STATEMENTS)
+
+
+def test_label_counts_query(fake_driver):
+    fake_driver.rows = [{"label": "a person", "images": 3}]
+
+    assert GraphAnalytics(fake_driver).label_counts(limit=5) == [{"label": "a person", "images": 3}]
+    assert fake_driver.calls == [(LABEL_COUNTS_QUERY, {"limit": 5})]
+
+
+def test_age_distribution_for_one_label(fake_driver):
+    fake_driver.rows = [
+        {"label": "a person", "age": 20, "faces": 2},
+        {"label": "a person", "age": 30, "faces": 1}
+    ]
+
+    assert GraphAnalytics(fake_driver).age_distribution(label="a person", bucket=10) == {
+        "a person": [{"age": 20, "faces": 2}, {"age": 30, "faces": 1}]
+    }
+    assert fake_driver.calls == [(ONE_LABEL + AGE_DISTRIBUTION_QUERY, {"label": "a person", "bucket": 10})]
+
+
+def test_age_distribution_for_all_labels(fake_driver):
+    fake_driver.rows = [{"label": "a person", "age": 20, "faces": 2}, {"label": "a photo", "age": 0, "faces": 1}]
+
+    assert GraphAnalytics(fake_driver).age_distribution(bucket=20) == {
+        "a person": [{"age": 20, "faces": 2}], "a photo": [{"age": 0, "faces": 1}]
+    }
+    assert fake_driver.calls == [(ALL_LABELS + AGE_DISTRIBUTION_QUERY, {"label": None, "bucket": 20})]
+
+
+def test_gender_counts(fake_driver):
+    fake_driver.rows = [
+        {"label": "a person", "gender": "Woman", "faces": 4},
+        {"label": "a person", "gender": "Man", "faces": 3}
+    ]
+
+    assert GraphAnalytics(fake_driver).gender_counts() == {"a person": {"Woman": 4, "Man": 3}}
+    assert fake_driver.calls == [(ALL_LABELS + GENDER_COUNTS_QUERY, {"label": None})]
+
+    fake_driver.calls.clear()
+    GraphAnalytics(fake_driver).gender_counts(label="a performance")
+    assert fake_driver.calls == [(ONE_LABEL + GENDER_COUNTS_QUERY, {"label": "a performance"})]
@@ -0,0 +1,23 @@
+import pytest
+
+from app.batch import JsonlOutput
+
+
+def test_jsonl_output_drops_rows_written_after_the_checkpoint(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_bytes(b'{"key":"a"}\n{"key":"b"}\n')
+
+    output = JsonlOutput(str(path), {"offset": 12})
+    output.write_error("c", "File size too large")
+    output.commit()
+    output.close()
+    assert path.read_bytes() == b'{"key":"a"}\n{"key":"c","error":"File size too large"}\n'
+
+
+def test_jsonl_output_refuses_a_file_shorter_than_its_checkpoint(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_bytes(b'{"key":"a"}\n')
+
+    with pytest.raises(SystemExit, match="shorter than its checkpoint"):
+        JsonlOutput(str(path), {"offset": 100})
+    assert path.read_bytes() == b'{"key":"a"}\n'
@@ -0,0 +1,70 @@
+"""
+Caption parity of the int8 and ONNX CLIP backends with fp32 torch
+
+The same check as benchmarks/bench_clip_backends.py, without the timing:
+every backend must pick the same label as fp32 for the bundled
+training/dataset images. Skipped when the CLIP weights (or, for ONNX,
+onnxruntime) are not available locally.
+"""
+import os
+
+import pytest
+
+transformers = pytest.importorskip("transformers")
+
+from app.pipeline.clip_backends import OnnxClipBackend, create_clip_backend
+from app.pipeline.models import CLIP_MODEL_NAME
+from app.pipeline.preprocess import prepare_image, stack_clip_inputs
+from app.pipeline.process_image import CLIP_LABELS
+from benchmarks.suite import dataset_images
+
+# Same default as bench_clip_backends.py --min-agreement
+MIN_AGREEMENT = float(os.getenv("CLIP_PARITY_MIN_AGREEMENT", "1.0"))
+
+
+def load_clip():
+    try:
+        model = transformers.CLIPModel.from_pretrained(CLIP_MODEL_NAME)
+        processor = transformers.CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+    except OSError as e:
+        pytest.skip(f"CLIP model {CLIP_MODEL_NAME} is not available: {e}")
+    return model.eval(), processor
+
+
+def captions(backend, pixel_values):
+    text_features = backend.text_features(CLIP_LABELS)
+    logits = backend.logit_scale * backend.image_features(pixel_values) @ text_features.T
+    return [CLIP_LABELS[i] for i in logits.argmax(dim=1).tolist()]
+
+
+@pytest.fixture(scope="module")
+def pixel_values():
+    images = []
+    for _, image_bytes in dataset_images():
+        try:
+            images.append(prepare_image(image_bytes).clip_pixels)
+        except Exception:
+            continue
+    if not images:
+        pytest.skip("no decodable images in training/dataset")
+    return stack_clip_inputs(images)
+
+
+@pytest.fixture(scope="module")
+def reference(pixel_values):
+    return captions(create_clip_backend("torch", *load_clip()), pixel_values)
+
+
+@pytest.mark.parametrize("backend_name", ["quantized", "onnx"])
+def test_captions_match_fp32(backend_name, pixel_values, reference, tmp_path):
+    # Quantization works in place, so every backend gets a fresh fp32 model
+    if backend_name == "onnx":
+        pytest.importorskip("onnx")
+        pytest.importorskip("onnxruntime")
+        backend = OnnxClipBackend(*load_clip(), onnx_path=str(tmp_path / "clip_image_encoder.onnx"))
+    else:
+        backend = create_clip_backend(backend_name, *load_clip())
+
+    predicted = captions(backend, pixel_values)
+    agreement = sum(a == b for a, b in zip(predicted, reference)) / len(reference)
+    assert agreement >= MIN_AGREEMENT, f"{backend_name} agrees with fp32 on {agreement:.0%}: {predicted} vs {reference}"
@@ -0,0 +1,39 @@
+import json
+from datetime import datetime
+
+from streamlit_app.ingest import LogIngester, parse_line
+
+TS = "2026-03-01T12:00:00"
+
+
+def line(**record):
+    return json.dumps({"ts": TS, **record})
+
+
+def test_analyses_and_failed_analyses_are_ingested():
+    assert parse_line(line(event="metadata", image_id="a", caption="a photo",
+                           face_info={"age": 30, "gender": "Woman"}, faces=[]))
+    assert parse_line(line(event="metadata", image_id="b", error="cannot identify image file"))
+    assert parse_line(f"{TS} - METADATA: {{'caption': 'a person', 'face_info': {{'age': 40}}}}")
+
+
+def test_other_records_are_skipped():
+    assert parse_line(line(event="upload", filename="a.jpg")) is None
+    assert parse_line(line(event="metadata", caption="Error storing embeddings",
+                           face_info={"error": "disk full"})) is None
+    assert parse_line(line(event="metadata", caption="something else")) is None
+
+
+def test_ingested_rows(tmp_path):
+    log_path = tmp_path / "analysis.log"
+    log_path.write_text("\n".join([
+        line(event="metadata", image_id="a", caption="a photo", face_info={"age": 30, "gender": "Woman"}),
+        line(event="metadata", image_id="b", error="cannot identify image file"),
+        line(event="metadata", caption="Error storing embeddings", face_info={"error": "disk full"}),
+    ]) + "\n", encoding="utf-8")
+
+    ingester = LogIngester(str(log_path), str(tmp_path / "dashboard.sqlite"))
+    ingester.ingest()
+    _, rows = ingester.query("SELECT ts, caption, age, gender, has_error FROM analyses ORDER BY id")
+    ts = datetime.fromisoformat(TS).timestamp()
+    assert rows == [(ts, "a photo", 30.0, "Woman", 0), (ts, None, None, None, 1)]
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from app.storage.neo4j_writer import Neo4jWriter
+
+QUERY = "UNWIND $rows AS row RETURN row"
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached in time")
+        time.sleep(0.01)
+
+
+def rows_written(driver):
+    return [row for parameters in driver.queries(QUERY) for row in parameters["rows"]]
+
+
+@pytest.fixture
+def make_writer(tmp_path):
+    writers = []
+
+    def make(driver, **options):
+        options = {"query": QUERY, "schema": (), "spill_path": str(tmp_path / "spill.jsonl"),
+                   "backoff_base": 0.01, "backoff_max": 0.05, **options}
+        writer = Neo4jWriter(driver=driver, **options)
+        writers.append(writer)
+        return writer
+
+    yield make
+    for writer in writers:
+        writer.stop()
+
+
+def test_full_batch_is_written_without_waiting_for_the_interval(fake_driver, make_writer):
+    writer = make_writer(fake_driver, batch_size=3, flush_interval=2.0)
+    for i in range(3):
+        writer.enqueue({"id": i})
+
+    wait_for(lambda: rows_written(fake_driver), timeout=1.0)
+    assert fake_driver.queries(QUERY) == [{"rows": [{"id": 0}, {"id": 1}, {"id": 2}]}]
+
+
+def test_partial_batch_is_written_after_the_flush_interval(fake_driver, make_writer):
+    writer = make_writer(fake_driver, batch_size=100, flush_interval=0.1)
+    writer.enqueue({"id": 1})
+    writer.enqueue({"id": 2})
+
+    wait_for(lambda: rows_written(fake_driver))
+    assert rows_written(fake_driver) == [{"id": 1}, {"id": 2}]
+    assert writer.stats()["queue_depth"] == 0
+
+
+def test_failed_write_is_retried_with_exponential_backoff(fake_driver, make_writer, monkeypatch):
+    writer = make_writer(fake_driver, max_retries=4, backoff_base=0.5, backoff_max=1.5)
+    waits = []
+    monkeypatch.setattr(writer._stop, "wait", lambda seconds: waits.append(seconds) or False)
+    fake_driver.failures = 3
+
+    assert writer._write([{"id": 1}])
+    assert waits == [0.5, 1.0, 1.5]
+    assert fake_driver.attempts == 4
+    assert rows_written(fake_driver) == [{"id": 1}]
+    assert writer.stats()["flush_errors"] == 3
+    assert writer.stats()["healthy"]
+
+
+def test_rows_are_spilled_while_neo4j_is_down(fake_driver, make_writer, tmp_path):
+    writer = make_writer(fake_driver, max_retries=2)
+    fake_driver.down = True
+    writer.enqueue({"id": 1})
+    writer.enqueue({"id": 2})
+    writer.flush()
+
+    with open(tmp_path / "spill.jsonl", encoding="utf-8") as f:
+        spilled = [json.loads(line) for line in f]
+    assert sorted(row["id"] for row in spilled) == [1, 2]
+    assert writer.stats()["rows_spilled"] == 2
+    assert writer.stats()["spill_pending"]
+    assert not writer.stats()["healthy"]
+
+
+def test_spilled_rows_are_replayed_once_neo4j_is_back(fake_driver, make_writer, tmp_path):
+    writer = make_writer(fake_driver, max_retries=1, batch_size=2)
+    fake_driver.down = True
+    writer._spill([{"id": 1}, {"id": 2}, {"id": 3}])
+
+    writer._replay_spill()
+    assert os.path.exists(f"{tmp_path / 'spill.jsonl'}.replay")
+    assert writer.stats()["rows_replayed"] == 0
+
+    fake_driver.down = False
+    writer._replay_spill()
+    assert rows_written(fake_driver) == [{"id": 1}, {"id": 2}, {"id": 3}]
+    assert writer.stats()["rows_replayed"] == 3
+    assert not writer.stats()["spill_pending"]
+
+
+def test_writer_thread_replays_spill_after_reconnecting(fake_driver, make_writer):
+    writer = make_writer(fake_driver, flush_interval=0.05)
+    writer._spill([{"id": 1}])
+    writer.start()
+
+    wait_for(lambda: writer.stats()["rows_replayed"] == 1)
+    assert rows_written(fake_driver) == [{"id": 1}]
+
+
+def test_flush_waits_for_the_batch_the_writer_thread_holds(fake_driver, make_writer):
+    writer = make_writer(fake_driver, batch_size=1, flush_interval=1.0)
+    fake_driver.gate = threading.Event()
+    writer.enqueue({"id": 1})
+    # The writer thread has taken the row off the queue and is blocked writing it
+    assert fake_driver.started.wait(2.0)
+    assert writer.queue_depth == 0
+
+    flusher = threading.Thread(target=writer.flush)
+    flusher.start()
+    flusher.join(0.2)
+    assert flusher.is_alive()
+
+    fake_driver.gate.set()
+    flusher.join(2.0)
+    assert not flusher.is_alive()
+    assert rows_written(fake_driver) == [{"id": 1}]
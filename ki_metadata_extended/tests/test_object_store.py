@@ -0,0 +1,191 @@
+import hashlib
+import threading
+
+import pytest
+
+moto = pytest.importorskip("moto")
+import boto3
+
+from app.storage.object_store import ImageStore
+
+BUCKET = "images"
+JPEG = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 8
+
+
+def image_id(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def s3_client():
+    with moto.mock_aws():
+        yield boto3.client("s3", region_name="us-east-1")
+
+
+@pytest.fixture
+def make_store(s3_client):
+    stores = []
+
+    def make(client=s3_client, **options):
+        store = ImageStore(client=client, bucket=BUCKET, upload_threads=2, **options)
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        store.stop()
+
+
+class FailingUploads:
+    """Passes everything through to the real client except the upload itself"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def upload_fileobj(self, *args, **kwargs):
+        raise ConnectionError("connection reset")
+
+
+class BlockingUploads(FailingUploads):
+    """Holds every upload until `gate` is set"""
+
+    def __init__(self, client):
+        super().__init__(client)
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def upload_fileobj(self, *args, **kwargs):
+        self.started.set()
+        self.gate.wait(5)
+        return self._client.upload_fileobj(*args, **kwargs)
+
+
+def test_same_content_is_stored_once(make_store, s3_client):
+    store = make_store()
+    stored = []
+    assert store.put(image_id(JPEG), JPEG, on_stored=lambda *args: stored.append(args))
+    store.flush()
+    assert store.put(image_id(JPEG), JPEG, on_stored=lambda *args: stored.append(args))
+    store.flush()
+
+    key = ImageStore.key_for(image_id(JPEG))
+    assert key == f"sha256/{image_id(JPEG)[:2]}/{image_id(JPEG)}"
+    assert [item["Key"] for item in s3_client.list_objects_v2(Bucket=BUCKET)["Contents"]] == [key]
+    assert store.stats()["uploads"] == 1
+    assert store.stats()["deduplicated"] == 1
+    assert stored == [(image_id(JPEG), key)]
+
+
+def test_existing_object_is_not_uploaded_again(make_store):
+    first = make_store()
+    first.put(image_id(JPEG), JPEG)
+    first.flush()
+
+    # A fresh store (e.g. after a restart) only knows the object from its HEAD request
+    second = make_store()
+    stored = []
+    second.put(image_id(JPEG), JPEG, on_stored=lambda *args: stored.append(args))
+    second.flush()
+    assert second.stats()["uploads"] == 0
+    assert second.stats()["deduplicated"] == 1
+    assert stored == [(image_id(JPEG), ImageStore.key_for(image_id(JPEG)))]
+
+
+def test_uploads_above_the_threshold_are_multipart(make_store, s3_client):
+    # S3 (and boto3) require parts of at least 5 MB
+    store = make_store(multipart_threshold=5 * 1024 * 1024, multipart_chunksize=5 * 1024 * 1024)
+    large = JPEG + b"\x00" * (11 * 1024 * 1024)
+    store.put(image_id(JPEG), JPEG)
+    store.put(image_id(large), large)
+    store.flush()
+
+    small_head = s3_client.head_object(Bucket=BUCKET, Key=ImageStore.key_for(image_id(JPEG)))
+    large_head = s3_client.head_object(Bucket=BUCKET, Key=ImageStore.key_for(image_id(large)))
+    # Multipart objects have an ETag of "<md5 of part md5s>-<part count>"
+    assert "-" not in small_head["ETag"]
+    assert large_head["ETag"].strip('"').endswith("-3")
+    assert large_head["ContentLength"] == len(large)
+    assert large_head["ContentType"] == "image/jpeg"
+
+
+def test_object_key_is_reported_only_after_the_upload(make_store, s3_client):
+    store = make_store()
+    seen = []
+
+    def on_stored(stored_id, key):
+        # The object must already be readable when its key is recorded
+        seen.append((stored_id, s3_client.head_object(Bucket=BUCKET, Key=key)["ContentLength"]))
+
+    store.put(image_id(JPEG), JPEG, on_stored=on_stored)
+    store.flush()
+    assert seen == [(image_id(JPEG), len(JPEG))]
+
+
+def test_failed_upload_does_not_report_an_object_key(make_store, s3_client):
+    store = make_store(client=FailingUploads(s3_client))
+    stored = []
+    store.put(image_id(JPEG), JPEG, on_stored=lambda *args: stored.append(args))
+    store.flush()
+
+    assert stored == []
+    assert store.stats()["errors"] == 1
+    assert store.stats()["pending_bytes"] == 0
+
+
+def test_pending_bytes_are_capped(make_store, s3_client):
+    client = BlockingUploads(s3_client)
+    store = make_store(client=client, max_pending_bytes=len(JPEG))
+    other = JPEG[:-1] + b"\x01"
+
+    assert store.put(image_id(JPEG), JPEG)
+    assert client.started.wait(5)
+    # The first image is still uploading, so the second one does not fit
+    assert not store.put(image_id(other), other)
+    assert store.stats()["dropped"] == 1
+    assert store.stats()["pending_bytes"] == len(JPEG)
+
+    client.gate.set()
+    store.flush()
+    assert store.stats()["pending_bytes"] == 0
+    assert store.put(image_id(other), other)
+
+
+def test_open_streams_the_object_in_chunks(make_store):
+    store = make_store()
+    store.put(image_id(JPEG), JPEG)
+    store.flush()
+
+    chunks, content_type, length = store.open(image_id(JPEG), chunk_size=1000)
+    chunks = list(chunks)
+    assert [len(chunk) for chunk in chunks] == [1000, 1000, len(JPEG) - 2000]
+    assert b"".join(chunks) == JPEG
+    assert (content_type, length) == ("image/jpeg", len(JPEG))
+
+    with pytest.raises(KeyError):
+        store.open("0" * 64)
+
+
+def test_get_image_endpoint_streams_the_upload(make_store, monkeypatch):
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+
+    import app.main
+
+    store = make_store()
+    store.put(image_id(JPEG), JPEG)
+    store.flush()
+    monkeypatch.setattr(app.main, "image_store", store)
+    client = TestClient(app.main.app)
+
+    response = client.get(f"/images/{image_id(JPEG)}")
+    assert response.status_code == 200
+    assert response.content == JPEG
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["content-length"] == str(len(JPEG))
+    assert response.headers["etag"] == f'"{image_id(JPEG)}"'
+
+    assert client.get(f"/images/{'0' * 64}").status_code == 404
+    assert client.get("/images/not-a-hash").status_code == 404
@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("httpx")
+from fastapi.testclient import TestClient
+
+import app.main
+
+BOUNDARY = "batch-boundary"
+LIMIT = 64 * 1024
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app.main, "BATCH_MAX_BYTES", LIMIT)
+    return TestClient(app.main.app)
+
+
+def multipart_chunks(size):
+    """A multipart body with one `size`-byte file part, sent without Content-Length"""
+    yield (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"files\"; filename=\"a.jpg\"\r\n"
+           f"Content-Type: image/jpeg\r\n\r\n").encode("ascii")
+    for _ in range(size // 4096):
+        yield b"\xff" * 4096
+    yield f"\r\n--{BOUNDARY}--\r\n".encode("ascii")
+
+
+def test_declared_length_over_the_limit_is_rejected_up_front(client):
+    response = client.post("/upload/batch", content=b"x" * (LIMIT + 1),
+                           headers={"Content-Type": "application/x-tar"})
+    assert response.status_code == 413
+
+
+def test_chunked_multipart_body_over_the_limit_is_rejected(client):
+    response = client.post("/upload/batch", content=multipart_chunks(2 * LIMIT),
+                           headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"})
+    assert "content-length" not in response.request.headers
+    assert response.status_code == 413
+
+
+def test_chunked_archive_body_over_the_limit_is_rejected(client):
+    response = client.post("/upload/batch", content=(b"\x00" * 4096 for _ in range(2 * LIMIT // 4096)),
+                           headers={"Content-Type": "application/x-tar"})
+    assert response.status_code == 413
+
+
+def test_empty_multipart_body_is_rejected(client):
+    response = client.post("/upload/batch", content=f"--{BOUNDARY}--\r\n".encode("ascii"),
+                           headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"})
+    assert response.status_code == 400
@@ -0,0 +1,62 @@
+"""
+Export the trained SimpleCNN for serving (AGE_GENDER_BACKEND=simplecnn)
+
+Writes a frozen TorchScript module (.pt) and an ONNX model (.onnx), both
+with a dynamic batch dimension, next to the checkpoint. They share its
+basename and therefore its JSON sidecar (gender classes). Point
+AGE_GENDER_MODEL_PATH at whichever file you want the API to load.
+
+Usage:
+  python export_age_gender.py [--model age_gender_model.pth] [--formats torchscript,onnx]
+
+Requirements:
+  - torch (onnx for the ONNX export)
+"""
+import argparse
+import os
+
+import torch
+
+from model import INPUT_SIZE, SimpleCNN
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="age_gender_model.pth")
+    parser.add_argument("--formats", default="torchscript,onnx")
+    args = parser.parse_args()
+
+    model = SimpleCNN()
+    model.load_state_dict(torch.load(args.model, map_location="cpu", weights_only=True))
+    model.eval()
+    dummy = torch.zeros(1, 3, INPUT_SIZE, INPUT_SIZE)
+    base = os.path.splitext(args.model)[0]
+    sidecar = f"{base}.json"
+    formats = [name.strip() for name in args.formats.split(",") if name.strip()]
+
+    for name in formats:
+        if name == "torchscript":
+            path = f"{base}.pt"
+            with torch.inference_mode():
+                module = torch.jit.freeze(torch.jit.trace(model, dummy))
+            module.save(f"{path}.tmp")
+        elif name == "onnx":
+            path = f"{base}.onnx"
+            with torch.no_grad():
+                torch.onnx.export(
+                    model, (dummy,), f"{path}.tmp",
+                    input_names=["pixel_values"],
+                    output_names=["age", "gender_logits"],
+                    dynamic_axes={"pixel_values": {0: "batch"}, "age": {0: "batch"}, "gender_logits": {0: "batch"}},
+                    opset_version=17
+                )
+        else:
+            raise SystemExit(f"Unknown format '{name}', expected torchscript or onnx")
+        os.replace(f"{path}.tmp", path)
+        print(f"Exported {path}")
+    if not os.path.exists(sidecar):
+        print(f"Note: {sidecar} not found; the API will assume gender classes ['female', 'male']")
+
+
+if __name__ == "__main__":
+    main()
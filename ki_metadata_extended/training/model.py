@@ -0,0 +1,29 @@
+"""
+Age/gender CNN shared by the training scripts and the serving backend
+
+Kept free of imports from the other training modules so it can be loaded
+on its own (e.g. by the API) without pandas, scikit-learn or the dataset.
+"""
+import torch.nn as nn
+
+INPUT_SIZE = 256
+
+
+class SimpleCNN(nn.Module):
+    def __init__(self):
+        super(SimpleCNN, self).__init__()
+        self.features = nn.Sequential(
+            nn.Conv2d(3, 16, 3, padding=1), nn.ReLU(), nn.MaxPool2d(2),
+            nn.Conv2d(16, 32, 3, padding=1), nn.ReLU(), nn.MaxPool2d(2),
+            nn.Conv2d(32, 64, 3, padding=1), nn.ReLU(), nn.MaxPool2d(2)
+        )
+        self.flatten = nn.Flatten()
+        self.fc_age = nn.Linear(64 * 32 * 32, 1)      # For age regression
+        self.fc_gender = nn.Linear(64 * 32 * 32, 2)   # For gender classification
+
+    def forward(self, x):
+        x = self.features(x)
+        x = self.flatten(x)
+        age = self.fc_age(x).squeeze(1)
+        gender = self.fc_gender(x)
+        return age, gender
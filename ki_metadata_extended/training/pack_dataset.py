@@ -0,0 +1,148 @@
+"""
+Pack the training dataset into memory-mapped uint8 shards
+
+Every image listed in a split's labels.csv is decoded once, resized to
+SIZE x SIZE RGB and appended to raw uint8 shard files; ages and genders
+are stored as compact NumPy arrays next to them. Training then reads
+pixels straight from the page cache instead of decoding JPEGs every epoch.
+
+Output layout (one directory per split):
+  packed/train/meta.json         size, count, shards, gender classes, file names
+  packed/train/images-00000.u8   (count, SIZE, SIZE, 3) uint8, row-major
+  packed/train/ages.npy          float32
+  packed/train/genders.npy       uint8 (index into meta["gender_classes"])
+
+Gender classes are taken from the train split (sorted, as LabelEncoder
+does) and reused for every other split, so the indices always agree.
+
+Usage:
+  python pack_dataset.py [--dataset dataset] [--out packed] [--size 256]
+      [--shard-size 4096] [--workers 8]
+
+Requirements:
+  - numpy, pillow
+"""
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+
+def find_labels(split_dir):
+    """labels.csv sits in the split directory or, in older layouts, inside images/"""
+    for path in (os.path.join(split_dir, "labels.csv"), os.path.join(split_dir, "images", "labels.csv")):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def read_labels(csv_path):
+    """Rows of (filename, age, gender) by column position, like the original iloc lookups"""
+    rows = []
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if len(row) < 3 or not row[0].strip():
+                continue
+            try:
+                rows.append((row[0].strip(), float(row[1]), row[2].strip()))
+            except ValueError:
+                print(f"Skipping malformed row in {csv_path}: {row}")
+    return rows
+
+
+def load_pixels(path, size):
+    with Image.open(path) as image:
+        # Decode JPEGs at a reduced scale when the target is much smaller
+        image.draft("RGB", (size, size))
+        return np.asarray(image.convert("RGB").resize((size, size), Image.BILINEAR), dtype=np.uint8)
+
+
+def pack_split(split_dir, out_dir, size, shard_size, workers, gender_classes=None):
+    csv_path = find_labels(split_dir)
+    if csv_path is None:
+        print(f"{split_dir}: no labels.csv, skipped")
+        return None
+    image_dir = os.path.join(split_dir, "images")
+    rows = [row for row in read_labels(csv_path) if os.path.exists(os.path.join(image_dir, row[0]))]
+    if gender_classes is None:
+        gender_classes = sorted({gender for _, _, gender in rows})
+    class_index = {name: index for index, name in enumerate(gender_classes)}
+    rows = [row for row in rows if row[2] in class_index]
+
+    os.makedirs(out_dir, exist_ok=True)
+    files, ages, genders, shards = [], [], [], []
+    shard, shard_file, shard_count = None, None, 0
+
+    def decode(row):
+        try:
+            return row, load_pixels(os.path.join(image_dir, row[0]), size)
+        except Exception as e:
+            print(f"Skipping {row[0]}: {e}")
+            return row, None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for (filename, age, gender), pixels in executor.map(decode, rows):
+            if pixels is None:
+                continue
+            if shard_file is None or shard_count == shard_size:
+                if shard_file is not None:
+                    shard_file.close()
+                    shards.append({"path": shard, "count": shard_count})
+                shard = f"images-{len(shards):05d}.u8"
+                shard_file = open(os.path.join(out_dir, shard), "wb")
+                shard_count = 0
+            shard_file.write(pixels.tobytes())
+            shard_count += 1
+            files.append(filename)
+            ages.append(age)
+            genders.append(class_index[gender])
+    if shard_file is not None:
+        shard_file.close()
+        shards.append({"path": shard, "count": shard_count})
+
+    np.save(os.path.join(out_dir, "ages.npy"), np.asarray(ages, dtype=np.float32))
+    np.save(os.path.join(out_dir, "genders.npy"), np.asarray(genders, dtype=np.uint8))
+    meta = {
+        "size": size,
+        "count": len(files),
+        "shards": shards,
+        "gender_classes": gender_classes,
+        "files": files
+    }
+    temp_path = os.path.join(out_dir, "meta.json.tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    # meta.json last: a split without it is an incomplete pack
+    os.replace(temp_path, os.path.join(out_dir, "meta.json"))
+    print(f"{split_dir}: packed {len(files)} of {len(rows)} samples into {len(shards)} shard(s)")
+    return gender_classes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", default="dataset")
+    parser.add_argument("--out", default="packed")
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--shard-size", type=int, default=4096, help="samples per shard file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="decode threads")
+    args = parser.parse_args()
+
+    splits = sorted(name for name in os.listdir(args.dataset) if os.path.isdir(os.path.join(args.dataset, name)))
+    # train first, so its gender classes are used for every split
+    splits.sort(key=lambda name: name != "train")
+    gender_classes = None
+    for split in splits:
+        classes = pack_split(os.path.join(args.dataset, split), os.path.join(args.out, split),
+                             args.size, args.shard_size, args.workers, gender_classes)
+        if gender_classes is None:
+            gender_classes = classes
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+DataLoader over the shards written by pack_dataset.py
+
+Samples are read from memory-mapped uint8 shards, so a worker only copies
+SIZE x SIZE x 3 bytes per sample and never decodes an image. Batches stay
+uint8 (4x less to pin and transfer) and are converted to float on the
+training device by `to_input`.
+
+Measure the loader on its own, to compare with the training rate:
+  python packed_dataset.py packed/train [--batch-size 32] [--workers 4] [--epochs 3]
+"""
+import argparse
+import bisect
+import json
+import os
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+
+class PackedDataset(Dataset):
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.size = self.meta["size"]
+        self.gender_classes = self.meta["gender_classes"]
+        self.ages = np.load(os.path.join(directory, "ages.npy"))
+        self.genders = np.load(os.path.join(directory, "genders.npy")).astype(np.int64)
+        self._starts = []
+        total = 0
+        for shard in self.meta["shards"]:
+            self._starts.append(total)
+            total += shard["count"]
+        self._shards = None
+
+    def __len__(self):
+        return len(self.ages)
+
+    def __getstate__(self):
+        # Each DataLoader worker maps the shards itself instead of receiving copies
+        state = dict(self.__dict__)
+        state["_shards"] = None
+        return state
+
+    def _open(self):
+        self._shards = [
+            np.memmap(os.path.join(self.directory, shard["path"]), dtype=np.uint8, mode="r",
+                      shape=(shard["count"], self.size, self.size, 3))
+            for shard in self.meta["shards"]
+        ]
+
+    def __getitem__(self, idx):
+        if self._shards is None:
+            self._open()
+        shard = bisect.bisect_right(self._starts, idx) - 1
+        pixels = torch.from_numpy(np.array(self._shards[shard][idx - self._starts[shard]]))
+        return pixels, torch.tensor(self.ages[idx]), torch.tensor(self.genders[idx])
+
+
+def make_loader(directory, batch_size=32, shuffle=False, workers=4, prefetch_factor=4, pin_memory=None,
+                sampler_factory=None):
+    """DataLoader with worker processes, prefetching and (on CUDA) pinned batches
+
+    `sampler_factory(dataset)` may supply a sampler in place of `shuffle`.
+    """
+    dataset = PackedDataset(directory)
+    sampler = sampler_factory(dataset) if sampler_factory is not None else None
+    if sampler is not None:
+        shuffle = False
+    if pin_memory is None:
+        pin_memory = torch.cuda.is_available()
+    options = {}
+    if workers > 0:
+        options = {"prefetch_factor": prefetch_factor, "persistent_workers": True}
+    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, sampler=sampler, num_workers=workers,
+                      pin_memory=pin_memory, drop_last=False, **options)
+
+
+def to_input(images, device):
+    """uint8 NHWC batch -> float32 NCHW in [0, 1] on `device` (what transforms.ToTensor produced)"""
+    images = images.to(device, non_blocking=True)
+    return images.permute(0, 3, 1, 2).float().div_(255)
+
+
+class Throughput:
+    """Samples/sec for one epoch, split into time spent waiting for data and everything else"""
+
+    def __init__(self):
+        self.samples = 0
+        self.data_seconds = 0.0
+        self.start = time.perf_counter()
+        self._mark = self.start
+
+    def batch_ready(self, batch_size):
+        """Call right after a batch was received from the loader"""
+        now = time.perf_counter()
+        self.data_seconds += now - self._mark
+        self.samples += batch_size
+
+    def step_done(self):
+        """Call after the batch was processed; the next wait starts here"""
+        self._mark = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.start
+
+    def summary(self):
+        seconds = self.seconds
+        rate = self.samples / seconds if seconds else 0.0
+        data_share = self.data_seconds / seconds if seconds else 0.0
+        return f"{self.samples} samples in {seconds:.1f}s, {rate:.1f} samples/s, {data_share:.0%} waiting for data"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--prefetch", type=int, default=4)
+    parser.add_argument("--epochs", type=int, default=3)
+    args = parser.parse_args()
+
+    loader = make_loader(args.directory, args.batch_size, shuffle=True, workers=args.workers,
+                         prefetch_factor=args.prefetch)
+    for epoch in range(args.epochs):
+        meter = Throughput()
+        for images, _, _ in loader:
+            meter.batch_ready(len(images))
+            meter.step_done()
+        print(f"Loader epoch {epoch + 1}: {meter.summary()}")
+
+
+if __name__ == "__main__":
+    main()
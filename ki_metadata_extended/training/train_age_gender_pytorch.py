@@ -3,94 +3,80 @@ PyTorch Training Script for Age and Gender Prediction
 
 Usage:
   - Prepare your dataset as described in the README (see dataset structure)
-  - Adjust paths, batch size, epochs, and model as needed
-  - Run: python train_age_gender_pytorch.py
-  - Output: age_gender_model.pth
+  - Pack it once: python pack_dataset.py --dataset dataset --out packed
+  - Run: python train_age_gender_pytorch.py [--packed packed] [--epochs 10]
+      [--batch-size 32] [--accumulation-steps 1] [--precision bf16|fp32]
+      [--no-compile] [--checkpoint-dir checkpoints] [--checkpoint-every 200]
+      [--workers 4] [--prefetch 4] [--no-resume]
+  - Output: age_gender_model.pth (+ age_gender_model.json with the gender classes)
+
+Training resumes from checkpoints/latest.pt when it exists. Each epoch
+reports loss, samples/sec, epoch time, the share of time spent waiting for
+the loader, validation age MAE and gender accuracy.
 
 Requirements:
-  - torch, torchvision, pandas, scikit-learn, pillow
+  - torch, numpy, pillow
 """
+import argparse
 import os
-import pandas as pd
-from PIL import Image
-from torch.utils.data import Dataset, DataLoader
+
 import torch
-import torch.nn as nn
 import torch.optim as optim
-import torchvision.transforms as transforms
-from sklearn.preprocessing import LabelEncoder
-
-# --- Dataset Class ---
-class AgeGenderDataset(Dataset):
-    def __init__(self, csv_file, img_dir, transform=None):
-        self.labels = pd.read_csv(csv_file)
-        self.img_dir = img_dir
-        self.transform = transform
-        self.gender_encoder = LabelEncoder()
-        self.labels['gender'] = self.gender_encoder.fit_transform(self.labels['gender'])
 
-    def __len__(self):
-        return len(self.labels)
+from model import INPUT_SIZE, SimpleCNN
+from packed_dataset import make_loader
+from trainer import EpochSampler, Trainer
 
-    def __getitem__(self, idx):
-        img_path = os.path.join(self.img_dir, self.labels.iloc[idx, 0])
-        image = Image.open(img_path).convert('RGB')
-        age = torch.tensor(self.labels.iloc[idx, 1], dtype=torch.float32)
-        gender = torch.tensor(self.labels.iloc[idx, 2], dtype=torch.long)
-        if self.transform:
-            image = self.transform(image)
-        return image, age, gender
 
-# --- Simple CNN Model ---
-class SimpleCNN(nn.Module):
-    def __init__(self):
-        super(SimpleCNN, self).__init__()
-        self.features = nn.Sequential(
-            nn.Conv2d(3, 16, 3, padding=1), nn.ReLU(), nn.MaxPool2d(2),
-            nn.Conv2d(16, 32, 3, padding=1), nn.ReLU(), nn.MaxPool2d(2),
-            nn.Conv2d(32, 64, 3, padding=1), nn.ReLU(), nn.MaxPool2d(2)
-        )
-        self.flatten = nn.Flatten()
-        self.fc_age = nn.Linear(64 * 32 * 32, 1)      # For age regression
-        self.fc_gender = nn.Linear(64 * 32 * 32, 2)   # For gender classification
+def main():
+    # Guarded so DataLoader workers started with 'spawn' don't re-run training
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--packed", default="packed")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--accumulation-steps", type=int, default=1)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--precision", choices=("bf16", "fp32"), default="bf16")
+    parser.add_argument("--no-compile", action="store_true")
+    parser.add_argument("--checkpoint-dir", default="checkpoints")
+    parser.add_argument("--checkpoint-every", type=int, default=200, help="optimizer steps between checkpoints")
+    parser.add_argument("--no-resume", action="store_true")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--prefetch", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="age_gender_model.pth")
+    args = parser.parse_args()
 
-    def forward(self, x):
-        x = self.features(x)
-        x = self.flatten(x)
-        age = self.fc_age(x).squeeze(1)
-        gender = self.fc_gender(x)
-        return age, gender
+    if not os.path.exists(os.path.join(args.packed, "train", "meta.json")):
+        raise SystemExit(f"No packed dataset in {args.packed}; run: python pack_dataset.py --out {args.packed}")
 
-# --- Training Setup ---
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-transform = transforms.Compose([
-    transforms.Resize((256, 256)),
-    transforms.ToTensor(),
-])
+    # --- Training Setup ---
+    torch.manual_seed(args.seed)
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    train_loader = make_loader(os.path.join(args.packed, "train"), args.batch_size, workers=args.workers,
+                               prefetch_factor=args.prefetch,
+                               sampler_factory=lambda dataset: EpochSampler(len(dataset), seed=args.seed))
+    if train_loader.dataset.size != INPUT_SIZE:
+        raise SystemExit(f"SimpleCNN expects {INPUT_SIZE}px inputs; repack with --size {INPUT_SIZE}")
+    val_loader = None
+    if os.path.exists(os.path.join(args.packed, "val", "meta.json")):
+        val_loader = make_loader(os.path.join(args.packed, "val"), args.batch_size, workers=args.workers,
+                                 prefetch_factor=args.prefetch)
 
-train_dataset = AgeGenderDataset('dataset/train/labels.csv', 'dataset/train/images', transform)
-val_dataset = AgeGenderDataset('dataset/val/labels.csv', 'dataset/val/images', transform)
-train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True)
-val_loader = DataLoader(val_dataset, batch_size=32)
+    model = SimpleCNN()
+    optimizer = optim.Adam(model.parameters(), lr=args.lr)
+    trainer = Trainer(
+        model, optimizer, train_loader, val_loader, device=device, precision=args.precision,
+        compile_model=not args.no_compile, accumulation_steps=args.accumulation_steps,
+        checkpoint_dir=args.checkpoint_dir, checkpoint_every=args.checkpoint_every, seed=args.seed,
+        metadata={"gender_classes": train_loader.dataset.gender_classes, "input_size": INPUT_SIZE}
+    )
+    if not args.no_resume:
+        trainer.resume()
 
-model = SimpleCNN().to(device)
-criterion_age = nn.MSELoss()
-criterion_gender = nn.CrossEntropyLoss()
-optimizer = optim.Adam(model.parameters(), lr=1e-3)
+    # --- Training Loop ---
+    trainer.fit(args.epochs, args.output)
 
-# --- Training Loop ---
-for epoch in range(10):
-    model.train()
-    for images, ages, genders in train_loader:
-        images, ages, genders = images.to(device), ages.to(device), genders.to(device)
-        optimizer.zero_grad()
-        pred_ages, pred_genders = model(images)
-        loss_age = criterion_age(pred_ages, ages)
-        loss_gender = criterion_gender(pred_genders, genders)
-        loss = loss_age + loss_gender
-        loss.backward()
-        optimizer.step()
-    print(f'Epoch {epoch+1}, Loss: {loss.item():.4f}')
 
-# --- Save Model ---
-torch.save(model.state_dict(), 'age_gender_model.pth')
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Resumable age/gender trainer: mixed precision, torch.compile, gradient
+accumulation, atomic checkpoints and validation
+
+Checkpoints hold the model, optimizer, epoch, position within the epoch,
+RNG state and best validation score. They are written to a temp file and
+renamed, so a crash never leaves a truncated checkpoint behind. The
+shuffle order of every epoch is derived from (seed, epoch), so resuming in
+the middle of an epoch continues with exactly the samples that were left.
+"""
+import json
+import os
+
+import torch
+import torch.nn as nn
+from torch.utils.data import Sampler
+
+from packed_dataset import Throughput, to_input
+
+
+class EpochSampler(Sampler):
+    """Shuffled order that depends only on (seed, epoch) and can start part-way through"""
+
+    def __init__(self, length, seed=0, shuffle=True):
+        self.length = length
+        self.seed = seed
+        self.shuffle = shuffle
+        self.epoch = 0
+        self.start = 0
+
+    def set_epoch(self, epoch, start=0):
+        self.epoch = epoch
+        self.start = start
+
+    def __iter__(self):
+        if self.shuffle:
+            generator = torch.Generator()
+            generator.manual_seed(self.seed + self.epoch)
+            order = torch.randperm(self.length, generator=generator).tolist()
+        else:
+            order = list(range(self.length))
+        return iter(order[self.start:])
+
+    def __len__(self):
+        return self.length - self.start
+
+
+def autocast_dtype(device, precision):
+    """bf16 autocast where the device supports it, otherwise full fp32"""
+    if precision != "bf16":
+        return None
+    if device.type == "cuda" and not torch.cuda.is_bf16_supported():
+        return None
+    return torch.bfloat16
+
+
+def save_atomic(state, path):
+    temp_path = f"{path}.tmp"
+    torch.save(state, temp_path)
+    os.replace(temp_path, path)
+
+
+class Trainer:
+    def __init__(self, model, optimizer, train_loader, val_loader=None, device=None, precision="bf16",
+                 compile_model=True, accumulation_steps=1, checkpoint_dir="checkpoints", checkpoint_every=200,
+                 log_every=50, seed=0, metadata=None):
+        self.device = device or torch.device("cpu")
+        self.model = model.to(self.device)
+        self.optimizer = optimizer
+        self.train_loader = train_loader
+        self.val_loader = val_loader
+        self.sampler = train_loader.sampler if isinstance(train_loader.sampler, EpochSampler) else None
+        self.dtype = autocast_dtype(self.device, precision)
+        self.accumulation_steps = max(1, accumulation_steps)
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_every = checkpoint_every
+        self.log_every = log_every
+        self.seed = seed
+        self.metadata = metadata or {}
+        self.criterion_age = nn.MSELoss()
+        self.criterion_gender = nn.CrossEntropyLoss()
+        self.epoch = 0
+        self.batches_done = 0  # batches of the current epoch already trained on
+        self.global_step = 0   # optimizer steps
+        self.best_mae = None
+
+        # Checkpoints always hold the plain module's weights, never the compiled wrapper's
+        self.forward = self.model
+        if compile_model and hasattr(torch, "compile"):
+            try:
+                self.forward = torch.compile(self.model)
+            except Exception as e:
+                print(f"torch.compile unavailable, running eagerly: {e}")
+
+    @property
+    def latest_path(self):
+        return os.path.join(self.checkpoint_dir, "latest.pt")
+
+    def _autocast(self):
+        if self.dtype is None:
+            return torch.autocast(self.device.type, enabled=False)
+        return torch.autocast(self.device.type, dtype=self.dtype)
+
+    def save_checkpoint(self, path=None):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        save_atomic({
+            "model": self.model.state_dict(),
+            "optimizer": self.optimizer.state_dict(),
+            "epoch": self.epoch,
+            "batches_done": self.batches_done,
+            "global_step": self.global_step,
+            "best_mae": self.best_mae,
+            "seed": self.seed,
+            "torch_rng": torch.get_rng_state(),
+            "metadata": self.metadata
+        }, path or self.latest_path)
+
+    def resume(self, path=None):
+        """Load the latest (or the given) checkpoint; returns False when there is none"""
+        path = path or self.latest_path
+        if not os.path.exists(path):
+            return False
+        state = torch.load(path, map_location=self.device, weights_only=False)
+        self.model.load_state_dict(state["model"])
+        self.optimizer.load_state_dict(state["optimizer"])
+        self.epoch = state["epoch"]
+        self.batches_done = state["batches_done"]
+        self.global_step = state["global_step"]
+        self.best_mae = state["best_mae"]
+        self.seed = state.get("seed", self.seed)
+        torch.set_rng_state(state["torch_rng"])
+        print(f"Resumed from {path}: epoch {self.epoch + 1}, batch {self.batches_done}, step {self.global_step}")
+        return True
+
+    def _loss(self, images, ages, genders):
+        with self._autocast():
+            pred_ages, pred_genders = self.forward(images)
+        # Losses in fp32; bf16 rounding on squared ages would dominate the MSE
+        return self.criterion_age(pred_ages.float(), ages) + self.criterion_gender(pred_genders.float(), genders)
+
+    def train_epoch(self):
+        self.model.train()
+        if self.sampler is not None:
+            self.sampler.seed = self.seed
+            self.sampler.set_epoch(self.epoch, start=self.batches_done * self.train_loader.batch_size)
+        meter = Throughput()
+        total_loss, batches = 0.0, 0
+        self.optimizer.zero_grad(set_to_none=True)
+        for images, ages, genders in self.train_loader:
+            meter.batch_ready(len(images))
+            images = to_input(images, self.device)
+            ages = ages.to(self.device, non_blocking=True)
+            genders = genders.to(self.device, non_blocking=True)
+            loss = self._loss(images, ages, genders)
+            (loss / self.accumulation_steps).backward()
+            self.batches_done += 1
+            batches += 1
+            total_loss += loss.item()
+            if self.batches_done % self.accumulation_steps == 0:
+                self.optimizer.step()
+                self.optimizer.zero_grad(set_to_none=True)
+                self.global_step += 1
+                if self.checkpoint_every and self.global_step % self.checkpoint_every == 0:
+                    self.save_checkpoint()
+                if self.log_every and self.global_step % self.log_every == 0:
+                    print(f"  step {self.global_step}: loss {total_loss / batches:.4f}, "
+                          f"{meter.samples / meter.seconds:.1f} samples/s")
+            meter.step_done()
+        # Gradients of a last, incomplete accumulation window
+        if self.batches_done % self.accumulation_steps:
+            self.optimizer.step()
+            self.optimizer.zero_grad(set_to_none=True)
+            self.global_step += 1
+        return (total_loss / batches if batches else 0.0), meter
+
+    @torch.no_grad()
+    def validate(self):
+        """Age MAE (years) and gender accuracy over the validation set"""
+        if self.val_loader is None:
+            return None
+        self.model.eval()
+        absolute_error, correct, count = 0.0, 0, 0
+        for images, ages, genders in self.val_loader:
+            images = to_input(images, self.device)
+            ages = ages.to(self.device, non_blocking=True)
+            genders = genders.to(self.device, non_blocking=True)
+            with self._autocast():
+                pred_ages, pred_genders = self.forward(images)
+            absolute_error += (pred_ages.float() - ages).abs().sum().item()
+            correct += (pred_genders.argmax(dim=1) == genders).sum().item()
+            count += len(ages)
+        if not count:
+            return None
+        return {"mae": absolute_error / count, "accuracy": correct / count}
+
+    def fit(self, epochs, output_path="age_gender_model.pth"):
+        while self.epoch < epochs:
+            loss, meter = self.train_epoch()
+            metrics = self.validate()
+            message = f"Epoch {self.epoch + 1}/{epochs}: loss {loss:.4f}, {meter.summary()}"
+            if metrics is not None:
+                message += f", val MAE {metrics['mae']:.2f}, val accuracy {metrics['accuracy']:.1%}"
+                if self.best_mae is None or metrics["mae"] < self.best_mae:
+                    self.best_mae = metrics["mae"]
+                    self.export(os.path.join(self.checkpoint_dir, "best.pth"))
+            print(message)
+            self.epoch += 1
+            self.batches_done = 0
+            self.save_checkpoint()
+        self.export(output_path)
+
+    def export(self, path):
+        """Plain state_dict (as the original script saved) plus a JSON sidecar with the label metadata"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        save_atomic(self.model.state_dict(), path)
+        temp_path = f"{os.path.splitext(path)[0]}.json.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.metadata, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, f"{os.path.splitext(path)[0]}.json")